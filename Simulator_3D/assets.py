@@ -0,0 +1,133 @@
+"""
+Shared image assets of the viewer, loaded, scaled and converted once.
+
+Images are found relative to this package instead of the working directory, so the simulator starts from any
+directory. Every image is loaded from disk once and every scaled variant of it is made once and shared by everyone
+who asks for it. Once the display is set, the variants are converted with convert_alpha to the pixel format of the
+screen, so blitting them does not convert every pixel on every frame. preload reads and scales the images in a
+background thread while the simulation is set up, and the conversion is done on the main thread when an image is
+first asked for. The rotated sprites of an image are shared in the same way.
+
+Load the drone picture scaled up, after preloading it at startup:
+    preload([(DRONE_PICTURE, (300, 300))])
+    image = get_image(DRONE_PICTURE, (300, 300))
+"""
+import os
+import threading
+
+import pygame
+
+from sprite_cache import SpriteCache
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))  # Relative asset paths are relative to this directory
+
+images = {}  # The converted images handed out, keyed by (path, size)
+loaded = {}  # The images read from disk and scaled, not converted yet, keyed by (path, size)
+sprite_caches = {}  # The sprite caches of the converted images, keyed by (path, size, step, max_entries)
+lock = threading.Lock()
+preload_thread = None
+
+
+def asset_path(name):
+    """
+    Returns the absolute path of an asset, relative paths are resolved against the package directory.
+    """
+    return name if os.path.isabs(name) else os.path.join(ASSET_DIR, name)
+
+
+def load_image(path, size=None):
+    """
+    Returns an image read from disk and optionally scaled, read once per path and scaled once per size.
+
+    Parameters:
+    - path (str): The absolute path of the image.
+    - size (tuple): The (width, height) to scale the image to, None for its own size.
+
+    Returns:
+    - pygame.Surface: The image, in the pixel format of the file.
+    """
+    with lock:
+        image = loaded.get((path, size))
+    if image is not None:
+        return image
+    image = load_image(path) if size is not None else pygame.image.load(path)
+    if size is not None:
+        image = pygame.transform.scale(image, size)
+    with lock:
+        return loaded.setdefault((path, size), image)
+
+
+def get_image(name, size=None):
+    """
+    Returns the shared image of an asset at a size, converted to the pixel format of the screen once the display
+    is set.
+
+    Parameters:
+    - name (str): The path of the image, relative to the package or absolute.
+    - size (tuple): The (width, height) to scale the image to, None for its own size.
+
+    Returns:
+    - pygame.Surface: The image, shared, so it must not be drawn on.
+    """
+    key = (asset_path(name), size)
+    image = images.get(key)
+    if image is not None:
+        return image
+    image = load_image(*key)
+    if pygame.display.get_surface() is None:
+        return image  # Converted on the first call after the display is set
+    image = images[key] = image.convert_alpha()
+    return image
+
+
+def get_sprites(name, size=None, step=0.5, max_entries=256):
+    """
+    Returns the shared cache of the rotated sprites of an image, see SpriteCache.
+
+    Parameters:
+    - name (str): The path of the image, relative to the package or absolute.
+    - size (tuple): The (width, height) to scale the image to, None for its own size.
+    - step (float): Angle step in degrees the angles are rounded to.
+    - max_entries (int): Number of sprites kept, None for every angle.
+
+    Returns:
+    - SpriteCache: The cache, shared once the display is set, so the sprites are rotated from the converted image.
+    """
+    key = (asset_path(name), size, step, max_entries)
+    cache = sprite_caches.get(key)
+    if cache is None:
+        cache = SpriteCache(get_image(name, size), step=step, max_entries=max_entries)
+        if pygame.display.get_surface() is not None:
+            sprite_caches[key] = cache
+    return cache
+
+
+def preload(assets):
+    """
+    Reads and scales images in a background thread, so get_image only has to convert them.
+
+    Parameters:
+    - assets (list): The images as (name, size) tuples, see get_image.
+
+    Returns:
+    - threading.Thread: The thread reading the images.
+    """
+    global preload_thread
+
+    def run():
+        for name, size in assets:
+            load_image(asset_path(name), size)
+
+    preload_thread = threading.Thread(target=run, daemon=True)
+    preload_thread.start()
+    return preload_thread
+
+
+def clear():
+    """
+    Drops every image and sprite cache, so the next calls read the files again.
+    """
+    with lock:
+        loaded.clear()
+    images.clear()
+    sprite_caches.clear()
@@ -0,0 +1,139 @@
+"""
+Runs many independent headless drone episodes across a process pool.
+
+Every episode is an autonomous flight with its own seed and battery settings. The metrics of each episode are
+streamed to a JSONL or CSV file as soon as it finishes, so a sweep keeps every core busy and a long sweep can be
+followed while it runs.
+
+Example, 200 seeds with two discharge rates on every core:
+    python batch_runner.py --episodes 200 --discharge-rate 0.0125 0.025 --output sweep.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from multiprocessing import Pool
+
+from battery import Battery
+from controller import CONTROLLERS
+from map import load_map
+from noise_model import MOTION_MODELS, SENSOR_MODELS
+from simulation import Simulation
+
+# Maps loaded by this worker process, keyed by path, so every episode on the same map shares one
+maps = {}
+
+
+def run_episode(episode):
+    """
+    Runs one autonomous flight and returns its metrics.
+
+    Parameters:
+    - episode (dict): The episode settings: id, seed, ticks, max_charge, discharge_rate, map, the path of a map
+      file or None for the apartments, controller, the name of the autonomous controller, and sensor_model and
+      motion_model, the names of the models of noise_model.py.
+
+    Returns:
+    - dict: The episode settings followed by the metrics of Simulation.metrics and the wall time of the episode.
+    """
+    start = time.perf_counter()
+    battery = Battery(max_charge=episode['max_charge'], discharge_rate=episode['discharge_rate'])
+    game_map = None
+    if episode['map']:
+        if episode['map'] not in maps:
+            maps[episode['map']] = load_map(episode['map'])
+        game_map = maps[episode['map']]
+    simulation = Simulation(seed=episode['seed'], battery=battery, game_map=game_map,
+                            controller=episode['controller'], sensor_model=SENSOR_MODELS[episode['sensor_model']],
+                            motion_model=MOTION_MODELS[episode['motion_model']])
+    simulation.start_ai()
+    simulation.step(episode['ticks'])
+    result = dict(episode)
+    result.update(simulation.metrics())
+    result['wall_time'] = time.perf_counter() - start
+    return result
+
+
+def make_episodes(args):
+    """
+    Builds the episode settings of the sweep, every seed is run with every discharge rate.
+    """
+    episodes = []
+    for seed in range(args.seed, args.seed + args.episodes):
+        for discharge_rate in args.discharge_rate:
+            episodes.append({
+                'id': len(episodes),
+                'seed': seed,
+                'ticks': args.ticks,
+                'max_charge': args.max_charge,
+                'discharge_rate': discharge_rate,
+                'map': args.map,
+                'controller': args.controller,
+                'sensor_model': args.sensor_model,
+                'motion_model': args.motion_model,
+            })
+    return episodes
+
+
+class ResultWriter:
+    """
+    Appends episode results to a JSONL file, or to a CSV file when the path ends with .csv, flushing every row.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.is_csv = path.endswith('.csv')
+        self.csv_writer = None
+
+    def write(self, result):
+        if not self.is_csv:
+            self.file.write(json.dumps(result) + '\n')
+        else:
+            if self.csv_writer is None:
+                self.csv_writer = csv.DictWriter(self.file, fieldnames=list(result))
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(result)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run many headless drone episodes in parallel")
+    parser.add_argument('--episodes', type=int, default=100, help="number of seeds to run")
+    parser.add_argument('--seed', type=int, default=0, help="first seed, the episodes use consecutive seeds")
+    parser.add_argument('--ticks', type=int, default=10000, help="ticks simulated per episode")
+    parser.add_argument('--max-charge', type=float, default=100, help="battery capacity")
+    parser.add_argument('--discharge-rate', type=float, nargs='+', default=[10 / 800],
+                        help="battery drain per tick, every seed is run with each rate")
+    parser.add_argument('--map', help="map file to fly in, the apartments by default")
+    parser.add_argument('--controller', choices=CONTROLLERS, default='reactive',
+                        help="controller of the autonomous movement")
+    parser.add_argument('--sensor-model', choices=SENSOR_MODELS, default='exact',
+                        help="noise, dropout, range and update rate of the sensors")
+    parser.add_argument('--motion-model', choices=MOTION_MODELS, default='ideal',
+                        help="inertia, drag and jitter of the drone's movement")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--output', default='episodes.jsonl', help="result file, .jsonl or .csv")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    episodes = make_episodes(args)
+    writer = ResultWriter(args.output)
+    start = time.perf_counter()
+    try:
+        with Pool(args.workers) as pool:
+            for done, result in enumerate(pool.imap_unordered(run_episode, episodes), 1):
+                writer.write(result)
+                print(f'\r{done}/{len(episodes)} episodes', end='', flush=True)
+    finally:
+        writer.close()
+    print(f'\n{len(episodes)} episodes in {time.perf_counter() - start:.1f} s, results in {args.output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,20 @@ class Battery:
             return True
 
 
+    def level(self):
+        """
+        Returns what the drawn battery depends on: the width of the filled part and whether it is red.
+        """
+        charge_ratio = self.charge / self.max_charge
+        return int(200 * charge_ratio), charge_ratio > 0.2
+
+    def bounds(self):
+        """
+        Returns the rectangle of the screen the battery covers, the filled part of a full battery reaches 2 pixels past
+        the outline.
+        """
+        return pygame.Rect(10, 10, 202, 30)
+
     def draw(self, screen):
         battery_width = 200
         battery_height = 30
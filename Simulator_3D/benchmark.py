@@ -0,0 +1,871 @@
+"""
+Benchmarks for the hot paths of the simulator.
+
+Run every benchmark:
+    python benchmark.py
+
+Run only some of them:
+    python benchmark.py raycast
+"""
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from world_params import *
+import numpy as np
+import pygame
+
+from assets import asset_path, clear, get_image, get_sprites
+from distance_field import DistanceField
+from drone import DRONE_IMAGE_SIZE, Drone, WARNING_IMAGE_SIZE
+from drone_env import DroneEnv, DroneVecEnv
+from column_renderer import ColumnRenderer
+from collision import DRONE_RADIUS, crossed_cells, sweep_blocked, sweeps_blocked
+from controller import CONTROLLERS
+from coverage import CoverageMap, WaypointBuffer
+from map import Map, generate_building, load_map, save_map
+from mapper import MAPPER_RESOLUTION, OccupancyMapper
+from minimap import VisitedMinimap, HoleMinimap, MapperMinimap
+from noise_model import MOTION_MODELS, SENSOR_MODELS, NoiseStream
+from planner import home_field
+from raycaster import cast_ray, cast_rays
+from simulation import Simulation, TICK_RATE
+from sprite_cache import SpriteCache
+from swarm import SWARM_SPACING, Swarm, close_pairs
+from telemetry import DEBUG, INFO, SENSOR_HIT, Telemetry
+from text_renderer import get_font, get_renderer
+
+SCALE = 64
+
+
+def free_positions(grid, step=3):
+    """
+    Returns the pixel centers of every step-th free cell of a grid, used as drone positions for the benchmarks.
+    """
+    positions = []
+    for map_y, row in enumerate(grid):
+        for map_x, cell in enumerate(row):
+            if cell == 0:
+                positions.append((map_x * SCALE + SCALE / 2, map_y * SCALE + SCALE / 2))
+    return positions[::step]
+
+
+def open_hall(size, seed=0):
+    """
+    Returns a large walled hall with scattered pillars as a list grid, where the open space is much wider than in
+    the apartments.
+    """
+    rng = np.random.default_rng(seed)
+    grid = (rng.random((size, size)) < 0.002).astype(int)
+    grid[0, :] = grid[-1, :] = grid[:, 0] = grid[:, -1] = 1
+    return grid.tolist()
+
+
+def time_frames(frame, frames):
+    """
+    Calls frame(i) for every frame index and returns the mean time per frame in milliseconds.
+    """
+    start = time.perf_counter()
+    for i in range(frames):
+        frame(i)
+    return (time.perf_counter() - start) * 1000 / frames
+
+
+def stepping_cast(grid, x, y, angle, max_depth):
+    """
+    The fixed 1-pixel stepping loop Game.cast_rays used before the DDA ray caster, kept as the baseline.
+    """
+    for depth in range(1, max_depth + 1):
+        target_x = x + math.cos(angle) * depth
+        target_y = y + math.sin(angle) * depth
+        map_x = int(target_x / SCALE)
+        map_y = int(target_y / SCALE)
+        if grid[map_y][map_x] == 1:
+            return depth
+    return None
+
+
+def bench_raycast(frames=300):
+    """
+    Compares the time the field of view rays take per frame with the stepping loop, the DDA ray caster and the
+    batched NumPy ray query.
+    """
+    positions = free_positions(APARTMENT1_WALLS)
+
+    def view_angles(i):
+        angle = math.radians(i * 7 % 360)
+        return [angle + FOV_START + FOV_STEP * (ray + 1) for ray in range(FOV_RAYS)]
+
+    def stepping_frame(i):
+        x, y = positions[i % len(positions)]
+        for ray_angle in view_angles(i):
+            stepping_cast(APARTMENT1_WALLS, x, y, ray_angle, VIEW_DEPTH)
+
+    def dda_frame(i):
+        x, y = positions[i % len(positions)]
+        for ray_angle in view_angles(i):
+            cast_ray(APARTMENT1_WALLS, x, y, ray_angle, SCALE, VIEW_DEPTH)
+
+    walls = np.array(APARTMENT1_WALLS) == 1
+
+    def batch_frame(i):
+        x, y = positions[i % len(positions)]
+        cast_rays(walls, x, y, view_angles(i), SCALE, VIEW_DEPTH)
+
+    # The stepping loop reports the first whole pixel inside the wall and can slip through the corner where two
+    # walls touch diagonally, the DDA caster reports the exact crossing and never misses a cell.
+    agree = total = 0
+    for i in range(len(positions)):
+        x, y = positions[i]
+        for ray_angle in view_angles(i):
+            old = stepping_cast(APARTMENT1_WALLS, x, y, ray_angle, VIEW_DEPTH)
+            hit = cast_ray(APARTMENT1_WALLS, x, y, ray_angle, SCALE, VIEW_DEPTH)
+            total += 1
+            if old is None and hit is None or old is not None and hit is not None and abs(old - hit[0]) <= 1:
+                agree += 1
+
+    stepping_ms = time_frames(stepping_frame, frames)
+    dda_ms = time_frames(dda_frame, frames)
+    batch_ms = time_frames(batch_frame, frames)
+    print(f'raycast: {FOV_RAYS} rays per frame, {frames} frames')
+    print(f'  stepping loop: {stepping_ms:8.3f} ms/frame')
+    print(f'  DDA caster:    {dda_ms:8.3f} ms/frame  ({stepping_ms / dda_ms:.1f}x faster)')
+    print(f'  NumPy batch:   {batch_ms:8.3f} ms/frame  ({stepping_ms / batch_ms:.1f}x faster)')
+    print(f'  rays within 1 px of the stepping loop: {agree}/{total} (the rest are corners the stepping loop missed)')
+
+
+def bench_sensors(frames=300):
+    """
+    Compares the per-frame cost of reading all sensors of the largest configuration, each with its sensor ray and
+    its screen line ray, using the stepping loops, the batched query and the batched query with the distance field.
+    """
+    sensor_configs = [-135, -90, -45, 0, 45, 90, 135]
+    ranges = [999, 799]
+    print(f'sensors: {len(sensor_configs)} sensors x {len(ranges)} rays per frame, {frames} frames')
+    for name, grid in (('apartment 20x20', APARTMENT1_WALLS), ('open hall 200x200', open_hall(200))):
+        walls = np.array(grid) == 1
+        field = DistanceField(walls)
+        positions = free_positions(grid, step=max(1, len(grid) // 4))
+
+        def angles(i):
+            gyro = i * 7 % 360
+            return [[math.radians(gyro + config), math.radians(gyro + config + 90)] for config in sensor_configs]
+
+        def stepping_frame(i):
+            x, y = positions[i % len(positions)]
+            for sensor_angles in angles(i):
+                for angle, max_depth in zip(sensor_angles, ranges):
+                    stepping_cast(grid, x, y, angle, max_depth)
+
+        def batch_frame(i):
+            x, y = positions[i % len(positions)]
+            cast_rays(walls, x, y, angles(i), SCALE, ranges)
+
+        def field_frame(i):
+            x, y = positions[i % len(positions)]
+            cast_rays(walls, x, y, angles(i), SCALE, ranges, field=field)
+
+        start = time.perf_counter()
+        DistanceField(walls)
+        build_ms = (time.perf_counter() - start) * 1000
+        stepping_ms = time_frames(stepping_frame, frames)
+        batch_ms = time_frames(batch_frame, frames)
+        field_ms = time_frames(field_frame, frames)
+        print(f'  {name}: distance field built in {build_ms:.1f} ms')
+        print(f'    stepping loops:       {stepping_ms:8.3f} ms/frame')
+        print(f'    batched query:        {batch_ms:8.3f} ms/frame')
+        print(f'    with distance field:  {field_ms:8.3f} ms/frame  ({batch_ms / field_ms:.1f}x the batched query)')
+
+
+def nested_minimaps(screen, drone, do_return):
+    """
+    The per-cell loops Game.run drew both minimaps with before the cached minimap surfaces, kept as the baseline.
+    """
+    pygame.draw.rect(screen, WHITE, (SCREEN_WIDTH - 225, 15, 210, 210), 2)
+    visited = {tuple(cell) for cell in drone.coverage.cells(1).tolist()}
+    waypoints = [tuple(cell) for cell in drone.waypoints[1].cells(drone.map.scale).tolist()]
+    for y in range(20):
+        for x in range(20):
+            color = BLACK
+            if APARTMENT1_WALLS[y][x] == 1:
+                color = BROWN
+            if (y, x) in visited:
+                color = RED
+            if (y, x) in waypoints:
+                color = GREEN
+            if do_return and (y, x) == drone.current_point:
+                color = BLUE
+            pygame.draw.rect(screen, color, (SCREEN_WIDTH - 220 + x * 10, 20 + y * 10, 10, 10))
+            if (y, x) == drone.current_point:
+                pygame.draw.circle(screen, BLACK, (SCREEN_WIDTH - 215 + x * 10, 25 + y * 10), 2)
+    pygame.draw.rect(screen, WHITE, (SCREEN_WIDTH - 405, 15, 170, 170), 2)
+    for y in range(20):
+        for x in range(20):
+            color = BROWN
+            if APARTMENT2_FLOOR[y][x] == 2:
+                color = BLACK
+            pygame.draw.rect(screen, color, (SCREEN_WIDTH - 400 + x * 8, 20 + y * 8, 8, 8))
+            if (y, x) == drone.current_point:
+                pygame.draw.circle(screen, D_YELLOW, (SCREEN_WIDTH - 396 + x * 8, 24 + y * 8), 1)
+
+
+def bench_minimap(frames=500):
+    """
+    Compares the time both minimaps take per frame with the per-cell loops and with the cached layer surfaces, for a
+    drone that has already visited most of the first apartment.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    simulation = Simulation(seed=0)
+    drone = simulation.drone
+    # A long flight: 150 visited cells of the first apartment, every tenth of them a waypoint
+    free_cells = [tuple(cell) for cell in np.argwhere(~simulation.map.walls[1])[:150].tolist()]
+    for y, x in free_cells:
+        drone.coverage.visit(1, y, x)
+    for y, x in free_cells[::10]:
+        drone.waypoints[1].append((y + 0.5) * simulation.map.scale, (x + 0.5) * simulation.map.scale)
+    minimap = VisitedMinimap(SCREEN_WIDTH - 220, 20, 200, simulation.map)
+    hole_minimap = HoleMinimap(SCREEN_WIDTH - 400, 20, 160, simulation.map)
+
+    def nested_frame(i):
+        nested_minimaps(screen, drone, False)
+
+    def cached_frame(i):
+        minimap.draw(screen, drone, False)
+        hole_minimap.draw(screen, drone)
+
+    nested_ms = time_frames(nested_frame, frames)
+    cached_ms = time_frames(cached_frame, frames)
+    print(f'minimap: {drone.coverage.counts[1]} visited cells, {len(drone.waypoints[1])} waypoints, '
+          f'{frames} frames')
+    print(f'  per-cell loops:  {nested_ms:8.3f} ms/frame')
+    print(f'  cached surfaces: {cached_ms:8.3f} ms/frame  ({nested_ms / cached_ms:.1f}x faster)')
+    pygame.quit()
+
+
+def bench_sprites(ticks=3000):
+    """
+    Compares rotating the drone image every frame with the rotated sprite cache over the gyro angles of an
+    autonomous flight, and reports the hit rate and memory of the cache.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    simulation = Simulation(seed=0)
+    simulation.start_ai()
+    angles = []
+    for _ in range(ticks):
+        simulation.step()
+        angles.append(simulation.drone.gyro_angle)
+    image = get_image(DRONE_PICTURE, DRONE_IMAGE_SIZE)
+
+    def rotozoom_frame(i):
+        pygame.transform.rotozoom(image, -angles[i], 1.2)
+
+    print(f'sprites: gyro angles of a {ticks} tick flight, {len(set(angles))} distinct')
+    print(f'  rotozoom every frame: {time_frames(rotozoom_frame, ticks):8.3f} ms/frame')
+    for step, max_entries in ((0.5, 256), (0.5, None), (1, None)):
+        cache = SpriteCache(image, step=step, max_entries=max_entries)
+        cached_ms = time_frames(lambda i: cache.get(angles[i], 1.2), ticks)
+        stats = cache.stats()
+        print(f'  {step} degree steps, {max_entries or "all"} sprites: {cached_ms:8.3f} ms/frame, '
+              f'hit rate {stats["hit_rate"]:.1%}, {stats["sprites"]} sprites in {stats["memory"] / 1e6:.1f} MB')
+    cache = SpriteCache(image, step=1, max_entries=None)
+    start = time.perf_counter()
+    cache.warm(1.2, background=False)
+    warm_ms = (time.perf_counter() - start) * 1000
+    warm_lookup_ms = time_frames(lambda i: cache.get(angles[i], 1.2), ticks)
+    print(f'  1 degree table warmed in {warm_ms:.0f} ms ({cache.stats()["memory"] / 1e6:.1f} MB), '
+          f'then {warm_lookup_ms:.4f} ms/frame')
+    pygame.quit()
+
+
+def bench_return(seeds=5):
+    """
+    Compares how long the return home takes after flights of growing length. Replaying the flight history in
+    reverse took one tick per tick flown plus 180 ticks of turning; the planner follows the shortest path.
+    """
+    print(f'return: mean over {seeds} seeds')
+    game_map = Map()
+    build_ms = time_frames(lambda i: home_field(~game_map.occupancy, game_map.holes, game_map.home), 20)
+    print(f'  distance to home field built in {build_ms:.2f} ms')
+    for flight_ticks in (1000, 5000, 20000):
+        return_ticks = 0
+        for seed in range(seeds):
+            simulation = Simulation(seed=seed)
+            simulation.battery.discharge_rate = 0
+            simulation.start_ai()
+            simulation.step(flight_ticks)
+            simulation.start_return()
+            while simulation.do_return:
+                simulation.step()
+            return_ticks += simulation.return_ticks
+        print(f'  flight of {flight_ticks:5} ticks: history replay {flight_ticks + 180:5} ticks, '
+              f'planned path {return_ticks / seeds:6.0f} ticks')
+
+
+def bench_maps(sizes=(100, 500, 1000)):
+    """
+    Measures how long loading a map file takes and how much memory the loaded map holds, for the apartments and
+    generated buildings of growing size.
+    """
+    print('maps: load time and memory')
+    with tempfile.TemporaryDirectory() as directory:
+        for name, make_map in [('apartments 20x20', Map)] + [(f'building {size}x{size}', lambda size=size:
+                                                               generate_building(size)) for size in sizes]:
+            path = os.path.join(directory, 'map.npz')
+            save_map(make_map(), path)
+            tracemalloc.start()
+            start = time.perf_counter()
+            game_map = load_map(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'  {name:18}: file {os.path.getsize(path) / 1e3:8.1f} kB, loaded in {load_ms:8.1f} ms, '
+                  f'{game_map.nbytes() / 1e6:6.1f} MB held, {peak / 1e6:6.1f} MB peak')
+
+
+def bench_floors(layer_counts=(2, 8, 32), ticks=5000):
+    """
+    Compares the cost of an autonomous tick in buildings with more and more floors. The grids of the drone's floor
+    are looked up by layer, so a tick should cost the same whatever the height of the building.
+    """
+    print(f'floors: 100x100 buildings, {ticks} autonomous ticks')
+    for layers in layer_counts:
+        game_map = generate_building(100, layers=layers)
+        simulation = Simulation(seed=0, game_map=game_map)
+        simulation.battery.discharge_rate = 0
+        simulation.start_ai()
+        tick_ms = time_frames(lambda i: simulation.step(), ticks)
+        print(f'  {layers:2} floors: {tick_ms * 1000:7.1f} us/tick, map {game_map.nbytes() / 1e6:6.1f} MB')
+
+
+class DictPoint:
+    """
+    The waypoint class before __slots__, with a __dict__ per instance, kept as the baseline.
+    """
+
+    def __init__(self, y, x):
+        self.x = x
+        self.y = y
+
+
+def traced(build):
+    """
+    Calls build() twice and returns its result, the time it took in seconds and the memory its result holds in
+    bytes. The time is measured on the first call, without the overhead of tracing the allocations.
+    """
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, memory
+
+
+def bench_coverage(updates=1_000_000, size=1000, waypoints=100_000):
+    """
+    Compares the visited cells as sets of tuples with the uint8 coverage grids, and the waypoints as lists of
+    objects with the array-backed buffer: time and memory of a million cell updates on a large map, and of the
+    coverage query.
+    """
+    game_map = generate_building(size)
+    rng = np.random.default_rng(0)
+    free = np.argwhere(~game_map.walls[1])
+    ys, xs = free[rng.integers(0, len(free), updates)].T.tolist()
+    print(f'coverage: {updates} visits on a {size}x{size} map, {waypoints} waypoints')
+
+    def fill_set():
+        visited = {1: set(), 2: set()}
+        for y, x in zip(ys, xs):
+            visited[1].add((y, x))
+        return visited
+
+    def fill_grid():
+        coverage = CoverageMap(game_map)
+        for y, x in zip(ys, xs):
+            coverage.visit(1, y, x)
+        return coverage
+
+    visited, set_time, set_memory = traced(fill_set)
+    coverage, grid_time, grid_memory = traced(fill_grid)
+    free_counts = {layer: int((~walls).sum()) for layer, walls in game_map.walls.items()}
+    set_query_ms = time_frames(lambda i: {layer: len(visited[layer]) / free_counts[layer] for layer in visited}, 100)
+    grid_query_ms = time_frames(lambda i: coverage.coverage(), 100)
+    print(f'  set of tuples: {set_time / updates * 1e9:6.0f} ns/visit, {set_memory / 1e6:7.1f} MB, '
+          f'{len(visited[1])} cells, query {set_query_ms:.3f} ms')
+    print(f'  uint8 grids:   {grid_time / updates * 1e9:6.0f} ns/visit, {grid_memory / 1e6:7.1f} MB, '
+          f'{coverage.counts[1]} cells, query {grid_query_ms:.3f} ms')
+
+    def fill_buffer():
+        buffer = WaypointBuffer()
+        for i in range(waypoints):
+            buffer.append(float(i), float(i))
+        return buffer
+
+    _, _, list_memory = traced(lambda: [DictPoint(float(i), float(i)) for i in range(waypoints)])
+    _, _, buffer_memory = traced(fill_buffer)
+    print(f'  waypoints as objects: {list_memory / 1e6:6.1f} MB, buffer: {buffer_memory / 1e6:6.1f} MB')
+
+
+def bench_explore(seeds=3):
+    """
+    Compares the coverage per battery charge of the controllers: every flight runs on a full battery until the
+    drone turns home at half charge, or the frontier controller has nothing left to explore.
+    """
+    print(f'explore: coverage when turning home, mean over {seeds} seeds')
+    for name, game_map in (('apartments', Map()), ('building 60x60, 3 floors', generate_building(60, layers=3))):
+        print(f'  {name}')
+        for controller in CONTROLLERS:
+            coverage, ticks, tick_times = 0.0, 0, []
+            for seed in range(seeds):
+                simulation = Simulation(seed=seed, game_map=game_map, controller=controller)
+                simulation.start_ai()
+                while simulation.do_ai:
+                    start = time.perf_counter()
+                    simulation.step()
+                    tick_times.append(time.perf_counter() - start)
+                visited = sum(simulation.drone.coverage.counts.values())
+                coverage += visited / int(simulation.drone.coverage.free_cells.sum())
+                ticks += simulation.ticks
+            charge_used = simulation.battery.discharge_rate * ticks / seeds
+            print(f'    {controller:9}: {coverage / seeds:6.1%} of the free cells after {ticks / seeds:5.0f} ticks, '
+                  f'{coverage / seeds / charge_used:.2%} per 1% of charge, tick mean '
+                  f'{np.mean(tick_times) * 1e6:5.0f} us, p99 {np.percentile(tick_times, 99) * 1e6:5.0f} us')
+
+
+def bench_mapping(frames=300, ray_counts=(1, 8, 64)):
+    """
+    Measures the cost of fusing a batch of sensor rays into the occupancy mapper at 1, 8 and 64 rays per tick on
+    the apartments, and how many of the grid cells seen after all frames are estimated right.
+    """
+    game_map = Map()
+    walls = game_map.walls[1]
+    positions = free_positions(walls.astype(int).tolist(), step=1)
+    repeat = game_map.scale // MAPPER_RESOLUTION
+    truth = walls.repeat(repeat, axis=0).repeat(repeat, axis=1)
+    print(f'mapping: {MAPPER_RESOLUTION} px grid, {frames} ticks')
+    for rays in ray_counts:
+        mapper = OccupancyMapper(game_map)
+        scans = []
+        for i in range(frames):
+            x, y = positions[i * 7 % len(positions)]
+            angles = math.radians(i * 13) + np.linspace(0, 2 * math.pi, rays, endpoint=False)
+            distances, _ = cast_rays(walls, x, y, angles, game_map.scale, 999)
+            scans.append((x, y, angles, distances))
+
+        update_ms = time_frames(lambda i: mapper.update(1, *scans[i]), frames)
+        seen = mapper.log_odds[0] != 0
+        right = np.count_nonzero(((mapper.log_odds[0] > 0) == truth)[seen])
+        print(f'  {rays:2d} rays: {update_ms * 1000:7.1f} us/tick, {update_ms * 1000 / rays:6.1f} us/ray, '
+              f'{right}/{np.count_nonzero(seen)} seen cells right')
+
+    screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+    minimap = MapperMinimap(0, 0, 200, game_map, mapper, redraw_interval=1)
+    drone = Simulation(game_map=game_map).drone
+
+    def draw_frame(i):
+        mapper.version += 1  # Every frame repaints the overlay
+        minimap.draw(screen, drone)
+
+    print(f'  minimap repaint: {time_frames(draw_frame, 100):.3f} ms')
+
+
+def bench_swarm(counts=(10, 100, 1000), ticks=300):
+    """
+    Compares the cost of a tick of a swarm with the cost of stepping one Simulation per drone, and the spatial hash
+    with comparing every pair of drones, on the apartments.
+    """
+    print(f'swarm: {ticks} ticks on the apartments, real time is {1000 / TICK_RATE:.1f} ms/tick')
+    simulations = [Simulation(seed=seed) for seed in range(10)]
+    for simulation in simulations:
+        simulation.start_ai()
+    simulation_ms = time_frames(lambda i: [simulation.step() for simulation in simulations], ticks) / 10
+    print(f'  one Simulation per drone: {simulation_ms:6.3f} ms/tick per drone')
+    for count in counts:
+        swarm = Swarm(count, seed=0)
+        swarm.step(10)
+        swarm_ms = time_frames(lambda i: swarm.step(), ticks)
+        print(f'  {count:5d} drones: {swarm_ms:7.3f} ms/tick, {1000 / TICK_RATE / swarm_ms:5.1f}x real time, '
+              f'{count * simulation_ms / swarm_ms:6.1f}x faster than {count} Simulations')
+
+    def all_pairs(i):
+        dx = swarm.x[:, np.newaxis] - swarm.x
+        dy = swarm.y[:, np.newaxis] - swarm.y
+        close = (dx ** 2 + dy ** 2 < SWARM_SPACING ** 2) & (swarm.layer[:, np.newaxis] == swarm.layer)
+        np.fill_diagonal(close, False)
+        return np.nonzero(close)
+
+    hash_ms = time_frames(lambda i: close_pairs(swarm.x, swarm.y, swarm.layer, SWARM_SPACING), 20)
+    pairs_ms = time_frames(all_pairs, 20)
+    same = len(all_pairs(0)[0]) == len(close_pairs(swarm.x, swarm.y, swarm.layer, SWARM_SPACING)[0])
+    print(f'  close drones of {counts[-1]}: spatial hash {hash_ms:.3f} ms, all pairs {pairs_ms:.3f} ms, '
+          f'same pairs: {same}')
+
+
+def bench_noise(ticks=3000, samples=100_000):
+    """
+    Measures the cost of the sensor and motion models: drawing samples from a NoiseStream in blocks against one
+    generator call per sample, a tick of a single drone and of a swarm of 1000 with every model, and whether two
+    noisy flights with the same seed are the same.
+    """
+    generator = np.random.default_rng(0)
+    stream = NoiseStream(0)
+    call_ns = time_frames(lambda i: generator.standard_normal(), samples) * 1e6
+    block_ns = time_frames(lambda i: stream.normal(1), samples) * 1e6
+    print(f'noise: {call_ns:.0f} ns per sample with a generator call each, {block_ns:.0f} ns from a NoiseStream')
+
+    def flight(sensor_model, motion_model):
+        simulation = Simulation(seed=7, controller='frontier', sensor_model=SENSOR_MODELS[sensor_model],
+                                motion_model=MOTION_MODELS[motion_model])
+        simulation.start_ai()
+        tick_ms = time_frames(lambda i: simulation.step(), ticks)
+        return tick_ms, (simulation.drone.x, simulation.drone.y, simulation.metrics())
+
+    for sensor_model in SENSOR_MODELS:
+        for motion_model in MOTION_MODELS:
+            tick_ms, outcome = flight(sensor_model, motion_model)
+            same = flight(sensor_model, motion_model)[1] == outcome
+            swarm = Swarm(1000, seed=7, sensor_model=SENSOR_MODELS[sensor_model],
+                          motion_model=MOTION_MODELS[motion_model])
+            swarm_ms = time_frames(lambda i: swarm.step(), 100)
+            print(f'  {sensor_model:5s} sensors, {motion_model:8s} motion: {tick_ms * 1000:6.0f} us/tick, '
+                  f'coverage {outcome[2]["coverage_1"]:.2f}, same with the same seed: {same}, '
+                  f'1000 drones {swarm_ms:.2f} ms/tick')
+
+
+def bench_env(counts=(1, 16, 256), steps=300):
+    """
+    Measures the environment steps per second of a single DroneEnv and of a DroneVecEnv of 1, 16 and 256
+    environments under random actions, with every sensor and motion model for the largest one.
+    """
+    rng = np.random.default_rng(0)
+    env = DroneEnv()
+    env.reset(seed=0)
+    actions = rng.uniform(-1, 1, (steps, 3))
+    env_ms = time_frames(lambda i: env.step(actions[i]), steps)
+    print(f'env: {1000 / env_ms:8.0f} env steps/s with one DroneEnv')
+    for count in counts:
+        vec_env = DroneVecEnv(count, seed=0)
+        vec_env.reset()
+        actions = rng.uniform(-1, 1, (steps, count, 3))
+        vec_ms = time_frames(lambda i: vec_env.step(actions[i]), steps)
+        print(f'  {count:4d} envs: {count * 1000 / vec_ms:8.0f} env steps/s, {vec_ms:.3f} ms/step, '
+              f'{count * env_ms / vec_ms:6.1f}x one DroneEnv')
+    for sensor_model in SENSOR_MODELS:
+        for motion_model in MOTION_MODELS:
+            vec_env = DroneVecEnv(counts[-1], seed=0, sensor_model=SENSOR_MODELS[sensor_model],
+                                  motion_model=MOTION_MODELS[motion_model])
+            vec_ms = time_frames(lambda i: vec_env.step(actions[i]), steps)
+            print(f'  {counts[-1]} envs, {sensor_model:5s} sensors, {motion_model:8s} motion: '
+                  f'{counts[-1] * 1000 / vec_ms:8.0f} env steps/s')
+
+
+def bench_text(frames=1000, labels=6):
+    """
+    Compares the text of the viewer before and after the shared fonts and label caches: the startup cost of the
+    fonts of the buttons and of the 27 sensors, and the per-frame cost of the 4 button labels and of the sensor
+    depth labels, with a font lookup per button and a rendered surface per label as before.
+    """
+    pygame.font.init()
+    screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+    button_texts = ['Self-Driver', 'Return Home', 'Switch Sensors', 'Charge']
+
+    def old_startup():
+        pygame.quit()  # Both start from a fresh font module, as a new viewer does
+        pygame.font.init()
+        return [pygame.font.SysFont(None, 24) for _ in range(27)], pygame.font.SysFont(None, 36)
+
+    def new_startup():
+        pygame.quit()  # Drops the shared fonts and renderers
+        pygame.font.init()
+        return get_renderer(size=24), get_renderer(size=36, color=BLACK)
+
+    old_ms = time_frames(lambda i: old_startup(), 10)
+    new_ms = time_frames(lambda i: new_startup(), 10)
+    print(f'text: startup fonts {old_ms:.2f} ms with a font per sensor, {new_ms:.2f} ms shared')
+
+    sensor_font = get_font(None, 24)
+    depths = [(i * 7) % 100 + 1 for i in range(frames * labels)]
+
+    def old_frame(i):
+        for text in button_texts:
+            screen.blit(pygame.font.SysFont(None, 36).render(text, True, BLACK), (10, 10))
+        for depth in depths[i * labels:(i + 1) * labels]:
+            screen.blit(sensor_font.render(str(depth), True, WHITE), (100, 100))
+
+    def new_frame(i):
+        for text in button_texts:
+            screen.blit(get_renderer(size=36, color=BLACK).render(text), (10, 10))
+        text = get_renderer(size=24)
+        for depth in depths[i * labels:(i + 1) * labels]:
+            text.draw_number(screen, depth, (100, 100))
+
+    old_ms = time_frames(old_frame, frames)
+    new_ms = time_frames(new_frame, frames)
+    print(f'  per frame, 4 buttons and {labels} depth labels: {old_ms * 1000:.0f} us before, '
+          f'{new_ms * 1000:.0f} us with the caches ({old_ms / new_ms:.1f}x), '
+          f'button hit rate {get_renderer(size=36, color=BLACK).stats()["hit_rate"]:.3f}')
+
+
+def bench_telemetry(ticks=5000, events=100_000):
+    """
+    Compares the cost of emitting an event into the telemetry ring buffer with printing it to a line buffered file
+    the way the risk checks used to print every sensor hit, and the cost of a tick of an autonomous flight without
+    telemetry, with every event streamed to a file and with only the events of level info and up.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'events.jsonl')
+        telemetry = Telemetry(path, capacity=events)
+        emit_ns = time_frames(lambda i: telemetry.emit(SENSOR_HIT, DEBUG, i, 1, 45, 30), events) * 1e6
+        telemetry.close()
+        with open(path, 'w', buffering=1) as stream:
+            print_ns = time_frames(lambda i: print(f'sensor 45:  {30}', file=stream), events) * 1e6
+        print(f'telemetry: {emit_ns:.0f} ns per emitted event, {print_ns:.0f} ns per printed line')
+
+        def flight(level=None):
+            simulation = Simulation(seed=1)
+            simulation.start_ai()
+            if level is not None:
+                simulation.start_telemetry(path, level)
+            tick_ms = time_frames(lambda i: simulation.step(), ticks)
+            stats = simulation.telemetry.stats() if level is not None else None
+            simulation.stop_telemetry()
+            return tick_ms, stats
+
+        none_ms, _ = flight()
+        all_ms, stats = flight(DEBUG)
+        info_ms, _ = flight(INFO)
+        print(f'  {ticks} ticks: no telemetry {none_ms * 1000:.0f} us/tick, every event {all_ms * 1000:.0f} us/tick '
+              f'({stats["emitted"]} events, {stats["dropped"]} dropped), info and up {info_ms * 1000:.0f} us/tick')
+
+
+def bench_collision(moves=20000, lengths=(2, 32, 200)):
+    """
+    Compares the swept circle test of the drone with the check of the destination cell it replaced, on moves of 2,
+    32 and 200 pixels from random free points of the apartments: the time per move, one at a time and batched as in
+    the swarm, and how many moves the old check let through a wall and how many moves the swept test blocks because
+    the drone would only graze a wall.
+    """
+    game_map = Map()
+    walls = game_map.walls[1]
+    clearance = game_map.distance_fields[1].clearance[0]
+    scale = game_map.scale
+    rng = np.random.default_rng(0)
+    free = np.argwhere(~walls)
+    print(f'collision: {moves} moves from random free points of the apartments, drone radius {DRONE_RADIUS} px')
+    for length in lengths:
+        cells = free[rng.integers(0, len(free), moves)]
+        starts = (cells + rng.uniform(0.2, 0.8, (moves, 2))) * scale
+        angles = rng.uniform(0, 2 * np.pi, moves)
+        ends = starts + length * np.column_stack([np.sin(angles), np.cos(angles)])
+        ends = np.clip(ends, 0, np.array(walls.shape) * scale - 1)
+        segments = [(x0, y0, x1, y1) for (y0, x0), (y1, x1) in zip(starts.tolist(), ends.tolist())]
+
+        def point(i):
+            x0, y0, x1, y1 = segments[i]
+            return walls[int(y1 / scale), int(x1 / scale)]
+
+        def swept(i):
+            x0, y0, x1, y1 = segments[i]
+            return sweep_blocked(walls, x0, y0, x1, y1, DRONE_RADIUS, scale, clearance)
+
+        point_us = time_frames(point, moves) * 1000
+        swept_us = time_frames(swept, moves) * 1000
+        layers = np.zeros(moves, dtype=np.intp)
+        x0, y0, x1, y1 = np.array(segments).T
+        batched_us = time_frames(lambda i: sweeps_blocked(walls[np.newaxis], layers, x0, y0, x1, y1, DRONE_RADIUS,
+                                                          scale, clearance[np.newaxis]), 10) * 1000 / moves
+        through = sum(not point(i) and any(walls[cell] for cell in crossed_cells(*segments[i], scale))
+                      for i in range(moves))
+        grazing = sum(swept(i) and not any(walls[cell] for cell in crossed_cells(*segments[i], scale))
+                      for i in range(moves))
+        print(f'  {length:4d} px moves: destination cell {point_us:5.2f} us, swept circle {swept_us:5.2f} us, '
+              f'batched {batched_us:5.2f} us, {through} moves through a wall with the old check, {grazing} grazing a '
+              f'wall blocked')
+
+
+def bench_view(frames=300, full=SCREEN_WIDTH):
+    """
+    Compares the pseudo-3D view drawn with two pygame.draw.rect calls per ray, as Game.cast_rays did before, with the
+    ColumnRenderer, at FOV_RAYS columns and at one column per pixel, flat, shaded and textured. The rays are cast in
+    both, turning the drone a little every frame in the apartments.
+    """
+    screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), 0, 32)
+    game_map = Map()
+    x, y = 3 * game_map.scale, 3 * game_map.scale
+    field = game_map.distance_fields[1]
+    texture = pygame.Surface((64, 64))
+    texture.fill((200, 200, 200))
+    pygame.draw.rect(texture, (120, 120, 120), (0, 0, 64, 8))
+
+    def rect_frame(columns):
+        column_width = SCREEN_WIDTH // columns
+        offsets = FOV_START + FOV_STEP * FOV_RAYS * np.arange(1, columns + 1) / columns
+
+        def frame(i):
+            screen.fill((0, 0, 0))
+            depths, sides = cast_rays(game_map.sensor_grids[1], x, y, i * 0.02 + offsets, game_map.scale,
+                                      VIEW_DEPTH, layers=0, field=field)
+            for ray, (depth, side) in enumerate(zip(depths.tolist(), sides.tolist())):
+                if depth == math.inf:
+                    continue
+                wall_height = SCREEN_HEIGHT / (depth * 0.05)
+                pygame.draw.rect(screen, LAYER_COLORS[0][side], (ray * column_width,
+                                 SCREEN_HEIGHT / 2 - wall_height / 2, column_width, wall_height))
+                pygame.draw.rect(screen, LAYER_COLORS[0][side], (ray * column_width,
+                                 SCREEN_HEIGHT / 2 + wall_height / 2, column_width, -wall_height))
+        return frame
+
+    def view_frame(view):
+        def frame(i):
+            screen.fill((0, 0, 0))
+            view.draw(screen, game_map, 1, x, y, i * 0.02)
+        return frame
+
+    print(f'view: {frames} frames of {SCREEN_WIDTH}x{SCREEN_HEIGHT}, budget {1000 / FRAME_RATE:.1f} ms at '
+          f'{FRAME_RATE} FPS')
+    for columns in (FOV_RAYS, full):
+        rect_ms = time_frames(rect_frame(columns), frames)
+        flat_ms = time_frames(view_frame(ColumnRenderer(columns, shading=False)), frames)
+        shaded_ms = time_frames(view_frame(ColumnRenderer(columns)), frames)
+        textured_ms = time_frames(view_frame(ColumnRenderer(columns, texture=texture)), frames)
+        print(f'  {columns:4d} columns: rects {rect_ms:5.2f} ms, columns flat {flat_ms:5.2f} ms, '
+              f'shaded {shaded_ms:5.2f} ms, textured {textured_ms:5.2f} ms')
+
+
+def bench_compositor(frames=300):
+    """
+    Compares the frames of the viewer drawn by the compositor and presented as dirty rectangles with every layer
+    drawn and the whole screen flipped, for a drone hovering with the HUD idle and for an autonomous flight: the CPU
+    time of drawing and presenting a frame and the bytes presented per frame. Frames are 1/60 s apart.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from game import Game
+
+    def run(full_redraw, flying):
+        simulation = Simulation(seed=1)
+        game = Game(simulation, full_redraw=full_redraw)
+        if flying:
+            simulation.start_ai()
+        presented = 0
+        start = time.perf_counter()
+        for _ in range(frames):
+            game.advance(1 / FRAME_RATE)
+            pose = (game.drone.x, game.drone.y, game.drone.gyro_angle, game.drone.angle)
+            game.drone.x, game.drone.y, game.drone.gyro_angle = game.interpolated_pose()
+            game.drone.angle = math.radians(game.drone.gyro_angle)
+            if full_redraw:
+                game.draw_frame()
+                pygame.display.flip()
+                presented += SCREEN_WIDTH * SCREEN_HEIGHT
+            else:
+                rects = game.compositor.compose()
+                pygame.display.update(rects)
+                presented += sum(rect.width * rect.height for rect in rects)
+            game.drone.x, game.drone.y, game.drone.gyro_angle, game.drone.angle = pose
+        frame_ms = (time.perf_counter() - start) * 1000 / frames
+        return frame_ms, presented * 4 / frames / 1e6  # 4 bytes per pixel
+
+    print(f'compositor: {frames} frames of {SCREEN_WIDTH}x{SCREEN_HEIGHT} at {FRAME_RATE} FPS, '
+          f'including the simulated ticks')
+    for flying in (False, True):
+        full_ms, full_mb = run(True, flying)
+        dirty_ms, dirty_mb = run(False, flying)
+        print(f'  {"flight" if flying else "hover ":6s}: full flip {full_ms:5.2f} ms {full_mb:4.2f} MB, '
+              f'dirty rectangles {dirty_ms:5.2f} ms {dirty_mb:4.2f} MB per frame')
+
+
+def bench_assets(frames=2000, runs=3):
+    """
+    Measures the time from the start of main.py to the first frame, and compares blitting the drone sprite and the
+    warning light as loaded from the files with blitting them converted to the pixel format of the screen, and the
+    first Drone.load_images with the next ones, which share the images and sprites.
+    """
+    environment = dict(os.environ, SDL_VIDEODRIVER='dummy')
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    for flags in ([], ['--warm-sprites']):
+        times = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, main_path, '--startup-time'] + flags, env=environment,
+                                    capture_output=True, text=True, cwd=tempfile.gettempdir()).stdout
+            times.append(float(output.split('first frame after ')[1].split()[0]))
+        command = ' '.join(['main.py'] + flags)
+        print(f'assets: {command} to the first frame in {sorted(times)[runs // 2] * 1000:.0f} ms '
+              f'(median of {runs}, started from another directory)')
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    clear()
+    drones = [Drone() for _ in range(11)]
+    start = time.perf_counter()
+    drones[0].load_images()
+    first_ms = (time.perf_counter() - start) * 1000
+    next_ms = time_frames(lambda i: drones[i + 1].load_images(), 10)
+    print(f'  Drone.load_images: first {first_ms:.1f} ms, next drones {next_ms:.3f} ms')
+
+    raw_drone = pygame.transform.scale(pygame.image.load(asset_path(DRONE_PICTURE)), DRONE_IMAGE_SIZE)
+    raw_warning = pygame.transform.scale(pygame.image.load(asset_path(WARNING_PICTURE)), WARNING_IMAGE_SIZE)
+    raw_sprites = SpriteCache(raw_drone, step=1, max_entries=None)
+    sprites = get_sprites(DRONE_PICTURE, DRONE_IMAGE_SIZE, step=1, max_entries=None)
+    warning = get_image(WARNING_PICTURE, WARNING_IMAGE_SIZE)
+    for angle in range(360):
+        raw_sprites.get(angle, 1.2)
+        sprites.get(angle, 1.2)
+
+    def blit_frame(cache, warning_image):
+        def frame(i):
+            screen.blit(cache.get(i % 360, 1.2)[0], (300, 200))
+            screen.blit(warning_image, (10, 80))
+        return frame
+
+    raw_us = time_frames(blit_frame(raw_sprites, raw_warning), frames) * 1000
+    converted_us = time_frames(blit_frame(sprites, warning), frames) * 1000
+    print(f'  drone sprite and warning light blits: {raw_us:.0f} us per frame as loaded, '
+          f'{converted_us:.0f} us converted ({raw_us / converted_us:.1f}x)')
+    pygame.quit()
+    clear()
+
+
+BENCHMARKS = {
+    'raycast': bench_raycast,
+    'sensors': bench_sensors,
+    'minimap': bench_minimap,
+    'sprites': bench_sprites,
+    'return': bench_return,
+    'maps': bench_maps,
+    'floors': bench_floors,
+    'coverage': bench_coverage,
+    'explore': bench_explore,
+    'mapping': bench_mapping,
+    'swarm': bench_swarm,
+    'noise': bench_noise,
+    'env': bench_env,
+    'text': bench_text,
+    'telemetry': bench_telemetry,
+    'collision': bench_collision,
+    'view': bench_view,
+    'compositor': bench_compositor,
+    'assets': bench_assets,
+}
+
+
+def main(names):
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f'Unknown benchmark {name}, choose from: {", ".join(BENCHMARKS)}')
+            return 1
+        BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
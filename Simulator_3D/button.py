@@ -1,5 +1,8 @@
 import pygame
 
+from text_renderer import get_renderer
+from world_params import BLACK
+
 class Button:
     def __init__(self, text, x, y, width, height):
         self.text = text
@@ -9,6 +12,5 @@ class Button:
 
     def draw(self, screen):
         pygame.draw.rect(screen, self.color, self.rect)
-        font = pygame.font.SysFont(None, 36)
-        text = font.render(self.text, True, (0, 0, 0))
+        text = get_renderer(size=36, color=BLACK).render(self.text)
         screen.blit(text, (self.rect.x + 10, self.rect.y + 10))
@@ -0,0 +1,204 @@
+"""
+Column renderer of the pseudo-3D view, writing every wall column of a frame into the frame buffer at once.
+
+The view used to draw every ray as a pygame.draw.rect call, so the cost of a frame grew with the number of columns in
+Python calls. Here the wall heights, colors and texture rows of all columns are computed as NumPy arrays and written
+through pygame.surfarray into the pixels of the screen in one pass, so the view can cast one ray per pixel column of
+SCREEN_WIDTH at the frame rate. The walls take the palette of the floor from LAYER_COLORS, the dark color for a wall
+hit on a horizontal grid line, and are shaded darker with the distance. A wall texture is tinted by the palette.
+
+With FOV_RAYS columns and no shading the view is the same, pixel for pixel, as the rectangles drawn before.
+
+Draw the view of a drone at full resolution, or with a wall texture:
+    view = ColumnRenderer(columns=SCREEN_WIDTH)
+    view.draw(screen, game_map, drone.current_layer, drone.x, drone.y, drone.angle)
+    view = ColumnRenderer(texture=pygame.image.load('bricks.png'))
+"""
+import numpy as np
+import pygame
+
+from raycaster import cast_rays
+from world_params import SCREEN_WIDTH, SCREEN_HEIGHT, FOV_RAYS, FOV_START, FOV_STEP, VIEW_DEPTH, LAYER_COLORS
+
+FOV = FOV_STEP * FOV_RAYS  # The angle the columns of the view span
+WALL_SCALE = 0.05  # A wall at distance d pixels is SCREEN_HEIGHT / (d * WALL_SCALE) pixels high
+FAR_SHADE = 0.35  # Brightness of a wall at VIEW_DEPTH, walls get linearly darker up to it
+SHADE_LEVELS = 32  # Brightness steps of a shaded texture, precomputed for every palette
+
+
+def map_colors(surface, rgb):
+    """
+    Maps RGB colors to the pixel values of a 32 bit surface, as Surface.map_rgb does for one color.
+
+    Parameters:
+    - surface (pygame.Surface): The surface, 4 bytes per pixel.
+    - rgb (numpy.ndarray): The colors, of shape (..., 3), with channels in 0 to 255.
+
+    Returns:
+    - numpy.ndarray: The pixel values as uint32, of the shape of rgb without the last axis.
+    """
+    rgb = np.clip(rgb, 0, 255).astype(np.uint32)
+    shifts, losses, masks = surface.get_shifts(), surface.get_losses(), surface.get_masks()
+    mapped = np.full(rgb.shape[:-1], masks[3], dtype=np.uint32)  # Opaque on a surface with per pixel alpha
+    for channel in range(3):
+        mapped |= (rgb[..., channel] >> losses[channel]) << shifts[channel]
+    return mapped
+
+
+class ColumnRenderer:
+    """
+    Renders the walls of the pseudo-3D view as vertical columns, one ray per column.
+
+    Parameters:
+    - columns (int): Number of columns and rays, SCREEN_WIDTH for one ray per pixel column.
+    - shading (bool): Whether walls get darker with the distance.
+    - texture (pygame.Surface): A wall texture, stretched over one cell and tinted by the palette of the floor, None
+      for plain colored walls.
+    - width (int): Width of the view in pixels.
+    - height (int): Height of the view in pixels.
+
+    Attributes:
+    - column_width (int): Width of a column in pixels, the columns are drawn from the left edge.
+    - offsets (numpy.ndarray): The angle of every ray relative to the heading of the drone.
+
+    Raises:
+    - ValueError: When there are no columns or more columns than pixels.
+    """
+
+    def __init__(self, columns=FOV_RAYS, shading=True, texture=None, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        if not 0 < columns <= width:
+            raise ValueError(f'columns must be between 1 and the width {width}, got {columns}')
+        self.columns = columns
+        self.shading = shading
+        self.width = width
+        self.height = height
+        self.column_width = width // columns
+        # FOV_START + FOV_STEP * (ray + 1) for FOV_RAYS columns, as the view always cast its rays
+        self.offsets = FOV_START + FOV * np.arange(1, columns + 1) / columns
+        self.pixel_rays = np.arange(columns * self.column_width) // self.column_width  # Ray of every pixel column
+        self.rows = np.arange(height, dtype=np.uint16)
+        self.texture = None if texture is None else pygame.surfarray.array3d(texture).astype(float)
+        self.shaded_textures = {}  # Pixel values of the texture for every palette, side and shade level
+        self.buffer = None  # A 32 bit surface drawn on for screens of another depth
+
+    def draw(self, screen, game_map, layer, x, y, angle):
+        """
+        Casts the rays of the view from a position and renders the walls they hit.
+
+        Parameters:
+        - screen (pygame.Surface): The surface to draw on, cleared beforehand.
+        - game_map (Map): The map to cast the rays in.
+        - layer (int): The layer of the drone, 1 for the top one.
+        - x, y (float): The position of the drone in pixels.
+        - angle (float): The heading of the drone in radians.
+
+        Returns:
+        - pygame.Rect: The rows the walls were drawn on, see render.
+        """
+        angles = angle + self.offsets
+        # Layer 0 of the sensor grids is the walls
+        depths, sides = cast_rays(game_map.sensor_grids[layer], x, y, angles, game_map.scale, VIEW_DEPTH, layers=0,
+                                  field=game_map.distance_fields[layer])
+        along = None
+        if self.texture is not None:
+            # Where the walls are hit along the cell, the hit y for a vertical grid line and the hit x otherwise
+            hits = np.where(np.isfinite(depths), depths, 0)
+            hit_x = (x + np.cos(angles) * hits) / game_map.scale
+            hit_y = (y + np.sin(angles) * hits) / game_map.scale
+            along = np.where(sides == 0, hit_y, hit_x) % 1
+        return self.render(screen, depths, sides, LAYER_COLORS[(layer - 1) % len(LAYER_COLORS)], along)
+
+    def render(self, screen, depths, sides, palette, along=None):
+        """
+        Writes the wall columns of the rays into the pixels of the screen.
+
+        Parameters:
+        - screen (pygame.Surface): The surface to draw on, cleared beforehand.
+        - depths (numpy.ndarray): Distance of every ray to its wall in pixels, inf for no wall.
+        - sides (numpy.ndarray): The grid line every ray hit, 0 for a vertical one, 1 for a horizontal one.
+        - palette (tuple): The (light, dark) RGB colors of the walls.
+        - along (numpy.ndarray): Where every ray hits its wall along the cell, from 0 to 1, for the texture.
+
+        Returns:
+        - pygame.Rect: The columns and rows between the highest and the lowest wall, empty without walls.
+        """
+        hit = np.isfinite(depths)
+        safe_depths = np.where(hit, depths, 1.0)
+        wall_heights = np.where(hit, self.height / (safe_depths * WALL_SCALE), 0)
+        # Truncated like the coordinates of a pygame.Rect, then clipped to the screen
+        tops = np.trunc(self.height / 2 - wall_heights / 2)
+        bottoms = tops + np.trunc(wall_heights)
+        visible_tops = np.clip(tops, 0, self.height).astype(np.uint16)
+        visible_bottoms = np.clip(bottoms, 0, self.height).astype(np.uint16)
+        sides = np.where(hit, sides, 0)
+        shades = (1 - (1 - FAR_SHADE) * np.minimum(safe_depths / VIEW_DEPTH, 1)) if self.shading else None
+
+        target = screen if screen.get_bytesize() == 4 else self.get_buffer(screen)
+        rays = self.pixel_rays
+        # Only the rows between the highest and the lowest wall are written
+        first, last = int(visible_tops.min()), int(visible_bottoms.max())
+        if first >= last:
+            return pygame.Rect(0, 0, 0, 0)
+        # The frame is computed as (row, pixel column) like the pixels are laid out in memory. The row in the wall of
+        # every pixel wraps around for the pixels above the wall, so one comparison finds the pixels of the walls.
+        offsets = self.rows[first:last, np.newaxis] - visible_tops[np.newaxis, rays]
+        walls = offsets < (visible_bottoms - visible_tops)[np.newaxis, rays]
+        if self.texture is None:
+            colors = np.asarray(palette, dtype=float)[sides]
+            if shades is not None:
+                colors *= shades[:, np.newaxis]
+            values = map_colors(target, colors)[np.newaxis, rays]
+        else:
+            textures = self.get_shaded_textures(target, palette)
+            _, texture_width, texture_height = textures.shape
+            levels = SHADE_LEVELS - 1
+            if shades is not None:
+                levels = np.rint((shades - FAR_SHADE) / (1 - FAR_SHADE) * (SHADE_LEVELS - 1)).astype(np.intp)
+            u = np.minimum((along * texture_width).astype(np.intp), texture_width - 1)
+            # Index of the first texel of the texture column of every ray in the flat textures
+            starts = ((sides * SHADE_LEVELS + levels) * texture_width + u) * texture_height
+            steps = (texture_height / np.maximum(wall_heights, 1)).astype(np.float32)
+            hidden = (visible_tops - tops).astype(np.float32)  # Rows of the walls above the screen
+            v = ((offsets + hidden[np.newaxis, rays]) * steps[np.newaxis, rays]).astype(np.intp)
+            np.clip(v, 0, texture_height - 1, out=v)
+            v += starts[np.newaxis, rays]
+            values = textures.ravel()[v]
+
+        pixels = pygame.surfarray.pixels2d(target)
+        np.copyto(pixels.T[first:last, :len(rays)], values, where=walls)
+        del pixels  # Unlocks the surface
+        if target is not screen:
+            screen.blit(target, (0, 0))
+        return pygame.Rect(0, first, len(rays), last - first)
+
+    def get_buffer(self, screen):
+        """
+        Returns the 32 bit surface the view is rendered on for a screen of another depth, cleared to black.
+        """
+        if self.buffer is None or self.buffer.get_size() != screen.get_size():
+            self.buffer = pygame.Surface(screen.get_size(), 0, 32)
+        self.buffer.fill((0, 0, 0))
+        return self.buffer
+
+    def get_shaded_textures(self, surface, palette):
+        """
+        Returns the pixel values of the texture tinted by both colors of a palette at every shade level, computed on
+        the first frame of the palette.
+
+        Parameters:
+        - surface (pygame.Surface): The 32 bit surface the values are for.
+        - palette (tuple): The (light, dark) RGB colors of the walls.
+
+        Returns:
+        - numpy.ndarray: The values of shape (2 * SHADE_LEVELS, texture width, texture height), indexed by
+          side * SHADE_LEVELS + level.
+        """
+        key = (tuple(map(tuple, palette)), surface.get_shifts(), surface.get_masks())
+        textures = self.shaded_textures.get(key)
+        if textures is None:
+            # The light color of the palette leaves its brightest channel unchanged
+            tints = np.asarray(palette, dtype=float) / max(palette[0])
+            brightness = FAR_SHADE + (1 - FAR_SHADE) * np.arange(SHADE_LEVELS) / (SHADE_LEVELS - 1)
+            factors = (tints[:, np.newaxis] * brightness[:, np.newaxis]).reshape(-1, 1, 1, 3)
+            textures = self.shaded_textures[key] = map_colors(surface, self.texture * factors)
+        return textures
@@ -0,0 +1,170 @@
+"""
+Layered compositor of the viewer frames, redrawing and presenting only the parts of the screen that changed.
+
+The frame is made of two groups of layers. The scene layers, the pseudo-3D view, the warning light, the sensors and
+the drone, are drawn into an offscreen scene surface and change together with the pose of the drone. The HUD layers,
+the buttons, the battery, the minimaps and the profiler HUD, are drawn on the screen on top of the scene, each
+inside its bounds, a rectangle that moves only with what the layer draws, e.g. the sensor lines past a minimap.
+Every layer has a state, a hashable value of everything its pixels depend on, and is only drawn again when its state
+changed. The scene layers remember the rectangles they drew on, so the scene is cleared only there, and the dirty
+rectangles of a frame are the old and new rectangles of the changed layers. They are restored from the scene, the
+HUD layers over them are drawn again clipped to them, and only they are presented with pygame.display.update instead
+of flipping the whole screen.
+
+Compose the frames of a scene and a HUD:
+    compositor = Compositor(screen, [Layer('view', draw_view, view_state)],
+                            [Layer('battery', battery.draw, battery_state, battery_bounds)])
+    pygame.display.update(compositor.compose())
+"""
+import pygame
+
+FULL_UPDATE_FRACTION = 0.6  # Dirty rectangles covering more of the screen than this are presented as one
+
+
+class Layer:
+    """
+    A layer of the frame.
+
+    Parameters:
+    - name (str): The name of the layer.
+    - draw (callable): draw(surface) draws the layer and returns the rectangles it drew on, a Rect or a list of
+      them, for a scene layer. A HUD layer only draws inside its bounds and its return value is ignored.
+    - state (callable): state() returns a hashable value that changes whenever the pixels of the layer change.
+    - bounds (callable): bounds() returns the Rect a HUD layer draws inside in this frame, None for a scene layer.
+      It is called before state, so it can bring a cached rendering of the layer up to date.
+
+    Attributes:
+    - key: The state of the layer when it was last drawn.
+    - rects (list): The rectangles the layer covered when it was last drawn.
+    """
+
+    def __init__(self, name, draw, state, bounds=None):
+        self.name = name
+        self.draw = draw
+        self.state = state
+        self.bounds = bounds
+        self.key = None
+        self.rects = []
+
+
+def merge_rects(rects, screen_rect):
+    """
+    Returns the rectangles clipped to the screen with the overlapping ones merged into their bounding rectangle, so
+    no pixel is restored or presented twice. Empty rectangles are dropped.
+
+    Parameters:
+    - rects (list): The rectangles as pygame.Rect.
+    - screen_rect (pygame.Rect): The rectangle of the screen.
+
+    Returns:
+    - list: The merged rectangles, the whole screen when they cover more than FULL_UPDATE_FRACTION of it.
+    """
+    merged = []
+    for rect in rects:
+        rect = rect.clip(screen_rect)
+        if not rect.width or not rect.height:
+            continue
+        # Merging can make a rectangle overlap one that was checked before, so start over until none overlaps
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect = rect.union(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    if sum(rect.width * rect.height for rect in merged) > FULL_UPDATE_FRACTION * screen_rect.width * screen_rect.height:
+        return [screen_rect.copy()]
+    return merged
+
+
+class Compositor:
+    """
+    Composes the frames of the viewer from scene and HUD layers and returns the rectangles to present.
+
+    Parameters:
+    - screen (pygame.Surface): The display surface.
+    - scene_layers (list): The layers drawn into the scene surface, bottom first.
+    - hud_layers (list): The layers drawn on the screen over the scene, bottom first, each with bounds.
+
+    Attributes:
+    - scene (pygame.Surface): The offscreen surface with the scene layers.
+    - frames (int): Frames composed.
+    - presented (int): Pixels presented over all frames.
+    - scene_frames (int): Frames the scene layers were drawn again.
+    """
+
+    def __init__(self, screen, scene_layers, hud_layers):
+        self.screen = screen
+        self.screen_rect = screen.get_rect()
+        self.scene = pygame.Surface(screen.get_size(), 0, screen)
+        self.scene_layers = scene_layers
+        self.hud_layers = hud_layers
+        self.full = True  # The next frame draws and presents every layer and the whole screen
+        self.frames = 0
+        self.presented = 0
+        self.scene_frames = 0
+
+    def invalidate(self):
+        """
+        Draws and presents the whole frame again on the next compose, e.g. after the window was uncovered.
+        """
+        self.full = True
+
+    def compose(self):
+        """
+        Draws the layers whose state changed and the HUD layers over the dirty rectangles onto the screen.
+
+        Returns:
+        - list: The dirty rectangles to present with pygame.display.update, empty when nothing changed.
+        """
+        full = self.full
+        self.full = False
+        dirty = []
+        keys = [layer.state() for layer in self.scene_layers]
+        if full or any(key != layer.key for key, layer in zip(keys, self.scene_layers)):
+            # The layers overlap, so the scene is drawn again as a whole, over the rectangles it covered
+            if full:
+                self.scene.fill((0, 0, 0))
+            for layer in self.scene_layers:
+                for rect in layer.rects:
+                    self.scene.fill((0, 0, 0), rect)
+            for key, layer in zip(keys, self.scene_layers):
+                dirty.extend(layer.rects)
+                rects = layer.draw(self.scene) or []
+                layer.rects = [rects] if isinstance(rects, pygame.Rect) else list(rects)
+                layer.key = key
+                dirty.extend(layer.rects)
+            self.scene_frames += 1
+        for layer in self.hud_layers:
+            bounds = layer.bounds()
+            key = layer.state()
+            if full or key != layer.key or [bounds] != layer.rects:
+                dirty.extend(layer.rects)
+                dirty.append(bounds)
+                layer.key, layer.rects = key, [bounds]
+
+        rects = [self.screen_rect.copy()] if full else merge_rects(dirty, self.screen_rect)
+        for rect in rects:
+            self.screen.blit(self.scene, rect, rect)
+            for layer in self.hud_layers:
+                area = rect.clip(layer.rects[0])
+                if area.width and area.height:
+                    self.screen.set_clip(area)
+                    layer.draw(self.screen)
+                    self.screen.set_clip(None)  # The next rectangle is restored from the scene unclipped
+        self.frames += 1
+        self.presented += sum(rect.width * rect.height for rect in rects)
+        return rects
+
+    def stats(self):
+        """
+        Returns the frames composed, how often the scene was drawn and the pixels presented per frame.
+
+        Returns:
+        - dict: The frames, the scene frames, the pixels per frame and their fraction of the screen.
+        """
+        pixels = self.presented / self.frames if self.frames else 0.0
+        return {
+            'frames': self.frames,
+            'scene_frames': self.scene_frames,
+            'pixels_per_frame': pixels,
+            'screen_fraction': pixels / (self.screen_rect.width * self.screen_rect.height),
+        }
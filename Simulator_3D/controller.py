@@ -0,0 +1,327 @@
+"""
+The controllers that steer the drone while the autonomous movement is on.
+
+A controller is created with the simulation it drives and its step method is called once per tick while the
+autonomous movement is on. The simulation picks a controller by name from CONTROLLERS; other controllers can be
+plugged in by assigning an instance to Simulation.controller.
+"""
+import math
+
+import numpy as np
+
+from drone import SENSOR_RANGE
+
+# Knowledge of a cell in the exploration map of the frontier controller
+UNKNOWN = 0
+FREE = 1
+WALL = 2
+
+# Neighbours of a cell on the same layer, as (dy, dx)
+NEIGHBOURS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def off_grid_line(values, scale, tolerance=0.5):
+    """
+    Returns whether pixel coordinates are more than tolerance pixels away from the grid lines, half a pixel by
+    default.
+    """
+    offsets = values % scale
+    return (offsets > tolerance) & (offsets < scale - tolerance)
+
+
+class Controller:
+    """
+    The interface of the autonomous controllers.
+
+    Parameters:
+    - simulation (Simulation): The simulation whose drone the controller steers.
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+    def step(self):
+        """
+        Moves the drone for one tick of the autonomous movement.
+        """
+        raise NotImplementedError
+
+
+class ReactiveController(Controller):
+    """
+    The original wall avoider: the drone flies ahead while slowly turning, turns away from the closest side obstacle,
+    and changes floor at random when it happens to be over a hole.
+    """
+
+    def step(self):
+        simulation = self.simulation
+        drone = simulation.drone
+        game_map = simulation.map
+        if not drone.move_floor:
+            sensor_readings = simulation.calculate_risky()
+            if sensor_readings:
+                drone.moving = False
+                drone.speed_down()
+                min_sensor_dist = min(sensor_readings.values())
+                degree = 0
+                for sensor_angle in sensor_readings:
+                    if sensor_readings[sensor_angle] == min_sensor_dist:
+                        degree = sensor_angle.config
+                if degree < 0:  # Closer to left wall
+
+                    drone.gyro_angle = drone.format_rotation(drone.gyro_angle + 1)  # Rotate right
+                else:  # Closer to right wall
+                    drone.gyro_angle = drone.format_rotation(drone.gyro_angle - 1)  # Rotate left
+
+            else:
+                drone.moving = True
+
+            if drone.moving:
+                drone.speed_up()
+                if drone.timing_change == 50:
+                    drone.right_left *= 1
+                    drone.timing_change = 0
+                drone.gyro_angle = drone.format_rotation(drone.gyro_angle + 0.5 * drone.right_left)
+                drone.timing_change += 1
+                drone.angle = math.radians(drone.gyro_angle)
+                if simulation.move(*drone.displacement()):
+                    drone.current_point = (int(drone.y / game_map.scale), int(drone.x / game_map.scale))
+                    drone.update_points(drone.current_layer)
+                    drone.coverage.visit(drone.current_layer, *drone.current_point)
+        if drone.move_floor or simulation.random.random() < 0.006:
+            row, column = int(drone.y / game_map.scale), int(drone.x / game_map.scale)
+            # A hole to the layer, unless the cell is a wall on the other side
+            next_layers = [layer for layer in game_map.next_layers(drone.current_layer, row, column)
+                           if not game_map.walls[layer][row, column]]
+            if next_layers and simulation.random.random() < 0.5:
+                if not drone.move_floor or drone.target_layer not in next_layers:
+                    # A hole between three floors leads up or down
+                    drone.target_layer = (next_layers[0] if len(next_layers) == 1
+                                          else simulation.random.choice(next_layers))
+                drone.moving = False
+                drone.speed = 0
+                drone.move_floor = True
+                if simulation.change_floor(drone.target_layer):
+                    drone.update_points(drone.current_layer)
+                    drone.move_floor = False
+                    drone.moving = True
+
+
+class FrontierController(Controller):
+    """
+    Explores the building by flying to the nearest frontier, a known free cell next to a cell that was not seen yet.
+
+    The controller builds its own map of the building from what the drone observes: every sensor ray marks the
+    cells it crosses as free and the cell it hits as a wall, the drone sees the cells next to the one it is in, and
+    through a hole it sees the cell of the floor the hole leads to. The frontier is updated only around the cells
+    that became known in the tick, so a tick costs the same however much of the building is known. A path to the
+    nearest frontier is planned with a breadth first search over the known free cells, including the holes, only
+    when the drone reached its target or the target stopped being a frontier. The drone then flies from cell center
+    to cell center along the path. Once no frontier is left the drone returns home.
+
+    Attributes:
+    - known (numpy.ndarray): uint8 array of shape (layers, height, width) of UNKNOWN, FREE and WALL cells.
+    - frontier (numpy.ndarray): Boolean array of shape (layers, height, width), True for the frontier cells.
+    - path (list): The cells as (layer, y, x) left to fly through to the target.
+    - target (tuple): The frontier cell the drone flies to as an index of frontier, (layer - 1, y, x), None when
+      there is no path.
+    - plans (int): Number of paths planned.
+    """
+
+    def __init__(self, simulation):
+        super().__init__(simulation)
+        game_map = simulation.map
+        self.known = np.full(game_map.occupancy.shape, UNKNOWN, dtype=np.uint8)
+        self.frontier = np.zeros(game_map.occupancy.shape, dtype=bool)
+        self.path = []
+        self.target = None
+        self.plans = 0
+        # Steps of the search from the drone, -1 for the cells it has not reached; only the reached cells are reset
+        # after a search, so planning does not allocate or clear an array of the size of the map
+        self.steps = np.full(game_map.occupancy.size, -1, dtype=np.int32)
+        no_holes = np.zeros((1, game_map.height, game_map.width), dtype=bool)
+        self.up_flat = np.concatenate([game_map.holes, no_holes]).ravel()
+        self.down_flat = np.concatenate([no_holes, game_map.holes]).ravel()
+
+    def step(self):
+        simulation = self.simulation
+        drone = simulation.drone
+        simulation.calculate_risky()
+        self.observe()
+        if not self.path or not self.frontier[self.target]:
+            self.plan()
+            if not self.path:  # Everything the drone can reach is explored
+                simulation.start_return()
+                return
+
+        layer, y, x = self.path[0]
+        if layer != drone.current_layer:
+            drone.speed = 0
+            if simulation.change_floor(layer):
+                self.path.pop(0)
+                drone.update_points(drone.current_layer)
+            return
+        if simulation.fly_to(y, x):
+            self.path.pop(0)
+        drone.update_points(drone.current_layer)
+        drone.coverage.visit(drone.current_layer, *drone.current_point)
+
+    def observe(self):
+        """
+        Adds what the drone sees this tick to the known cells and updates the frontier around the new cells.
+        """
+        drone = self.simulation.drone
+        game_map = self.simulation.map
+        layer = drone.current_layer
+        known = self.known[layer - 1]
+        walls = game_map.walls[layer]
+        y, x = int(drone.y / game_map.scale), int(drone.x / game_map.scale)
+
+        # The cells along the side sensor rays up to their hit, sampled every quarter cell. Points within half a
+        # pixel of a grid line could be in either cell, e.g. on a ray along a wall, and are left out. A ray that hit
+        # nothing only shows the cells up to the range of its sensor, and a lost reading or one kept from an earlier
+        # scan, which was taken from another position, shows nothing
+        sensors = [sensor for sensor in drone.sensors[drone.current_sensor] if sensor.is_up_down == 0]
+        angles = np.radians([drone.gyro_angle + sensor.config for sensor in sensors])
+        distances = np.array([min(sensor.distance, sensor.model.max_range)
+                              if sensor.model.update_rate is None or sensor.updated_at == drone.scan_time else np.nan
+                              for sensor in sensors])
+        sides = np.array([sensor.side for sensor in sensors])
+        # Noisy readings stop the free cells three standard deviations short of the hit, and look for the wall as
+        # far across the grid line
+        margins = np.array([3 * sensor.model.noise for sensor in sensors])
+        samples = np.arange(0, SENSOR_RANGE, game_map.scale / 4)
+        ray_x = drone.x + np.cos(angles)[:, np.newaxis] * samples
+        ray_y = drone.y + np.sin(angles)[:, np.newaxis] * samples
+        seen = ((samples[np.newaxis, :] < (distances - 1 - margins)[:, np.newaxis])
+                & off_grid_line(ray_x, game_map.scale) & off_grid_line(ray_y, game_map.scale))
+        free_y = (ray_y[seen] / game_map.scale).astype(np.intp)
+        free_x = (ray_x[seen] / game_map.scale).astype(np.intp)
+        # The wall cell behind the grid line each ray hit, half a pixel across the line. A hit at a corner of the
+        # grid could be the cell on either side and is left out
+        hit = sides >= 0
+        dir_x, dir_y = np.cos(angles[hit]), np.sin(angles[hit])
+        hit_x = drone.x + dir_x * distances[hit]
+        hit_y = drone.y + dir_y * distances[hit]
+        vertical = sides[hit] == 0
+        across = 0.5 + margins[hit]
+        clear = np.where(vertical, off_grid_line(hit_y, game_map.scale, across),
+                         off_grid_line(hit_x, game_map.scale, across))
+        hit_x = np.where(vertical, hit_x + np.sign(dir_x) * across, hit_x)[clear]
+        hit_y = np.where(vertical, hit_y, hit_y + np.sign(dir_y) * across)[clear]
+        wall_y = (hit_y / game_map.scale).astype(np.intp)
+        wall_x = (hit_x / game_map.scale).astype(np.intp)
+        # The drone's cell and its neighbours, as they are
+        near_y = np.array([y] + [y + dy for dy, dx in NEIGHBOURS])
+        near_x = np.array([x] + [x + dx for dy, dx in NEIGHBOURS])
+
+        ys = np.concatenate([free_y, wall_y, near_y])
+        xs = np.concatenate([free_x, wall_x, near_x])
+        values = np.concatenate([np.full(len(free_y), FREE), np.full(len(wall_y), WALL),
+                                 np.where(walls[near_y, near_x], WALL, FREE)]).astype(np.uint8)
+        new = known[ys, xs] == UNKNOWN
+        if not new.any():
+            return
+        ys, xs, values = ys[new], xs[new], values[new]
+        known[ys, xs] = values
+        changed = {layer: (ys, xs)}
+
+        # Through the holes among the new free cells the drone sees the cell of the next and the previous floor
+        open_cells = values == FREE
+        for next_layer, holes in ((layer + 1, layer - 1), (layer - 1, layer - 2)):
+            if not 0 <= holes < len(game_map.holes):
+                continue
+            through = open_cells & game_map.holes[holes][ys, xs]
+            other_y, other_x = ys[through], xs[through]
+            other = self.known[next_layer - 1]
+            unseen = other[other_y, other_x] == UNKNOWN
+            other_y, other_x = other_y[unseen], other_x[unseen]
+            other[other_y, other_x] = np.where(game_map.walls[next_layer][other_y, other_x], WALL, FREE)
+            if len(other_y):
+                changed[next_layer] = (other_y, other_x)
+
+        for changed_layer, (ys, xs) in changed.items():
+            self.update_frontier(changed_layer, ys, xs)
+
+    def update_frontier(self, layer, ys, xs):
+        """
+        Recomputes the frontier of the new known cells of a layer and of their neighbours.
+        """
+        known = self.known[layer - 1]
+        height, width = known.shape
+        ys = np.concatenate([ys] + [ys + dy for dy, dx in NEIGHBOURS])
+        xs = np.concatenate([xs] + [xs + dx for dy, dx in NEIGHBOURS])
+        # The outer walls are solid, so cells outside the map are never a frontier
+        inside = (ys > 0) & (ys < height - 1) & (xs > 0) & (xs < width - 1)
+        ys, xs = ys[inside], xs[inside]
+        unknown_next = np.zeros(len(ys), dtype=bool)
+        for dy, dx in NEIGHBOURS:
+            unknown_next |= known[ys + dy, xs + dx] == UNKNOWN
+        self.frontier[layer - 1, ys, xs] = (known[ys, xs] == FREE) & unknown_next
+
+    def plan(self):
+        """
+        Plans the path to the nearest frontier cell with a breadth first search over the known free cells.
+
+        The search expands a whole wavefront at a time, like home_field, and stops at the first wavefront that
+        reaches a frontier cell. The path is then walked back from the frontier cell along decreasing steps.
+        """
+        self.plans += 1
+        self.path = []
+        self.target = None
+        drone = self.simulation.drone
+        game_map = self.simulation.map
+        height, width = game_map.height, game_map.width
+        cells = height * width
+        free_flat = self.known.ravel() == FREE
+        frontier_flat = self.frontier.ravel()
+        start = ((drone.current_layer - 1) * cells + int(drone.y / game_map.scale) * width
+                 + int(drone.x / game_map.scale))
+        wavefront = np.array([start])
+        reached = [wavefront]
+        self.steps[start] = 0
+        steps = 0
+        goal = None
+        while wavefront.size:
+            at_frontier = frontier_flat[wavefront]
+            if at_frontier.any():
+                goal = int(wavefront[at_frontier][0])
+                break
+            steps += 1
+            row, column = np.divmod(wavefront % cells, width)
+            grown = np.concatenate([
+                wavefront[row > 0] - width,
+                wavefront[row < height - 1] + width,
+                wavefront[column > 0] - 1,
+                wavefront[column < width - 1] + 1,
+                wavefront[self.up_flat[wavefront]] + cells,
+                wavefront[self.down_flat[wavefront]] - cells,
+            ])
+            grown = np.unique(grown)
+            wavefront = grown[free_flat[grown] & (self.steps[grown] < 0)]
+            self.steps[wavefront] = steps
+            reached.append(wavefront)
+
+        if goal is not None:
+            cell = goal
+            while self.steps[cell] > 0:
+                layer, rest = divmod(cell, cells)
+                self.path.append((layer + 1, *divmod(rest, width)))
+                candidates = [cell - width, cell + width, cell - 1, cell + 1]
+                if self.up_flat[cell]:
+                    candidates.append(cell + cells)
+                if self.down_flat[cell]:
+                    candidates.append(cell - cells)
+                cell = next(candidate for candidate in candidates if self.steps[candidate] == self.steps[cell] - 1)
+            self.path.reverse()
+            layer, rest = divmod(goal, cells)
+            self.target = (layer, *divmod(rest, width))
+        for indices in reached:
+            self.steps[indices] = -1
+
+
+# The controllers Simulation can be created with, by name
+CONTROLLERS = {
+    'reactive': ReactiveController,
+    'frontier': FrontierController,
+}
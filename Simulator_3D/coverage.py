@@ -0,0 +1,165 @@
+import numpy as np
+
+
+class CoverageMap:
+    """
+    The cells of every layer the drone has visited, as one uint8 grid per layer instead of a set of tuples.
+
+    A visit sets one byte of the grid of the layer, so the memory is fixed by the size of the map, one byte per
+    cell, however long the flight is. The grids are NumPy views of a single bytearray, which a visit indexes
+    directly since indexing a bytearray from Python is several times cheaper than indexing a NumPy array. The
+    number of visited cells of every layer is counted as the cells are first visited, so the coverage of all layers
+    is one division of two arrays.
+
+    Parameters:
+    - game_map (Map): The map whose cells are tracked.
+
+    Attributes:
+    - visited (numpy.ndarray): uint8 array of shape (layers, height, width), 1 for the visited cells.
+    - grids (dict): Views of the grid of every layer, keyed by the 1-based layer.
+    - counts (dict): Number of visited cells of every layer.
+    """
+
+    def __init__(self, game_map):
+        self.width = game_map.width
+        self.bytes = bytearray(game_map.occupancy.size)
+        self.visited = np.frombuffer(self.bytes, dtype=np.uint8).reshape(game_map.occupancy.shape)
+        self.grids = {layer: self.visited[layer - 1] for layer in range(1, game_map.layers + 1)}
+        # Index of the first cell of every layer in the bytearray
+        self.offsets = {layer: (layer - 1) * game_map.height * game_map.width for layer in self.grids}
+        self.counts = dict.fromkeys(self.grids, 0)
+        self.free_cells = (~game_map.occupancy).sum(axis=(1, 2))
+
+    def visit(self, layer, y, x):
+        """
+        Marks a cell of a layer as visited.
+
+        Returns:
+        - bool: Whether the cell was visited for the first time.
+        """
+        index = self.offsets[layer] + y * self.width + x
+        if self.bytes[index]:
+            return False
+        self.bytes[index] = 1
+        self.counts[layer] += 1
+        return True
+
+    def visit_cells(self, layers, ys, xs):
+        """
+        Marks a batch of cells as visited with one array operation, e.g. the cells of every drone of a swarm.
+
+        Parameters:
+        - layers (numpy.ndarray): The 1-based layer of every cell.
+        - ys (numpy.ndarray): The row of every cell.
+        - xs (numpy.ndarray): The column of every cell.
+
+        Returns:
+        None
+        """
+        flat = self.visited.reshape(-1)
+        indices = np.ravel_multi_index((np.asarray(layers, dtype=np.intp) - 1, ys, xs), self.visited.shape)
+        new = np.unique(indices[flat[indices] == 0])
+        if not new.size:
+            return
+        flat[new] = 1
+        added = np.bincount(new // (self.visited.shape[1] * self.visited.shape[2]), minlength=len(self.counts))
+        for layer, count in zip(self.grids, added.tolist()):
+            self.counts[layer] += count
+
+    def is_visited(self, layer, y, x):
+        return bool(self.bytes[self.offsets[layer] + y * self.width + x])
+
+    def coverage(self):
+        """
+        Returns the fraction of the free cells of every layer that was visited.
+
+        Returns:
+        - dict: The coverage of each layer, between 0 and 1.
+        """
+        fractions = np.fromiter(self.counts.values(), dtype=float, count=len(self.counts)) / self.free_cells
+        return dict(zip(self.grids, fractions.tolist()))
+
+    def cells(self, layer):
+        """
+        Returns the visited cells of a layer as an array of (y, x) rows.
+        """
+        return np.argwhere(self.grids[layer])
+
+    def set_cells(self, layers, ys, xs):
+        """
+        Replaces the visited cells with the given ones, e.g. the cells of a recorded flight.
+
+        Parameters:
+        - layers (numpy.ndarray): The 1-based layer of every cell.
+        - ys (numpy.ndarray): The row of every cell.
+        - xs (numpy.ndarray): The column of every cell.
+
+        Returns:
+        None
+        """
+        self.visited[...] = 0
+        self.visited[np.asarray(layers, dtype=np.intp) - 1, ys, xs] = 1
+        self.counts = dict(zip(self.grids, np.count_nonzero(self.visited, axis=(1, 2)).tolist()))
+
+
+class WaypointBuffer:
+    """
+    The waypoints of one layer in a growing NumPy array of (y, x) pixel positions, instead of a list of objects.
+
+    Parameters:
+    - capacity (int): Number of waypoints the buffer holds before it grows, it doubles every time it is full.
+    """
+
+    def __init__(self, capacity=64):
+        self.positions = np.empty((capacity, 2))
+        self.size = 0
+        self.last = None
+
+    def __len__(self):
+        return self.size
+
+    def append(self, y, x):
+        if self.size == len(self.positions):
+            self.positions = np.concatenate([self.positions, np.empty_like(self.positions)])
+        self.positions[self.size] = y, x
+        self.size += 1
+        # Kept as floats so the distance check of every tick does not read NumPy scalars
+        self.last = (y, x)
+
+    def clear(self):
+        self.size = 0
+        self.last = None
+
+    def set(self, positions):
+        """
+        Replaces the waypoints with the given ones, e.g. the waypoints of a recorded flight.
+
+        Parameters:
+        - positions (numpy.ndarray): The waypoints as an array of (y, x) rows.
+
+        Returns:
+        None
+        """
+        capacity = len(self.positions)
+        while capacity < len(positions):
+            capacity *= 2
+        if capacity != len(self.positions):
+            self.positions = np.empty((capacity, 2))
+        self.positions[:len(positions)] = positions
+        self.size = len(positions)
+        self.last = tuple(self.positions[self.size - 1].tolist()) if self.size else None
+
+    def view(self):
+        """
+        Returns the waypoints as an array of (y, x) rows, a view of the buffer.
+        """
+        return self.positions[:self.size]
+
+    def cells(self, scale):
+        """
+        Returns the cells of the waypoints as an int array of (y, x) rows.
+
+        Parameters:
+        - scale (int): Size of a cell in pixels.
+        """
+        return (self.view() / scale).astype(np.intp)
@@ -0,0 +1,124 @@
+import numpy as np
+
+
+def column_offsets(solid):
+    """
+    Counts for every cell the rows between it and the closest solid cell of the same column, above or below.
+
+    Parameters:
+    - solid (numpy.ndarray): Boolean grid of shape (height, width).
+
+    Returns:
+    - numpy.ndarray: float array of shape (height, width), inf in the columns without a solid cell.
+    """
+    height = solid.shape[0]
+    rows = np.arange(height)[:, None]
+    # Index of the closest solid row at or above every cell, and at or below it
+    above = np.maximum.accumulate(np.where(solid, rows, -1), axis=0)
+    below = np.minimum.accumulate(np.where(solid, rows, height)[::-1], axis=0)[::-1]
+    offsets = np.minimum(np.where(above >= 0, rows - above, np.inf), np.where(below < height, below - rows, np.inf))
+    return offsets
+
+
+def squared_transform(solid, gap):
+    """
+    Computes for every cell the smallest squared distance, in cells, to a solid cell of the same grid.
+
+    The distance between two cells that are dx columns and dy rows apart is
+    max(|dx| - gap, 0) ** 2 + max(|dy| - gap, 0) ** 2, which is separable: the closest solid cell of every column is
+    found first, then the columns are combined along the rows one offset at a time for the whole grid at once. The
+    offsets stop as soon as the cost of the offset alone exceeds every distance found, so the work grows with the
+    largest distance in the grid and not with its width. gap 0 gives the distance between cell centers, gap 1 the
+    distance between the closest points of the two cells.
+
+    Parameters:
+    - solid (numpy.ndarray): Boolean grid of shape (height, width), True for a solid cell.
+    - gap (int): Cells subtracted from the offset on each axis, 0 or 1.
+
+    Returns:
+    - numpy.ndarray: float array of shape (height, width), inf when the grid has no solid cell.
+    """
+    if not solid.any():
+        return np.full(solid.shape, np.inf)
+    in_column = np.maximum(column_offsets(solid) - gap, 0) ** 2
+    result = in_column.copy()
+    for offset in range(1, solid.shape[1]):
+        cost = max(offset - gap, 0) ** 2
+        if cost >= result.max():
+            break
+        np.minimum(result[:, offset:], in_column[:, :-offset] + cost, out=result[:, offset:])
+        np.minimum(result[:, :-offset], in_column[:, offset:] + cost, out=result[:, :-offset])
+    return result
+
+
+def free_run(solid, axis, reverse):
+    """
+    Counts for every cell the free cells that follow it along an axis before the next solid cell.
+
+    Cells are counted up to the border of the grid when no solid cell follows, and solid cells count 0.
+
+    Parameters:
+    - solid (numpy.ndarray): Boolean grid of shape (height, width).
+    - axis (int): 1 to count along the row, 0 along the column.
+    - reverse (bool): Count towards lower indices instead of higher ones.
+
+    Returns:
+    - tuple: (run, blocked), the integer counts and whether a solid cell ends the run (False when it reaches the
+      border).
+    """
+    grid = solid if axis == 1 else solid.T
+    if reverse:
+        grid = grid[:, ::-1]
+    # 16-bit counts halve the memory of the tables, a run is never longer than the grid
+    run = np.zeros(grid.shape, dtype=np.int16 if grid.shape[1] < 2 ** 15 else np.int32)
+    blocked = np.zeros(grid.shape, dtype=bool)
+    for column in range(grid.shape[1] - 2, -1, -1):
+        after = grid[:, column + 1]
+        run[:, column] = np.where(after, 0, run[:, column + 1] + 1)
+        blocked[:, column] = after | blocked[:, column + 1]
+    run[grid] = 0
+    blocked[grid] = True
+    if reverse:
+        run, blocked = run[:, ::-1], blocked[:, ::-1]
+    if axis == 0:
+        run, blocked = run.T, blocked.T
+    return np.ascontiguousarray(run), np.ascontiguousarray(blocked)
+
+
+class DistanceField:
+    """
+    Precomputed free space index of a grid, or of a stack of grids, that never changes during a run.
+
+    It is built once when the map is loaded and lets the ray queries skip over open space (sphere tracing) and
+    answer rays along an axis with a single lookup, instead of visiting every cell.
+
+    Parameters:
+    - grids (numpy.ndarray): Boolean grid of shape (height, width) or stack of shape (count, height, width).
+
+    Attributes:
+    - distance (numpy.ndarray): Euclidean distance transform, the distance in cells from the center of each cell to
+      the center of the closest solid cell.
+    - clearance (numpy.ndarray): Distance in cells from any point of each cell to the closest solid cell, the
+      radius of open space the ray queries can safely jump over.
+    - max_clearance (float): The largest clearance of any cell.
+    - east, west, south, north (numpy.ndarray): Free cells between each cell and the next solid cell along +x, -x,
+      +y and -y.
+    - east_blocked, west_blocked, south_blocked, north_blocked (numpy.ndarray): Whether a solid cell ends that run,
+      False when the run reaches the border of the grid.
+    """
+
+    def __init__(self, grids):
+        stack = grids if grids.ndim == 3 else grids[np.newaxis]
+        self.distance = np.stack([np.sqrt(squared_transform(grid, 0)) for grid in stack]).astype(np.float32)
+        self.clearance = np.stack([np.sqrt(squared_transform(grid, 1)) for grid in stack]).astype(np.float32)
+        self.max_clearance = float(self.clearance.max())
+        runs = {}
+        for name, axis, reverse in (('east', 1, False), ('west', 1, True), ('south', 0, False), ('north', 0, True)):
+            run_blocked = [free_run(grid, axis, reverse) for grid in stack]
+            runs[name] = np.stack([run for run, _ in run_blocked])
+            runs[name + '_blocked'] = np.stack([blocked for _, blocked in run_blocked])
+        if grids.ndim == 2:
+            self.distance, self.clearance = self.distance[0], self.clearance[0]
+            runs = {name: table[0] for name, table in runs.items()}
+        for name, table in runs.items():
+            setattr(self, name, table)
@@ -5,45 +5,65 @@ from world_params import SCREEN_WIDTH, SCREEN_HEIGHT, DRONE_PICTURE, WARNING_PIC
 from map import Map
 from sensor import Sensor
 from world_params import *
+from raycaster import cast_rays
+from assets import get_image, get_sprites
+from coverage import CoverageMap, WaypointBuffer
+import numpy as np
+from noise_model import IDEAL_MOTION, NoiseStream, sample_readings
+from collision import DRONE_RADIUS
+
+# How far the sensor rays and the sensor lines drawn on the screen reach, in pixels
+SENSOR_RANGE = 999
+SENSOR_VIEW_RANGE = 799
+# The drone sprite is drawn at whole degrees, one sprite per degree kept in memory (about 30 MB)
+SPRITE_ANGLE_STEP = 1
+SPRITE_CACHE_SIZE = None
+DRONE_IMAGE_SIZE = (300, 300)  # The drone picture is scaled up to this size before it is rotated
+WARNING_IMAGE_SIZE = (64, 64)
+WAYPOINT_SPACING = 300  # The drone records a waypoint of a layer when it is farther than this from the last one
+
 
-class Point:
-    def __init__(self, y, x):
-        self.x = x
-        self.y = y
 class Drone:
-    def __init__(self):
-        self.font = pygame.font.SysFont(None, 6)  # Initialize font
-
-        self.image = pygame.image.load(DRONE_PICTURE)
-        self.image = pygame.transform.scale(self.image, (300, 300))  # Scale up the drone image
-        self.warning_light_img = pygame.image.load(WARNING_PICTURE)
-        self.warning_light_img = pygame.transform.scale(self.warning_light_img, (64, 64))  # Scale warning light image
-        self.x = 64 * 1.5
-        self.y = 64 * 1.5
+    def __init__(self, game_map=None, seed=None, sensor_model=None, motion_model=None):
+        # The images are only loaded by load_images when the drone is first drawn, so a headless simulation
+        # never touches pygame
+        self.image = None
+        self.sprites = None
+        self.warning_light_img = None
+        self.map = game_map if game_map is not None else Map()
+        # Start at the center of the home cell of the map
+        home_layer, home_y, home_x = self.map.home
+        self.x = (home_x + 0.5) * self.map.scale
+        self.y = (home_y + 0.5) * self.map.scale
         self.z = 1.5
+        self.radius = DRONE_RADIUS  # The drone is a circle of this radius in pixels for the wall collisions
         self.angle = 0
         self.gyro_angle = 0
         self.pitch = 0
         self.speed = 0
-        self.map = Map()
+        self.vx = 0.0  # The velocity of the last tick, see MotionModel
+        self.vy = 0.0
+        self.motion = motion_model if motion_model is not None else IDEAL_MOTION
+        # Separate streams for the sensor noise and the motion jitter, so changing one model leaves the other as it was
+        sensor_seed, motion_seed = np.random.SeedSequence(seed).spawn(2)
+        self.sensor_noise = NoiseStream(sensor_seed)
+        self.motion_noise = NoiseStream(motion_seed)
         self.moving = False
         self.right_left = 1
         self.timing_change = 0
         self.dangerous_distance = 20
-        self.current_layer = 1
+        self.current_layer = home_layer
         self.current_point = (0, 0)
         self.move_floor = False
-        self.return_home_angle = []
-        self.return_home_speed = []
-        self.spin_back = 0
-        self.visited_positions_1 = set()
-        self.visited_positions_2 = set()
-        self.current_map = []
+        self.target_layer = home_layer  # The layer a floor change in progress moves to
+        # The visited cells of every layer and the waypoints of every layer, keyed by the 1-based layer
+        self.coverage = CoverageMap(self.map)
         self.current_sensor = 0
-        self.points_1 = [Point(self.y, self.x)]
-        self.points_2 = None
-        self.scaled_points_1 = [(int(self.y / self.map.scale), int(self.x / self.map.scale))]
-        self.scaled_points_2 = None
+        self.waypoints = {layer: WaypointBuffer() for layer in range(1, self.map.layers + 1)}
+        self.scans = 0  # Number of scans so far, so a reading is only used once
+        self.scan_pose = None  # The (layer, x, y, gyro_angle) of the last scan
+        self.scan_time = None  # The simulated time of the last scan in seconds
+        self.waypoints[home_layer].append(self.y, self.x)
         self.sensors =[
             [Sensor(-90, 0),Sensor(-45, 0),Sensor(0,0),Sensor(45, 0), Sensor(90, 0),Sensor(90,1), Sensor(-90, 2)],
             [Sensor(-90, 0), Sensor(-70, 0), Sensor(-45, 0),  Sensor(0), Sensor(45, 0), Sensor(70, 0), Sensor(90, 0), Sensor(90, 1), Sensor(-90, 2)],
@@ -51,13 +71,17 @@ class Drone:
              Sensor(-90, 2)],
 
         ]
+        if sensor_model is not None:
+            # One model for every sensor, models of single sensors can be set on Sensor.model afterwards
+            for sensors in self.sensors:
+                for sensor in sensors:
+                    sensor.model = sensor_model
     def draw_sensor_lines(self, screen, minimap_offset_x, minimap_offset_y, minimap_scale):
         """
         Draw sensor lines and distances.
 
-        This function simulates sensor lines from the drone's position and calculates their intersections with walls.
-        It also displays the distance on the intersection point where the sensor hits the wall.
-        It also draws the sensor lines on the minimap.
+        This function draws the sensor lines from the drone's position to the wall each sensor hit in the last scan
+        on the minimap.
 
         Parameters:
         - screen: The pygame screen to draw on.
@@ -69,66 +93,131 @@ class Drone:
         Returns:
         None
         """
-        sensor_angles = self.sensors[self.current_sensor]
-        for sensor_angle in sensor_angles:
-            if sensor_angle.is_up_down == 0:
-                angle = math.radians(self.gyro_angle + sensor_angle.config)
-                for depth in range(1, 1000):
-                    target_x = self.x + math.cos(angle) * depth
-                    target_y = self.y + math.sin(angle) * depth
-                    map_x = int(target_x / self.map.scale)
-                    map_y = int(target_y / self.map.scale)
-                    if self.current_layer == 1:
-                        current_map = APARTMENT1_WALLS
-                    elif self.current_layer == 2:
-                        current_map = APARTMENT2_WALLS
-
-                    if map_x < 0 or map_x >= len(current_map[0]) or map_y < 0 or map_y >= len(current_map):
-                        break
-                    if current_map[map_y][map_x] == 1:
-                        # Draw the sensor line
-
-                        if sensor_angle.is_up_down == 1 or sensor_angle.is_up_down == 2:
-                            color = (0, 255, 0)
-
-                        else:
-                            color = (0, 0, 255)
-                        # Draw the sensor line on the minimap
-                        pygame.draw.line(screen, color,
-                                         (minimap_offset_x + self.x // self.map.scale * minimap_scale,
-                                          minimap_offset_y + self.y // self.map.scale * minimap_scale),
-                                         (minimap_offset_x + target_x // self.map.scale * minimap_scale,
-                                          minimap_offset_y + target_y // self.map.scale * minimap_scale), 2)
-                        break
+        for start, end in self.sensor_line_ends(minimap_offset_x, minimap_offset_y, minimap_scale):
+            # Draw the sensor line on the minimap
+            pygame.draw.line(screen, (0, 0, 255), start, end, 2)
+
+    def sensor_line_ends(self, minimap_offset_x, minimap_offset_y, minimap_scale):
+        """
+        Returns the (start, end) points on the screen of the sensor lines draw_sensor_lines draws on a minimap.
+        """
+        ends = []
+        for sensor in self.sensors[self.current_sensor]:
+            if sensor.is_up_down != 0 or not math.isfinite(sensor.distance):  # No hit or a lost reading
+                continue
+            angle = math.radians(self.gyro_angle + sensor.config)
+            target_x = self.x + math.cos(angle) * sensor.distance
+            target_y = self.y + math.sin(angle) * sensor.distance
+            ends.append(((minimap_offset_x + self.x // self.map.scale * minimap_scale,
+                          minimap_offset_y + self.y // self.map.scale * minimap_scale),
+                         (minimap_offset_x + target_x // self.map.scale * minimap_scale,
+                          minimap_offset_y + target_y // self.map.scale * minimap_scale)))
+        return ends
+
+    def scan(self, time=None):
+        """
+        Reads every sensor of the current configuration with one batched ray query.
+
+        Each sensor casts its sensor ray and the ray of the line drawn on the screen (see Sensor.ray_angles) against
+        the walls, the ceiling or the floor of the current layer. All rays go into a single vectorized call and the
+        distances are stored on the sensors as distance and view_distance, where inf means nothing was hit, and the
+        grid line the sensor ray hit as side. The pose the rays were cast from is kept as scan_pose.
+
+        Sensors with a model that is not exact turn the distance of their sensor ray into a reading of the model,
+        drawn in one batch for all of them, see noise_model.py.
+
+        Parameters:
+        - time (float): The simulated time of the scan in seconds, for the update rates of the sensor models.
+
+        Returns:
+        None
+        """
+        sensors = self.sensors[self.current_sensor]
+        angles = [sensor.ray_angles(self) for sensor in sensors]
+        grids = [[sensor.is_up_down] for sensor in sensors]
+        distances, sides = cast_rays(self.map.sensor_grids[self.current_layer], self.x, self.y, angles, self.map.scale,
+                                 [SENSOR_RANGE, SENSOR_VIEW_RANGE], layers=grids,
+                                 field=self.map.distance_fields[self.current_layer])
+        readings, reading_sides = distances[:, 0], sides[:, 0]
+        if not all(sensor.model.exact for sensor in sensors):
+            readings, reading_sides = self.read_sensors(sensors, readings, reading_sides, time)
+        for sensor, distance, view_distance, side in zip(sensors, readings.tolist(), distances[:, 1].tolist(),
+                                                         reading_sides.tolist()):
+            sensor.distance = distance
+            sensor.view_distance = view_distance
+            sensor.side = side
+        self.scans += 1
+        self.scan_pose = (self.current_layer, self.x, self.y, self.gyro_angle)
+        self.scan_time = time
+
+    def read_sensors(self, sensors, distances, sides, time):
+        """
+        Returns the readings of the sensor models for the exact distances of the sensor rays. Sensors that are not
+        due for a new reading under their update rate keep their last one.
+
+        Returns:
+        - tuple: (readings, sides) arrays in the order of the sensors.
+        """
+        models = [sensor.model for sensor in sensors]
+        readings, sides = sample_readings(distances, sides, [model.noise for model in models],
+                                          [model.dropout for model in models],
+                                          [model.max_range for model in models], self.sensor_noise)
+        for index, (sensor, model) in enumerate(zip(sensors, models)):
+            if model.is_due(sensor.updated_at, time):
+                sensor.updated_at = time
+            else:
+                readings[index] = sensor.distance
+                sides[index] = sensor.side
+        return readings, sides
+
+    def load_images(self, warm=False):
+        """
+        Takes the shared drone and warning light images and the shared cache of rotated drone sprites from the
+        asset manager, which loads, scales and converts every image once.
+
+        Parameters:
+        - warm (bool): Render the rotated sprites in a background thread instead of on first use.
+
+        Returns:
+        None
+        """
+        if self.image is not None:
+            return
+        self.image = get_image(DRONE_PICTURE, DRONE_IMAGE_SIZE)
+        self.sprites = get_sprites(DRONE_PICTURE, DRONE_IMAGE_SIZE, step=SPRITE_ANGLE_STEP,
+                                   max_entries=SPRITE_CACHE_SIZE)
+        if warm:
+            self.sprites.warm(1.2)
+        self.warning_light_img = get_image(WARNING_PICTURE, WARNING_IMAGE_SIZE)
 
     def draw_sensors(self, screen):
+        rects = []
         for sensor in self.sensors[self.current_sensor]:
-            sensor.draw(self, screen)
+            rects.extend(sensor.draw(self, screen))
+        return rects
     def speed_up(self):
-        if self.speed != 2:
-            self.speed += 0.5
+        self.speed = min(self.speed + self.motion.acceleration, self.motion.max_speed)
     def speed_down(self):
-        if self.speed != 0:
-            self.speed -= 0.5
+        self.speed = max(self.speed - self.motion.acceleration, 0)
+    def displacement(self):
+        """
+        Returns how far the drone moves this tick as (dx, dy) in pixels, the velocity of its motion model for the
+        current heading and speed.
+        """
+        self.vx, self.vy = self.motion.velocity(self.vx, self.vy, self.angle, self.speed, self.motion_noise)
+        return self.vx, self.vy
     def update_points(self, layer):
-        if layer == 1:
-            last_point = self.points_1[-1]
-            distance = math.sqrt((self.x - last_point.x) ** 2 + (self.y - last_point.y) ** 2)
-            if distance > 300:
-                self.points_1.append(Point(self.y, self.x,))
-                self.scaled_points_1.append((int(self.y / self.map.scale), int(self.x / self.map.scale)))
-
-        else:
-            if self.points_2 is None:
-                self.points_2 = [Point(self.y, self.x)]
-                self.scaled_points_2= [(int(self.y / self.map.scale), int(self.x / self.map.scale))]
-
+        """
+        Records the drone's position as a waypoint of a layer once it is more than WAYPOINT_SPACING pixels from the
+        last one, or when it is the first position on the layer.
+        """
+        waypoints = self.waypoints[layer]
+        if waypoints.last is not None:
+            last_y, last_x = waypoints.last
+            distance = math.sqrt((self.x - last_x) ** 2 + (self.y - last_y) ** 2)
+            if distance <= WAYPOINT_SPACING:
                 return
-            last_point = self.points_2[-1]
-            distance = math.sqrt((self.x - last_point.x) ** 2 + (self.y - last_point.y) ** 2)
-            if distance > 300:
-                self.points_2.append(Point(self.y, self.x))
-                self.scaled_points_2.append((int(self.y / self.map.scale), int(self.x / self.map.scale)))
+        waypoints.append(self.y, self.x)
 
     def format_rotation(self, rotation_value):
         """
@@ -152,8 +241,9 @@ class Drone:
         """
     Rotates the drone's image to the specified angle and returns the rotated image and its new rectangle.
 
-    This function uses the Pygame library to rotate the drone's image by a specified angle. It also adjusts the
-    rectangle of the rotated image to keep it centered on the screen, accounting for the drone's vertical position.
+    The rotated image is looked up in the sprite cache, which rotates the image with Pygame only the first time an
+    angle is seen. The rectangle of the rotated image is kept centered on the screen, accounting for the drone's
+    vertical position.
 
     Parameters:
     - angle (float): The angle in degrees to rotate the image.
@@ -162,8 +252,10 @@ class Drone:
     - tuple: A tuple containing the rotated image (pygame.Surface) and its new rectangle (pygame.Rect).
     """
 
-        rotated_image = pygame.transform.rotozoom(self.image, -angle, 1.2)
-        rotated_rect = rotated_image.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + int(self.z * 20)))
+        self.load_images()
+        rotated_image, (offset_x, offset_y) = self.sprites.get(angle, 1.2)
+        rotated_rect = rotated_image.get_rect(topleft=(SCREEN_WIDTH // 2 + offset_x,
+                                                       SCREEN_HEIGHT // 2 + int(self.z * 20) + offset_y))
         return rotated_image, rotated_rect
 
     def draw(self, screen):
@@ -177,8 +269,8 @@ class Drone:
     - screen (pygame.Surface): The Pygame surface to draw the drone on.
 
     Returns:
-    None
+    - pygame.Rect: The area the drone was drawn on.
     """
         rotated_drone, rotated_rect = self.rotate_image(self.gyro_angle)
-        screen.blit(rotated_drone, rotated_rect.topleft)
+        return screen.blit(rotated_drone, rotated_rect.topleft)
 
@@ -0,0 +1,509 @@
+"""
+Gymnasium style environments to train controllers against the simulator.
+
+DroneEnv flies the drone of a headless Simulation, with its sensors, battery and map, one action per tick. The
+observation is the readings of the side sensors of the first configuration scaled by the sensor range, the battery
+charge as a fraction and the layer the drone is on. The action is three numbers in [-1, 1]:
+- turn: the change of the heading, a fraction of TURN_RATE degrees.
+- speed: the change of the speed, a fraction of the acceleration of the motion model.
+- climb: above CLIMB_THRESHOLD the drone climbs to the previous layer, below -CLIMB_THRESHOLD it descends to the next
+  one, when it is over a hole that leads there. A floor change, once started, runs to its end like
+  Simulation.change_floor, whatever the next actions are.
+The drone moves like in Simulation.move, a circle sliding along the walls it would hit, see collision.py. The reward
+is NEW_CELL_REWARD for every cell visited for the first time and -COLLISION_PENALTY for every move blocked by a wall,
+whole or in part. An episode terminates when the battery is empty, and is truncated after max_steps ticks.
+
+DroneVecEnv steps many independent drones in lockstep with the same rules, with the state of every environment in
+one NumPy array per quantity, the way Swarm does, so a tick of all environments is a few array operations and one
+batched ray query. An environment whose episode ended is reset in the same step, and its last observation is kept in
+the info under 'final_obs'.
+
+Both are gymnasium.Env and gymnasium.vector.VectorEnv with observation and action spaces when gymnasium is installed,
+and plain classes with the same reset and step methods otherwise:
+    env = DroneVecEnv(16, seed=0)
+    observations, infos = env.reset(seed=0)
+    observations, rewards, terminations, truncations, infos = env.step(env.sample_actions())
+"""
+import math
+
+import numpy as np
+
+try:
+    import gymnasium as gym
+    from gymnasium.vector.utils import batch_space
+except ImportError:  # gymnasium is only needed for the spaces and the wrappers of its ecosystem
+    gym = None
+
+from battery import Battery
+from collision import DRONE_RADIUS, slide_moves
+from distance_field import DistanceField
+from drone import SENSOR_RANGE
+from map import Map
+from noise_model import EXACT_SENSOR, IDEAL_MOTION, NoiseStream, sample_readings
+from raycaster import cast_rays
+from simulation import Simulation, TICK_RATE
+from swarm import SWARM_SENSORS
+
+TURN_RATE = 5  # Degrees the heading changes per tick at a turn action of 1
+CLIMB_THRESHOLD = 0.5  # A climb action beyond this starts a floor change
+NEW_CELL_REWARD = 1.0  # Reward for every cell visited for the first time
+COLLISION_PENALTY = 0.5  # Penalty for every move blocked by a wall
+ACTION_SIZE = 3  # turn, speed, climb
+
+
+def observation_bounds(game_map):
+    """
+    Returns the lowest and highest observation of a drone in a map, the side sensor readings, the battery fraction
+    and the layer.
+
+    Returns:
+    - tuple: (low, high) float32 arrays.
+    """
+    low = np.zeros(len(SWARM_SENSORS) + 2, dtype=np.float32)
+    high = np.ones(len(SWARM_SENSORS) + 2, dtype=np.float32)
+    low[-1] = 1
+    high[-1] = game_map.layers
+    return low, high
+
+
+def scale_readings(distances):
+    """
+    Returns sensor readings as fractions of the sensor range, 1 for no hit and for a lost reading, which shows no
+    obstacle as in the risk checks of the drone.
+    """
+    return np.minimum(np.nan_to_num(distances, nan=np.inf) / SENSOR_RANGE, 1)
+
+
+class DroneEnv(gym.Env if gym is not None else object):
+    """
+    A single drone flying a headless Simulation under the actions of a policy.
+
+    Parameters:
+    - game_map (Map): The map to fly in, the default apartments when None.
+    - battery (Battery): The battery every episode starts with, only its capacity and discharge rate are used, a
+      default battery when None.
+    - sensor_model (SensorModel): The model of every sensor of the drone, exact when None, see noise_model.py.
+    - motion_model (MotionModel): The model of the drone's movement, ideal when None.
+    - max_steps (int): Ticks after which an episode is truncated, None to fly until the battery is empty.
+    - tick_rate (float): Ticks per second of simulated time, for the update rates of the sensor models.
+
+    Attributes:
+    - simulation (Simulation): The simulation of the current episode, new at every reset. Its recorder and mapper
+      work as in Simulation.step, e.g. simulation.record(path) records an episode to replay in the viewer.
+    - observation_space, action_space (gymnasium.spaces.Box): The spaces, only when gymnasium is installed.
+    """
+
+    metadata = {'render_modes': []}
+
+    def __init__(self, game_map=None, battery=None, sensor_model=None, motion_model=None, max_steps=None,
+                 tick_rate=TICK_RATE):
+        self.map = game_map if game_map is not None else Map()
+        self.battery = battery if battery is not None else Battery()
+        self.sensor_model = sensor_model
+        self.motion_model = motion_model
+        self.max_steps = max_steps
+        self.tick_rate = tick_rate
+        self.simulation = None
+        self.low, self.high = observation_bounds(self.map)
+        if gym is not None:
+            self.observation_space = gym.spaces.Box(self.low, self.high, dtype=np.float32)
+            self.action_space = gym.spaces.Box(-1, 1, (ACTION_SIZE,), dtype=np.float32)
+
+    def reset(self, seed=None, options=None):
+        """
+        Starts an episode with a full battery at the home cell of the map.
+
+        Parameters:
+        - seed (int): Seed of the noise of the sensor and motion models, None for a random seed.
+        - options (dict): Unused, for the Gymnasium interface.
+
+        Returns:
+        - tuple: (observation, info).
+        """
+        if gym is not None:
+            super().reset(seed=seed)
+        battery = Battery(self.battery.max_charge, self.battery.discharge_rate)
+        self.simulation = Simulation(seed, battery, self.map, sensor_model=self.sensor_model,
+                                     motion_model=self.motion_model, tick_rate=self.tick_rate)
+        self.simulation.drone.scan(0)
+        return self.observation(), self.info()
+
+    def step(self, action):
+        """
+        Advances the episode by one tick under an action.
+
+        Parameters:
+        - action (array_like): The turn, speed and climb actions, clipped to [-1, 1].
+
+        Returns:
+        - tuple: (observation, reward, terminated, truncated, info).
+        """
+        turn, speed, climb = np.clip(np.asarray(action, dtype=float), -1, 1).tolist()
+        simulation = self.simulation
+        drone = simulation.drone
+        game_map = self.map
+        # The return home at half battery is left to the policy
+        simulation.battery.drain()
+        flying = simulation.battery.charge > 0
+        reward = 0.0
+
+        if not flying:
+            drone.speed = 0
+        else:
+            row, column = int(drone.y / game_map.scale), int(drone.x / game_map.scale)
+            if drone.target_layer == drone.current_layer and abs(climb) > CLIMB_THRESHOLD:
+                layer = drone.current_layer - 1 if climb > 0 else drone.current_layer + 1
+                # A hole to the layer, unless the cell is a wall on the other side
+                reachable = layer in game_map.next_layers(drone.current_layer, row, column)
+                if reachable and not game_map.walls[layer][row, column]:
+                    drone.target_layer = layer
+            drone.move_floor = drone.target_layer != drone.current_layer
+            if drone.move_floor:
+                drone.speed = 0
+                if simulation.change_floor(drone.target_layer):
+                    drone.move_floor = False
+                    drone.update_points(drone.current_layer)
+            else:
+                drone.gyro_angle = drone.format_rotation(drone.gyro_angle + turn * TURN_RATE)
+                drone.angle = math.radians(drone.gyro_angle)
+                drone.speed = min(max(drone.speed + speed * drone.motion.acceleration, 0), drone.motion.max_speed)
+                collisions = simulation.collisions
+                moved = simulation.move(*drone.displacement())
+                reward -= COLLISION_PENALTY * (simulation.collisions - collisions)
+                if moved:
+                    drone.current_point = (int(drone.y / game_map.scale), int(drone.x / game_map.scale))
+                    drone.update_points(drone.current_layer)
+                    if drone.coverage.visit(drone.current_layer, *drone.current_point):
+                        reward += NEW_CELL_REWARD
+
+        simulation.ticks += 1
+        drone.scan(simulation.ticks / simulation.tick_rate)
+        if simulation.mapper is not None:
+            simulation.mapper.integrate(drone)
+        if simulation.recorder is not None:
+            simulation.recorder.write(simulation)
+        truncated = self.max_steps is not None and simulation.ticks >= self.max_steps
+        return self.observation(), reward, not flying, truncated, self.info()
+
+    def observation(self):
+        """
+        Returns the observation of the last scan as a float32 array, see observation_bounds.
+        """
+        drone = self.simulation.drone
+        readings = [sensor.distance for sensor in drone.sensors[drone.current_sensor] if sensor.is_up_down == 0]
+        observation = np.empty(len(self.low), dtype=np.float32)
+        observation[:-2] = scale_readings(np.array(readings))
+        observation[-2] = self.simulation.battery.charge / self.simulation.battery.max_charge
+        observation[-1] = drone.current_layer
+        return observation
+
+    def info(self):
+        """
+        Returns the info of the current tick: the ticks, the visited cells and the collisions of the episode.
+        """
+        simulation = self.simulation
+        return {'ticks': simulation.ticks, 'visited': sum(simulation.drone.coverage.counts.values()),
+                'collisions': simulation.collisions}
+
+    def sample_action(self):
+        """
+        Returns a random action, drawn from the action space when gymnasium is installed.
+        """
+        if gym is not None:
+            return self.action_space.sample()
+        return np.random.uniform(-1, 1, ACTION_SIZE).astype(np.float32)
+
+
+class DroneVecEnv(gym.vector.VectorEnv if gym is not None else object):
+    """
+    Many independent drones stepped in lockstep, with the state of all environments in NumPy arrays.
+
+    Every environment follows the rules of DroneEnv and starts its episodes at the home cell of the map. The
+    environments share the map, its distance field and the noise streams, and never see each other.
+
+    Parameters:
+    - num_envs (int): Number of environments.
+    - game_map (Map): The map to fly in, the default apartments when None.
+    - seed (int): Seed of the noise of the sensor and motion models, None for a random seed.
+    - battery (Battery): The battery every episode starts with, only its capacity and discharge rate are used, a
+      default battery when None.
+    - sensor_model (SensorModel): The model of the sensors of every drone, exact when None.
+    - motion_model (MotionModel): The model of the movement of every drone, ideal when None.
+    - max_steps (int): Ticks after which an episode is truncated, None to fly until the battery is empty.
+    - tick_rate (float): Ticks per second of simulated time, for the update rates of the sensor models.
+
+    Attributes:
+    - x, y (numpy.ndarray): The positions of the drones in pixels.
+    - z (numpy.ndarray): The altitude of the drones, changed while they move between floors.
+    - angle (numpy.ndarray): The headings in degrees.
+    - speed (numpy.ndarray): The speeds in pixels per tick.
+    - layer (numpy.ndarray): The 1-based layer of every drone.
+    - target_layer (numpy.ndarray): The layer every drone moves to, its layer when it is not changing floor.
+    - battery (numpy.ndarray): The charge left in every battery.
+    - distances (numpy.ndarray): The side sensor readings of the last scan, of shape (num_envs, len(SWARM_SENSORS)).
+    - visited (numpy.ndarray): uint8 array of shape (num_envs, layers, height, width), 1 for the cells every
+      environment visited in its episode.
+    - ticks, visits, collisions (numpy.ndarray): The ticks, visited cells and blocked moves of every episode.
+
+    Raises:
+    - ValueError: When num_envs is not positive.
+    """
+
+    metadata = {'render_modes': []}
+    if gym is not None and hasattr(gym.vector, 'AutoresetMode'):
+        metadata['autoreset_mode'] = gym.vector.AutoresetMode.SAME_STEP
+
+    def __init__(self, num_envs, game_map=None, seed=None, battery=None, sensor_model=None, motion_model=None,
+                 max_steps=None, tick_rate=TICK_RATE):
+        if num_envs <= 0:
+            raise ValueError(f'num_envs must be positive, got {num_envs}')
+        self.num_envs = num_envs
+        self.map = game_map if game_map is not None else Map()
+        battery = battery if battery is not None else Battery()
+        self.max_charge = float(battery.max_charge)
+        self.discharge_rate = battery.discharge_rate
+        self.sensor_model = sensor_model if sensor_model is not None else EXACT_SENSOR
+        self.motion = motion_model if motion_model is not None else IDEAL_MOTION
+        self.max_steps = max_steps
+        self.tick_rate = tick_rate
+        self.seed_noise(seed)
+        self.low, self.high = observation_bounds(self.map)
+        if gym is not None:
+            self.single_observation_space = gym.spaces.Box(self.low, self.high, dtype=np.float32)
+            self.single_action_space = gym.spaces.Box(-1, 1, (ACTION_SIZE,), dtype=np.float32)
+            self.observation_space = batch_space(self.single_observation_space, num_envs)
+            self.action_space = batch_space(self.single_action_space, num_envs)
+
+        self.sensor_angles = np.radians(SWARM_SENSORS)
+        self.field = DistanceField(self.map.occupancy)
+        # The holes and walls padded as in Swarm, holes[layer] leads to the next layer and holes[layer - 1] to the
+        # previous one, walls[layer + 1] is the next layer and walls[layer - 1] the previous one
+        no_holes = np.zeros((1, self.map.height, self.map.width), dtype=bool)
+        self.holes = np.concatenate([no_holes, self.map.holes, no_holes])
+        self.walls = np.concatenate([~no_holes, self.map.occupancy, ~no_holes])
+
+        self.x = np.empty(num_envs)
+        self.y = np.empty(num_envs)
+        self.z = np.empty(num_envs)
+        self.angle = np.empty(num_envs)
+        self.speed = np.empty(num_envs)
+        self.vx = np.empty(num_envs)
+        self.vy = np.empty(num_envs)
+        self.layer = np.empty(num_envs, dtype=np.intp)
+        self.target_layer = np.empty(num_envs, dtype=np.intp)
+        self.battery = np.empty(num_envs)
+        self.distances = np.empty((num_envs, len(SWARM_SENSORS)))
+        self.updated_at = np.empty(num_envs)  # Simulated time of the last sensor update of every episode
+        self.visited = np.zeros((num_envs, *self.map.occupancy.shape), dtype=np.uint8)
+        self.ticks = np.empty(num_envs, dtype=np.int64)
+        self.visits = np.empty(num_envs, dtype=np.int64)
+        self.collisions = np.empty(num_envs, dtype=np.int64)
+        self.reset_envs(np.ones(num_envs, dtype=bool))
+
+    def seed_noise(self, seed):
+        """
+        Creates the noise streams of the sensor and motion models from a seed.
+        """
+        sensor_seed, motion_seed = np.random.SeedSequence(seed).spawn(2)
+        self.sensor_noise = NoiseStream(sensor_seed)
+        self.motion_noise = NoiseStream(motion_seed)
+
+    def reset(self, seed=None, options=None):
+        """
+        Starts a new episode in every environment.
+
+        Parameters:
+        - seed (int): Seed of the noise of the sensor and motion models, None to keep the current streams.
+        - options (dict): Unused, for the Gymnasium interface.
+
+        Returns:
+        - tuple: (observations, infos).
+        """
+        if seed is not None:
+            self.seed_noise(seed)
+        self.reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self.observations(), self.infos()
+
+    def reset_envs(self, done):
+        """
+        Puts the drones of the environments of a boolean mask back at the home cell with a full battery, clears
+        their visited cells and scans their sensors.
+        """
+        home_layer, home_y, home_x = self.map.home
+        self.x[done] = (home_x + 0.5) * self.map.scale
+        self.y[done] = (home_y + 0.5) * self.map.scale
+        self.z[done] = 1.5
+        for values in (self.angle, self.speed, self.vx, self.vy, self.ticks, self.visits, self.collisions):
+            values[done] = 0
+        self.layer[done] = home_layer
+        self.target_layer[done] = home_layer
+        self.battery[done] = self.max_charge
+        self.updated_at[done] = np.nan
+        self.visited[done] = 0
+        self.scan(done)
+
+    def step(self, actions):
+        """
+        Advances every environment by one tick, and resets those whose episode ended.
+
+        Parameters:
+        - actions (array_like): The turn, speed and climb actions of every environment, of shape (num_envs, 3),
+          clipped to [-1, 1].
+
+        Returns:
+        - tuple: (observations, rewards, terminations, truncations, infos). The infos hold the ticks, visited
+          cells and collisions of every episode, and the last observations of the ended episodes under 'final_obs'
+          with the mask '_final_obs'.
+        """
+        actions = np.clip(np.asarray(actions, dtype=float).reshape(self.num_envs, ACTION_SIZE), -1, 1)
+        turn, speed, climb = actions.T
+        self.battery = np.maximum(self.battery - self.discharge_rate, 0)
+        flying = self.battery > 0
+        self.speed[~flying] = 0
+        rewards = np.zeros(self.num_envs)
+
+        changing = self.change_floors(flying, climb)
+        steering = flying & ~changing
+        self.angle[steering] = (self.angle[steering] + turn[steering] * TURN_RATE) % 360
+        self.speed[steering] = np.clip(self.speed[steering] + speed[steering] * self.motion.acceleration, 0,
+                                       self.motion.max_speed)
+        self.move(steering, rewards)
+
+        self.ticks += 1
+        self.scan(np.ones(self.num_envs, dtype=bool))
+        observations = self.observations()
+        terminations = ~flying
+        truncations = (np.zeros(self.num_envs, dtype=bool) if self.max_steps is None
+                       else self.ticks >= self.max_steps)
+        infos = self.infos()
+        done = terminations | truncations
+        if done.any():
+            infos['final_obs'] = observations.copy()
+            infos['_final_obs'] = done
+            self.reset_envs(done)
+            observations[done] = self.observations()[done]
+        return observations, rewards, terminations, truncations, infos
+
+    def change_floors(self, active, climb):
+        """
+        Starts a floor change for the drones over a hole whose climb action asks for it, and moves every drone that
+        is changing floor one step, the way Simulation.change_floor does.
+
+        Returns:
+        - numpy.ndarray: Boolean mask of the drones changing floor this tick.
+        """
+        scale = self.map.scale
+        rows, columns = (self.y // scale).astype(np.intp), (self.x // scale).astype(np.intp)
+        # A hole to the previous or the next layer, unless the cell is a wall on the other side
+        to_previous = self.holes[self.layer - 1, rows, columns] & ~self.walls[self.layer - 1, rows, columns]
+        to_next = self.holes[self.layer, rows, columns] & ~self.walls[self.layer + 1, rows, columns]
+        idle = active & (self.target_layer == self.layer)
+        climbing = idle & (climb > CLIMB_THRESHOLD) & to_previous
+        descending = idle & (climb < -CLIMB_THRESHOLD) & to_next
+        self.target_layer[climbing] -= 1
+        self.target_layer[descending] += 1
+
+        changing = active & (self.target_layer != self.layer)
+        self.speed[changing] = 0
+        descending = changing & (self.target_layer > self.layer)
+        climbing = changing & (self.target_layer < self.layer)
+        arrived_down = descending & (self.z < -10)
+        arrived_up = climbing & (self.z > 10)
+        self.z[descending & ~arrived_down] -= 0.5
+        self.z[climbing & ~arrived_up] += 0.5
+        self.z[arrived_down] = 1.5
+        self.z[arrived_up] = -1.5
+        arrived = arrived_down | arrived_up
+        self.layer[arrived] = self.target_layer[arrived]
+        return changing
+
+    def move(self, active, rewards):
+        """
+        Moves the drones with the velocity of the motion model, sliding along the walls like Simulation.move, and
+        rewards the cells visited for the first time in their episode.
+        """
+        scale = self.map.scale
+        motion = self.motion
+        radians = np.radians(self.angle)
+        target_x = np.cos(radians) * self.speed
+        target_y = np.sin(radians) * self.speed
+        # The velocity of the drones that do not steer is left as it was, as a Drone only updates it when it moves
+        if motion.exact:
+            vx, vy = target_x, target_y
+        else:
+            vx = (self.vx + motion.response * (target_x - self.vx)) * (1 - motion.drag)
+            vy = (self.vy + motion.response * (target_y - self.vy)) * (1 - motion.drag)
+            if motion.jitter:
+                # Drawn for the drones that steer only, as a Drone draws it in displacement
+                steering = np.flatnonzero(active)
+                jitter = motion.jitter * self.motion_noise.normal(2 * steering.size)
+                vx[steering] += jitter[:steering.size]
+                vy[steering] += jitter[steering.size:]
+        self.vx[active] = vx[active]
+        self.vy[active] = vy[active]
+        moving = np.flatnonzero(active & ((self.vx != 0) | (self.vy != 0)))
+        move_x, move_y, collided = slide_moves(self.map.occupancy, self.layer[moving] - 1, self.x[moving],
+                                               self.y[moving], self.vx[moving], self.vy[moving], DRONE_RADIUS,
+                                               scale, self.field.clearance)
+        self.collisions[moving] += collided
+        rewards[moving] -= COLLISION_PENALTY * collided
+        moved = np.zeros(self.num_envs, dtype=bool)
+        moved[moving] = (move_x != 0) | (move_y != 0)
+        self.x[moving] += move_x
+        self.y[moving] += move_y
+        rows, columns = (self.y // scale).astype(np.intp), (self.x // scale).astype(np.intp)
+
+        envs = np.flatnonzero(moved)
+        cells = np.ravel_multi_index((envs, self.layer[moved] - 1, rows[moved], columns[moved]), self.visited.shape)
+        flat = self.visited.reshape(-1)
+        new = flat[cells] == 0
+        flat[cells[new]] = 1
+        self.visits[envs[new]] += 1
+        rewards[envs[new]] += NEW_CELL_REWARD
+
+    def scan(self, envs):
+        """
+        Reads the side sensors of the drones of a boolean mask that are due for a new reading under the update rate
+        of the sensor model, with one batched ray query.
+        """
+        model = self.sensor_model
+        time = self.ticks / self.tick_rate
+        if model.update_rate is not None:
+            stale = time - self.updated_at < 1 / model.update_rate - 1e-9  # False for NaN, never updated
+            envs = envs & ~stale
+        if not envs.any():
+            return
+        self.updated_at[envs] = time[envs]
+        angles = np.radians(self.angle[envs])[:, np.newaxis] + self.sensor_angles
+        distances, sides = cast_rays(self.map.occupancy, self.x[envs, np.newaxis], self.y[envs, np.newaxis], angles,
+                                     self.map.scale, SENSOR_RANGE, layers=self.layer[envs, np.newaxis] - 1,
+                                     field=self.field)
+        if not model.exact:
+            distances, _ = sample_readings(distances, sides, model.noise, model.dropout, model.max_range,
+                                           self.sensor_noise)
+        self.distances[envs] = distances
+
+    def observations(self):
+        """
+        Returns the observations of every environment as a float32 array of shape (num_envs, len(SWARM_SENSORS) + 2),
+        see observation_bounds.
+        """
+        observations = np.empty((self.num_envs, len(self.low)), dtype=np.float32)
+        observations[:, :-2] = scale_readings(self.distances)
+        observations[:, -2] = self.battery / self.max_charge
+        observations[:, -1] = self.layer
+        return observations
+
+    def infos(self):
+        """
+        Returns the infos of the current tick: the ticks, visited cells and collisions of every episode.
+        """
+        return {'ticks': self.ticks.copy(), 'visited': self.visits.copy(), 'collisions': self.collisions.copy()}
+
+    def sample_actions(self):
+        """
+        Returns random actions for every environment, drawn from the action space when gymnasium is installed.
+        """
+        if gym is not None:
+            return self.action_space.sample()
+        return np.random.uniform(-1, 1, (self.num_envs, ACTION_SIZE)).astype(np.float32)
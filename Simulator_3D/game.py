@@ -1,33 +1,50 @@
 import pygame
 import math
-import random
-from drone import Drone
-from sensor import Sensor
-from map import Map
+import time
+import numpy as np
 from button import Button
 from world_params import *
-from battery import Battery
+from column_renderer import ColumnRenderer
+from compositor import Compositor, Layer
+from minimap import VisitedMinimap, HoleMinimap, MapperMinimap
+from profiler import FrameProfiler
+from simulation import Simulation
 
-BLACK = (0, 0, 0)
-WHITE = (255, 255, 255)
-GRAY = (128, 128, 128)
-RED = (255, 0, 0)
-BLUE = (0, 0, 255)
-GREEN = (0, 255, 0)
-BROWN = (101, 67, 33)
-D_YELLOW = (204, 204, 0)
+SPEEDS = (1, 2, 5, 10, 20, 50)  # Fast-forward factors the + and - keys step through
+MAX_FRAME_TIME = 0.25  # Longest real time in seconds one frame may catch up on, so a stall is not made up at once
 
 class Game:
-    def __init__(self):  # Initialize the game
+    def __init__(self, simulation=None, warm_sprites=False, replay=None, profiler=None, swarm=None, speed=1,
+                 frame_rate=FRAME_RATE, view=None,
+                 full_redraw=False):  # Initialize the game
         pygame.init()  # Initialize pygame
         pygame.font.init()  # Initialize pygame font
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))  # Set the screen size
-        pygame.display.set_caption("3D Drone Simulation")  # Set the title of the window
-        self.battery = Battery()
+        pygame.display.set_caption(f"3D Drone Simulation x{speed}")  # Set the title of the window
         self.clock = pygame.time.Clock()  # Initialize the clock
         self.running = True  # Set the game to running
-        self.drone = Drone()  # Create the drone
-        self.map = Map()  # Create the map
+        self.simulation = simulation if simulation is not None else Simulation()  # The headless core the game views
+        self.replay = replay  # A FlightReplay shown instead of stepping the simulation, None for a live flight
+        self.swarm = swarm  # A Swarm flying the same map, stepped with the simulation and shown on the main minimap
+        self.speed = speed  # Simulated seconds per real second, the ticks of a frame are simulated without drawing
+        self.frame_rate = frame_rate
+        self.view = view if view is not None else ColumnRenderer()  # Renders the walls of the pseudo-3D view
+        self.accumulator = 0.0  # Ticks owed to the real time that passed, the fraction is the interpolation factor
+        self.previous_pose = None  # The drone's (x, y, gyro_angle) before the last tick of the frame
+        # Times the phases of every frame, off until the HUD is toggled with F3 unless an enabled profiler is given
+        self.profiler = profiler if profiler is not None else FrameProfiler()
+        self.drone = self.simulation.drone
+        self.drone.load_images(warm=warm_sprites)  # Optionally render the rotated drone sprites in the background
+        self.battery = self.simulation.battery
+        self.map = self.simulation.map
+        # The main minimap with the visited cells and the secondary one with the holes between the floors
+        self.minimap = VisitedMinimap(SCREEN_WIDTH - 220, 20, 200, self.map)
+        self.hole_minimap = HoleMinimap(SCREEN_WIDTH - 400, 20, 160, self.map)
+        # The estimated map below the main minimap when the flight is mapped
+        self.mapper_minimap = None
+        if self.simulation.mapper is not None:
+            self.mapper_minimap = MapperMinimap(SCREEN_WIDTH - 220, 40 + self.minimap.map_size[1], 200, self.map,
+                                                self.simulation.mapper)
         self.button_ai = Button('Self-Driver', SCREEN_WIDTH - 950, SCREEN_HEIGHT - 55, 200,
                                 50)  # Create the self-driving button
         self.button_return = Button('Return Home', SCREEN_WIDTH - 700, SCREEN_HEIGHT - 55, 200,
@@ -36,420 +53,296 @@ class Game:
                                      50)  # Create the switch sensors button
         self.button_charge = Button('Charge', SCREEN_WIDTH - 450, SCREEN_HEIGHT - 55, 200,
                                     50)  # Create the charge button
-        self.do_ai = False  # Set the self-driving mode to False
-        self.do_return = False  # Set the return home mode to False
+        # Draws only the layers that changed and presents the dirty rectangles, None to redraw and flip every frame
+        self.compositor = None if full_redraw else self.create_compositor()
 
-    def cast_rays(self):
+    def create_compositor(self):
+        """
+        Creates the compositor of the frames: the view, the warning light, the sensors and the drone as scene layers,
+        the buttons, the battery, the minimaps and the profiler HUD as HUD layers, each with the state its pixels
+        depend on.
+        """
+        drone = self.drone
+        simulation = self.simulation
+        scene_layers = [
+            Layer('view', self.cast_rays, lambda: (drone.x, drone.y, drone.angle, drone.current_layer)),
+            Layer('warning', self.draw_warning, lambda: simulation.warning),
+            Layer('sensors', drone.draw_sensors, lambda: (drone.angle, drone.z, drone.current_layer,
+                                                          self.sensor_state())),
+            Layer('drone', drone.draw, lambda: (drone.gyro_angle, drone.z)),
+        ]
+        hud_layers = [Layer(button.text, button.draw, lambda button=button: button.color,
+                            lambda button=button: button.rect)
+                      for button in (self.button_sensors, self.button_ai, self.button_return, self.button_charge)]
+        hud_layers.append(Layer('battery', self.battery.draw, lambda: self.battery.level(), self.battery.bounds))
+        hud_layers.append(Layer('minimap', self.draw_minimap, lambda: (
+            drone.current_layer, drone.current_point, drone.coverage.counts[drone.current_layer],
+            len(drone.waypoints[drone.current_layer]), simulation.do_return, self.sensor_state(),
+            self.swarm.ticks if self.swarm is not None else None), lambda: self.minimap_bounds(self.minimap)))
+        hud_layers.append(Layer('hole minimap', self.draw_hole_minimap, lambda: (
+            drone.current_layer, drone.current_point, self.sensor_state()),
+            lambda: self.minimap_bounds(self.hole_minimap)))
+        if self.mapper_minimap is not None:
+            hud_layers.append(Layer('mapper minimap', lambda screen: self.mapper_minimap.draw(screen, drone), lambda: (
+                drone.current_layer, simulation.mapper.version, drone.x, drone.y), self.mapper_minimap.bounds))
+        hud_layers.append(Layer('profiler', self.profiler.draw, lambda: self.profiler.hud_frame,
+                                self.profiler.bounds))
+        return Compositor(self.screen, scene_layers, hud_layers)
+
+    def minimap_bounds(self, minimap):
+        """
+        Returns the rectangle a minimap and the sensor lines drawn on it cover, the lines can reach past the minimap
+        when a sensor sees beyond the map.
+        """
+        bounds = minimap.bounds()
+        for start, end in self.drone.sensor_line_ends(minimap.offset_x, minimap.offset_y, minimap.scale):
+            # pygame.draw.line spreads a line of width 2 by a pixel around its ends
+            line = pygame.Rect(min(start[0], end[0]), min(start[1], end[1]), abs(end[0] - start[0]) + 1,
+                               abs(end[1] - start[1]) + 1)
+            bounds.union_ip(line.inflate(4, 4))
+        return bounds
+
+    def sensor_state(self):
+        """
+        Returns what the sensor lines of the view and the minimaps depend on besides the layer: the drone's position
+        and heading, the sensor configuration and the readings of its sensors.
+        """
+        drone = self.drone
+        sensors = drone.sensors[drone.current_sensor]
+        return (drone.x, drone.y, drone.gyro_angle, drone.current_sensor,
+                tuple(sensor.distance for sensor in sensors), tuple(sensor.view_distance for sensor in sensors))
+
+    def cast_rays(self, screen=None):
         """
         Simulates ray casting from the drone's perspective to create a 3D-like view.
+
+        Every column of the view casts a ray with the cell traversal ray caster, which visits each grid cell on the
+        ray's path once and returns the exact distance and side of the wall it hits, and the columns are written
+        into the screen at once by the ColumnRenderer.
+
+        Parameters:
+        - screen (pygame.Surface): The surface to draw on, the screen by default.
+
+        Returns:
+        - pygame.Rect: The area the walls were drawn on.
         """
-        current_map = []
-        ray_angle = self.drone.angle - math.pi / 6  # Start angle for the field of view
-        for ray in range(120):
-            ray_angle += math.pi / 180  # Increment the angle for each ray
-            for depth in range(1, 200):
-                target_x = self.drone.x + math.cos(ray_angle) * depth
-                target_y = self.drone.y + math.sin(ray_angle) * depth
-                map_x = int(target_x / self.map.scale)
-                map_y = int(target_y / self.map.scale)
-
-                if self.drone.current_layer == 1:
-                    current_map = APARTMENT1_WALLS
-                elif self.drone.current_layer == 2:
-                    current_map = APARTMENT2_WALLS
-
-                if current_map[map_y][map_x] == 1:
-                    color = BROWN if self.drone.current_layer == 1 else GRAY
-                    wall_height = SCREEN_HEIGHT / (depth * 0.05)
-                    ceiling_height = -SCREEN_HEIGHT / (depth * 0.05)  # Ceiling height
-                    pygame.draw.rect(self.screen, color, (
-                        ray * (SCREEN_WIDTH // 120), (SCREEN_HEIGHT / 2) - wall_height / 2, SCREEN_WIDTH // 120,
-                        wall_height))
-                    pygame.draw.rect(self.screen, color, (
-                        ray * (SCREEN_WIDTH // 120), (SCREEN_HEIGHT / 2) - wall_height / 2 - ceiling_height,
-                        SCREEN_WIDTH // 120, ceiling_height))
-                    break
-
-    def calculate_risky(self):
+        return self.view.draw(self.screen if screen is None else screen, self.map, self.drone.current_layer,
+                              self.drone.x, self.drone.y, self.drone.angle)
+
+    def draw_warning(self, screen):
         """
-        Determines risky directions based on the drone's sensor data.
+        Draws the warning light while the risk warning is on.
         """
-        sensor_angles = self.drone.sensors[self.drone.current_sensor]
-        sensor_risky = {}
-        for sensor_angle in sensor_angles:
-            if sensor_angle.is_up_down == 1:
-                self.calculate_risky_up_down(True)
-            elif sensor_angle.is_up_down == 2:
-                self.calculate_risky_up_down(False)
-            else:
-                angle = math.radians(self.drone.gyro_angle + sensor_angle.config)
-                for depth in range(1, 50):
-                    target_x = self.drone.x + math.cos(angle) * depth
-                    target_y = self.drone.y + math.sin(angle) * depth
-                    map_x = int(target_x / self.map.scale)
-                    map_y = int(target_y / self.map.scale)
-                    if self.drone.current_layer == 1:
-                        current_map = APARTMENT1_WALLS
-                    elif self.drone.current_layer == 2:
-                        current_map = APARTMENT2_WALLS
-
-                    if map_x < 0 or map_x > 20 or map_y > 20 or map_y < 0:
-                        break
-                    if current_map[map_y][map_x] == 1:
-                        print(f'{sensor_angle}:  {depth}')
-                        if depth < self.drone.dangerous_distance:
-                            sensor_angle.distance = depth
-                            sensor_risky[sensor_angle] = depth
-                            self.screen.blit(self.drone.warning_light_img, (10, 80))
-                        break
-
-        return sensor_risky
-
-    def calculate_risky_up_down(self, is_up):
+        if self.simulation.warning:
+            return screen.blit(self.drone.warning_light_img, (10, 80))
+        return None
+
+    def draw_minimap(self, screen):
         """
-        Determines risky directions based on the drone's sensor data.
+        Draws the main minimap with the swarm on the drone's floor and the sensor lines.
         """
-        if is_up:
-            angle_up = math.radians(self.drone.angle + 90)
-            for depth in range(1, 100):
-                target_x = self.drone.x + math.cos(angle_up) * depth
-                target_y = self.drone.y + math.sin(angle_up) * depth
-                map_x = int(target_x / self.map.scale)
-                map_y = int(target_y / self.map.scale)
-                if map_x < 0 or map_x > 20 or map_y > 20 or map_y < 0:
-                    break
-                if self.drone.current_layer == 1 and APARTMENT2_FLOOR[map_y][map_x] == 1:
-                    print(f'up:  {depth}')
-                    if depth < 1:
-                        self.screen.blit(self.drone.warning_light_img, (10, 80))
-                        break
-                if self.drone.current_layer == 2 and CEILING2_MAP[map_y][map_x] == 1:
-                    if depth < 1:
-                        self.screen.blit(self.drone.warning_light_img, (10, 80))
-                        break
-        else:
-            angle_down = math.radians(self.drone.angle - 90)
-            for depth in range(1, 50):
-                target_x = self.drone.x + math.cos(angle_down) * depth
-                target_y = self.drone.y + math.sin(angle_down) * depth
-                map_x = int(target_x / self.map.scale)
-                map_y = int(target_y / self.map.scale)
-                if map_x < 0 or map_x > 20 or map_y > 20 or map_y < 0:
-                    break
-
-                if self.drone.current_layer == 1 and APARTMENT1_FLOOR[map_y][map_x] == 1:
-                    print(f'down:  {depth}')
-                    if depth < 1:
-                        self.screen.blit(self.drone.warning_light_img, (10, 80))
-                        break
-                if self.drone.current_layer == 2 and APARTMENT2_FLOOR[map_y][map_x] == 1:
-                    if depth < 1:
-                        self.screen.blit(self.drone.warning_light_img, (10, 80))
-                        break
-
-    def autonomous_movement(self):
+        self.minimap.draw(screen, self.drone, self.simulation.do_return)
+        if self.swarm is not None:
+            shown = self.swarm.layer == self.drone.current_layer
+            self.minimap.draw_points(screen, self.swarm.x[shown], self.swarm.y[shown], D_YELLOW)
+        self.drone.draw_sensor_lines(screen, self.minimap.offset_x, self.minimap.offset_y, self.minimap.scale)
+
+    def draw_hole_minimap(self, screen):
         """
-        Controls the autonomous movement of the drone.
+        Draws the minimap of the holes with the sensor lines.
         """
-        if not self.do_ai:
-            return
-        if not self.drone.move_floor:
-            sensor_readings = self.calculate_risky()
-            if sensor_readings:
-                self.drone.moving = False
-                self.drone.speed_down()
-                self.drone.return_home_speed.append(self.drone.speed)
-                min_sensor_dist = min(sensor_readings.values())
-                degree = 0
-                for sensor_angle in sensor_readings:
-                    if sensor_readings[sensor_angle] == min_sensor_dist:
-                        degree = sensor_angle.config
-                if degree < 0:  # Closer to left wall
-
-                    self.drone.gyro_angle = self.drone.format_rotation(self.drone.gyro_angle + 1)  # Rotate right
-                else:  # Closer to right wall
-                    self.drone.gyro_angle = self.drone.format_rotation(self.drone.gyro_angle - 1)  # Rotate left
+        self.hole_minimap.draw(screen, self.drone)
+        self.drone.draw_sensor_lines(screen, self.hole_minimap.offset_x, self.hole_minimap.offset_y,
+                                     self.hole_minimap.scale)
 
-            else:
-                self.drone.moving = True
-
-            if self.drone.moving:
-                self.drone.speed_up()
-                if self.drone.timing_change == 50:
-                    self.drone.right_left *= 1
-                    self.drone.timing_change = 0
-                self.drone.gyro_angle = self.drone.format_rotation(self.drone.gyro_angle +0.5 * self.drone.right_left)
-                self.drone.return_home_speed.append(self.drone.speed)
-                self.drone.timing_change += 1
-                self.drone.angle = math.radians(self.drone.gyro_angle)
-                new_x = self.drone.x + math.cos(self.drone.angle) * self.drone.speed
-                new_y = self.drone.y + math.sin(self.drone.angle) * self.drone.speed
-                if self.drone.current_layer == 1:
-                    self.drone.current_map = APARTMENT1_WALLS
-                elif self.drone.current_layer == 2:
-                    self.drone.current_map = APARTMENT2_WALLS
-
-                if self.drone.current_map[int(new_y / self.map.scale)][int(new_x / self.map.scale)] in [
-                    0]:  # Allow passage through holes
-                    self.drone.x, self.drone.y = new_x, new_y
-                    self.drone.current_point = (int(self.drone.y / self.map.scale), int(self.drone.x / self.map.scale))
-                    if self.drone.current_layer == 1:
-                        self.drone.update_points(1)
-                        self.drone.visited_positions_1.add(
-                            (int(self.drone.y / self.map.scale), int(self.drone.x / self.map.scale)))
-                    elif self.drone.current_layer == 2:
-                        self.drone.update_points(2)
-                        self.drone.visited_positions_2.add(
-                            (int(self.drone.y / self.map.scale), int(self.drone.x / self.map.scale)))
-        if self.drone.move_floor or random.random() < 0.006:
-            if self.drone.current_layer == 1:
-                if APARTMENT2_FLOOR[int(self.drone.y / self.map.scale)][
-                    int(self.drone.x / self.map.scale)] == 2 and random.random() < 0.5:
-                    self.drone.moving = False
-                    self.drone.speed = 0
-                    self.drone.move_floor = True
-                    if self.drone.z >= -10:
-                        self.drone.return_home_speed.append(-1)
-                        self.drone.z -= 0.5
-                    else:
-                        self.drone.return_home_speed.append(-2)
-                        self.drone.z = 1.5
-                        self.drone.current_layer = 2
-                        self.drone.update_points(2)
-                        self.drone.move_floor = False
-                        self.drone.moving = True
-
-            elif self.drone.current_layer == 2:
-                if APARTMENT2_FLOOR[int(self.drone.y / self.map.scale)][
-                    int(self.drone.x / self.map.scale)] == 2 and random.random() < 0.5:
-                    self.drone.moving = False
-                    self.drone.speed = 0
-                    self.drone.move_floor = True
-                    if self.drone.z <= 10:
-                        self.drone.return_home_speed.append(-3)
-                        self.drone.z += 0.5
-                    else:
-                        self.drone.return_home_speed.append(-4)
-                        self.drone.z = -1.5
-                        self.drone.current_layer = 1
-                        self.drone.update_points(1)
-                        self.drone.move_floor = False
-                        self.drone.moving = True
-        if self.drone.gyro_angle >= 180:
-            self.drone.return_home_angle.append(self.drone.gyro_angle - 180)
-        else:
-            self.drone.return_home_angle.append(self.drone.gyro_angle + 180)
-
-    def return_home_movement(self):
+    def draw_frame(self):
         """
-        Controls the drone's movement to return to its starting point.
+        Draws every layer of the frame onto the whole screen, the way every frame is drawn without the compositor.
         """
-        if not self.do_return:
-            return
-        if not self.drone.return_home_angle or not self.drone.return_home_speed:
-            if self.drone.spin_back > 0:
-                self.drone.speed = 0
-                self.drone.gyro_angle = self.drone.format_rotation(self.drone.gyro_angle + 2)
-                self.drone.spin_back -= 2
+        self.screen.fill((0, 0, 0))
+        self.cast_rays()
+        self.profiler.mark('view')
+        self.draw_warning(self.screen)
+        self.drone.draw_sensors(self.screen)
+        self.profiler.mark('sensors')
+        self.drone.draw(self.screen)
+        self.profiler.mark('drone')
+
+        self.button_sensors.draw(self.screen)
+        self.button_ai.draw(self.screen)
+        self.button_return.draw(self.screen)
+        self.button_charge.draw(self.screen)
+        # Draw the battery
+        self.battery.draw(self.screen)
+        self.profiler.mark('ui')
+
+        # Draw the minimaps
+        self.draw_minimap(self.screen)
+        self.draw_hole_minimap(self.screen)
+        if self.mapper_minimap is not None:
+            self.mapper_minimap.draw(self.screen, self.drone)
+        self.profiler.mark('minimaps')
+        self.profiler.draw(self.screen)
+        self.profiler.mark('hud')
+
+    def advance(self, elapsed):
+        """
+        Simulates the ticks that fall into elapsed seconds of real time at the tick rate of the simulation times
+        the speed, with a fixed timestep. The time left over is kept for the next frame, so the simulation keeps its
+        tick rate whatever the frame rate, and a fast-forward simulates the same ticks as a flight at normal speed.
+
+        Parameters:
+        - elapsed (float): The real time since the last frame in seconds.
+
+        Returns:
+        - int: The number of ticks simulated.
+        """
+        self.accumulator += min(elapsed, MAX_FRAME_TIME) * self.simulation.tick_rate * self.speed
+        ticks = int(self.accumulator)
+        self.accumulator -= ticks
+        for tick in range(ticks):
+            if tick == ticks - 1:
+                self.previous_pose = (self.drone.x, self.drone.y, self.drone.gyro_angle)
+            if self.replay is not None:
+                self.replay.step(self.simulation)
             else:
-                self.drone.spin_back = 0
-                self.drone.moving = False
-                self.drone.return_home_speed = []
-                self.drone.return_home_angle = []
-                self.button_return.color = WHITE
-                self.do_return = False
-            return
-
-        while self.drone.spin_back < 180:
-            self.drone.speed = 0
-            self.drone.gyro_angle = self.drone.format_rotation(self.drone.gyro_angle + 2)
-            self.drone.spin_back += 2
-            return
-        self.drone.gyro_angle = self.drone.return_home_angle.pop()
-        pop_speed = self.drone.return_home_speed.pop()
-        if pop_speed == 0:
-            self.drone.speed = 0
-        elif pop_speed == -1:
-            self.drone.speed = 0
-            if self.drone.z <= 10:
-                self.drone.z += 0.5
-        elif pop_speed == -2:
-            self.drone.z = 1.5
-            self.drone.current_layer = 1
-            self.drone.current_map = APARTMENT1_WALLS
-
-        elif pop_speed == -3:
-            self.drone.speed = 0
-            if self.drone.z >= -10:
-                self.drone.z -= 0.5
-        elif pop_speed == -4:
-            self.drone.z = 1.5
-            self.drone.current_map = APARTMENT2_WALLS
-            self.drone.current_layer = 2
-        else:
-            self.drone.speed = pop_speed
-            new_x = self.drone.x + math.cos(self.drone.angle) * self.drone.speed
-            new_y = self.drone.y + math.sin(self.drone.angle) * self.drone.speed
-            self.drone.x, self.drone.y = new_x, new_y
-            self.drone.current_point = (int(self.drone.y / self.map.scale), int(self.drone.x / self.map.scale))
+                self.simulation.step()
+                if self.swarm is not None:
+                    self.swarm.step()
+        return ticks
+
+    def interpolated_pose(self):
+        """
+        Returns the drone's (x, y, gyro_angle) between the last two ticks by the fraction of a tick the frame is
+        drawn after the last one, so the drone moves smoothly when frames are drawn more often than ticks.
+        """
+        drone = self.drone
+        if self.previous_pose is None:
+            return drone.x, drone.y, drone.gyro_angle
+        x, y, gyro_angle = self.previous_pose
+        if math.hypot(drone.x - x, drone.y - y) > self.map.scale:  # Jumped, e.g. a replay seek
+            return drone.x, drone.y, drone.gyro_angle
+        alpha = self.accumulator
+        turn = (drone.gyro_angle - gyro_angle + 180) % 360 - 180  # The short way round
+        return (x + (drone.x - x) * alpha, y + (drone.y - y) * alpha,
+                drone.format_rotation(gyro_angle + turn * alpha))
+
+    def change_speed(self, step):
+        """
+        Moves the fast-forward factor to the next or previous one of SPEEDS.
+        """
+        index = SPEEDS.index(self.speed) if self.speed in SPEEDS else 0
+        self.speed = SPEEDS[min(max(index + step, 0), len(SPEEDS) - 1)]
+        pygame.display.set_caption(f"3D Drone Simulation x{self.speed}")
 
     def draw_map(self):
         """
         Draw the map from a top-down view.
         """
-        for y in range(len(APARTMENT1_WALLS)):
-            for x in range(len(APARTMENT1_WALLS[y])):
-                if self.drone.current_layer == 1 and APARTMENT1_WALLS[y][x] == 1:
-                    pygame.draw.rect(self.screen, BROWN,
-                                     (x * self.map.scale, y * self.map.scale, self.map.scale, self.map.scale))
-                elif self.drone.current_layer == 2 and APARTMENT2_WALLS[y][x] == 1:
-                    pygame.draw.rect(self.screen, GRAY,
-                                     (x * self.map.scale, y * self.map.scale, self.map.scale, self.map.scale))
-
-    def run(self):
+        color = LAYER_COLORS[(self.drone.current_layer - 1) % len(LAYER_COLORS)][0]
+        for y, x in np.argwhere(self.map.walls[self.drone.current_layer]).tolist():
+            pygame.draw.rect(self.screen, color,
+                             (x * self.map.scale, y * self.map.scale, self.map.scale, self.map.scale))
+
+    def run(self, max_frames=None):
         """
         Main game loop for the drone simulation.
 
-        This function handles the main operations of the drone simulation, including event handling, updating the drone's
-        state, rendering the display, and managing the minimap. The loop continues running until the user closes the
-        window.
+        This function handles the main operations of the drone simulation, including event handling, stepping the
+        headless simulation, rendering the display, and managing the minimap. The loop continues running until the
+        user closes the window.
 
         The function performs the following steps:
-        1. Set up minimap scaling and positioning.
-        2. Enter the main loop that runs while the simulation is active.
-        3. Handle user events such as quitting, mouse button clicks, and key presses.
-        4. Update the drone's movement and angle based on user input and autonomous functions.
-        5. Render the screen, including the drone's view, sensors, and minimap.
-        6. Update the display and control the frame rate.
-
-        Variables:
-        - MINIMAP_SCALE: Scaling factor for the minimap.
-        - MINIMAP_OFFSET_X: Horizontal offset for the minimap on the screen.
-        - MINIMAP_OFFSET_Y: Vertical offset for the minimap on the screen.
+        1. Enter the main loop that runs while the simulation is active.
+        2. Handle user events such as quitting, mouse button clicks, and key presses.
+        3. Step the simulation, which moves the drone based on user input and autonomous functions, or play the next
+           ticks of the replay, which the left and right arrow keys scrub. The ticks owed to the real time since the
+           last frame are simulated with a fixed timestep (see advance), the + and - keys fast-forward.
+        4. Render the screen, including the drone's view, sensors, and the cached minimaps, with the drone
+           interpolated between its last two ticks. The compositor draws only the layers whose state changed.
+        5. Update the dirty rectangles of the display, or flip all of it with full_redraw, and control the frame
+           rate.
+
+        Every phase of the frame is timed by the profiler, whose HUD F3 toggles.
+
+        Parameters:
+        - max_frames (int): Stop after this many frames, None to run until the window is closed.
 
         Returns:
         None
         """
 
-        MINIMAP_SCALE = 10  # Increase the scaling factor to make the minimap larger
-        MINIMAP_OFFSET_X = SCREEN_WIDTH - 220  # Adjust the offset to accommodate the new scale
-        MINIMAP_OFFSET_Y = 20
-
+        last_frame = time.perf_counter()
+        frames = 0
         while self.running:
+            self.profiler.begin()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     mouse_x, mouse_y = event.pos
                     if self.button_sensors.rect.collidepoint(mouse_x, mouse_y):
-                        self.drone.current_sensor= (self.drone.current_sensor + 1) % len(self.drone.sensors)
+                        self.simulation.switch_sensors()
                         self.button_sensors.color = GRAY
                     if self.button_ai.rect.collidepoint(mouse_x, mouse_y):
-                        self.do_ai = True
-                        self.do_return = False
-                        self.button_ai.color = GRAY
-                        self.button_return.color = WHITE
+                        self.simulation.start_ai()
                         self.button_sensors.color = WHITE
-
                     if self.button_return.rect.collidepoint(mouse_x, mouse_y):
-                        self.do_return = True
-                        self.do_ai = False
-                        self.button_ai.color = WHITE
-                        self.button_return.color = GRAY
+                        self.simulation.start_return()
                         self.button_sensors.color = WHITE
                     if self.button_charge.rect.collidepoint(mouse_x, mouse_y):
-                        self.battery.is_half = False
-                        self.battery.charge = self.battery.max_charge
-
+                        self.simulation.charge()
+                if event.type == pygame.KEYDOWN and self.replay is not None:
+                    # Scrub the replay 10 seconds back or forward
+                    if event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                        seconds = -10 if event.key == pygame.K_LEFT else 10
+                        self.replay.seek(self.replay.tick + round(seconds * self.simulation.tick_rate), self.simulation)
+                        self.minimap.reset()
+                        if self.compositor is not None:
+                            self.compositor.invalidate()
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED) and self.compositor is not None:
+                    self.compositor.invalidate()  # The window was uncovered, present all of it again
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.profiler.toggle_hud()
+                if event.type == pygame.KEYDOWN and event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self.change_speed(1)
+                if event.type == pygame.KEYDOWN and event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self.change_speed(-1)
+            self.profiler.mark('events')
+
+            now = time.perf_counter()
+            self.advance(now - last_frame)
+            last_frame = now
+            self.profiler.mark('step')
+            self.button_ai.color = GRAY if self.simulation.do_ai else WHITE
+            self.button_return.color = GRAY if self.simulation.do_return else WHITE
+            if self.replay is not None:
+                self.simulation.calculate_risky()  # A replay does not scan in its ticks
+            self.profiler.mark('risk')
+
+            # Draw the drone between its last two ticks, and put it back before the next tick
+            pose = (self.drone.x, self.drone.y, self.drone.gyro_angle, self.drone.angle)
+            self.drone.x, self.drone.y, self.drone.gyro_angle = self.interpolated_pose()
             self.drone.angle = math.radians(self.drone.gyro_angle)
-            if self.battery.drain():
-                self.do_return = True
-                self.do_ai = False
-                self.button_ai.color = WHITE
-                self.button_return.color = GRAY
-
-            self.autonomous_movement()
-            self.return_home_movement()
-
-            self.screen.fill((0, 0, 0))
-            self.cast_rays()
-
-            self.calculate_risky()
-            self.drone.draw_sensors(self.screen)
-            self.drone.draw(self.screen)
-
-            self.button_sensors.draw(self.screen)
-            self.button_ai.draw(self.screen)
-            self.button_return.draw(self.screen)
-            self.button_charge.draw(self.screen)
-            # Draw the battery
-            self.battery.draw(self.screen)
-
-            # Draw the main minimap
-            pygame.draw.rect(self.screen, (255, 255, 255), (
-                MINIMAP_OFFSET_X - 5, MINIMAP_OFFSET_Y - 5, 20 * MINIMAP_SCALE + 10, 20 * MINIMAP_SCALE + 10), 2)
-            for y in range(20):
-                for x in range(20):
-                    color = (0, 0, 0)
-                    if self.drone.current_layer == 1:
-                        if APARTMENT1_WALLS[y][x] == 1:
-                            color = BROWN
-                        if (y, x) in self.drone.visited_positions_1:
-                            color = RED
-                        if (y, x) in self.drone.scaled_points_1:
-                            color = GREEN
-                    else:
-                        if APARTMENT2_WALLS[y][x] == 1:
-                            color = GRAY
-                        if (y, x) in self.drone.visited_positions_2:
-                            color = RED
-                        if (y, x) in self.drone.scaled_points_2:
-                            color = GREEN
-                    if self.do_return:
-                        if (y, x) == self.drone.current_point:
-                            color = BLUE
-
-                    pygame.draw.rect(self.screen, color, (
-                        MINIMAP_OFFSET_X + x * MINIMAP_SCALE, MINIMAP_OFFSET_Y + y * MINIMAP_SCALE, MINIMAP_SCALE,
-                        MINIMAP_SCALE))
-                    # Draw a small white point for the drone's current position
-                    if (y, x) == self.drone.current_point:
-                        center_x = MINIMAP_OFFSET_X + x * MINIMAP_SCALE + MINIMAP_SCALE // 2
-                        center_y = MINIMAP_OFFSET_Y + y * MINIMAP_SCALE + MINIMAP_SCALE // 2
-                        pygame.draw.circle(self.screen, BLACK, (center_x, center_y), MINIMAP_SCALE // 4)
-
-            # Keep the secondary minimap unchanged
-            MINIMAP_SCALE_SECONDARY = 8
-            MINIMAP_OFFSET_X_SECONDARY = SCREEN_WIDTH - 400  # Adjust the offset as needed
-            MINIMAP_OFFSET_Y_SECONDARY = 20
-
-            # Draw the secondary minimap
-            pygame.draw.rect(self.screen, (255, 255, 255), (
-                MINIMAP_OFFSET_X_SECONDARY - 5, MINIMAP_OFFSET_Y_SECONDARY - 5, 20 * MINIMAP_SCALE_SECONDARY + 10,
-                20 * MINIMAP_SCALE_SECONDARY + 10), 2)
-            for y in range(20):
-                for x in range(20):
-                    color = BROWN if self.drone.current_layer == 1 else GRAY
-                    if APARTMENT2_FLOOR[y][x] == 2:
-                        color = BLACK
-                    pygame.draw.rect(self.screen, color, (
-                        MINIMAP_OFFSET_X_SECONDARY + x * MINIMAP_SCALE_SECONDARY,
-                        MINIMAP_OFFSET_Y_SECONDARY + y * MINIMAP_SCALE_SECONDARY, MINIMAP_SCALE_SECONDARY,
-                        MINIMAP_SCALE_SECONDARY))
-                    # Draw a small white point for the drone's current position
-                    if (y, x) == self.drone.current_point:
-                        center_x = MINIMAP_OFFSET_X_SECONDARY + x * MINIMAP_SCALE_SECONDARY + MINIMAP_SCALE_SECONDARY // 2
-                        center_y = MINIMAP_OFFSET_Y_SECONDARY + y * MINIMAP_SCALE_SECONDARY + MINIMAP_SCALE_SECONDARY // 2
-                        pygame.draw.circle(self.screen, D_YELLOW, (center_x, center_y), MINIMAP_SCALE_SECONDARY // 6)
-
-            # Draw sensor lines on the secondary minimap
-            self.drone.draw_sensor_lines(self.screen, MINIMAP_OFFSET_X_SECONDARY , MINIMAP_OFFSET_Y_SECONDARY,
-                                         MINIMAP_SCALE_SECONDARY)
-            self.drone.draw_sensor_lines(self.screen, MINIMAP_OFFSET_X, MINIMAP_OFFSET_Y,
-                                         MINIMAP_SCALE)
-
-            pygame.display.flip()
-            self.clock.tick(30)
+            if self.compositor is not None:
+                rects = self.compositor.compose()
+                self.profiler.mark('compose')
+            else:
+                self.draw_frame()
+            self.drone.x, self.drone.y, self.drone.gyro_angle, self.drone.angle = pose
+
+            if self.compositor is not None:
+                pygame.display.update(rects)  # Only the dirty rectangles
+            else:
+                pygame.display.flip()
+            self.profiler.mark('flip')
+            self.clock.tick(self.frame_rate)
+            self.profiler.mark('wait')
+            self.profiler.end()
             self.button_sensors.color = WHITE
+            frames += 1
+            if max_frames is not None and frames >= max_frames:
+                self.running = False
 
+        self.profiler.close()
         pygame.quit()
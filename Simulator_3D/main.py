@@ -1,5 +1,144 @@
-from game import Game
+import argparse
+import time
+
+START_TIME = time.perf_counter()  # When main.py started, for --startup-time
+
+from assets import preload
+from controller import CONTROLLERS
+from map import load_map
+from mapper import MAPPER_RESOLUTION
+from noise_model import MOTION_MODELS, SENSOR_MODELS
+from recorder import FlightLog, FlightReplay
+from drone import DRONE_IMAGE_SIZE, WARNING_IMAGE_SIZE
+from simulation import Simulation, TICK_RATE
+from swarm import Swarm
+from telemetry import CATEGORIES, LEVELS
+from world_params import DRONE_PICTURE, FOV_RAYS, FRAME_RATE, SCREEN_WIDTH, WARNING_PICTURE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="3D Drone Simulation")
+    parser.add_argument('--headless', action='store_true',
+                        help="run the autonomous flight without a window and print a summary")
+    parser.add_argument('--ticks', type=int, default=10000, help="number of ticks to simulate in headless mode")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the random floor changes")
+    parser.add_argument('--map', metavar='PATH', help="map file to fly in (see map.py), the apartments by default")
+    parser.add_argument('--controller', choices=CONTROLLERS, default='reactive',
+                        help="controller of the autonomous movement")
+    parser.add_argument('--sensor-model', choices=SENSOR_MODELS, default='exact',
+                        help="noise, dropout, range and update rate of the sensors (see noise_model.py)")
+    parser.add_argument('--motion-model', choices=MOTION_MODELS, default='ideal',
+                        help="inertia, drag and jitter of the drone's movement")
+    parser.add_argument('--mapping', type=int, nargs='?', const=MAPPER_RESOLUTION, metavar='PX',
+                        help=f"estimate the map from the sensor readings on a grid of PX pixels "
+                             f"({MAPPER_RESOLUTION} by default), shown on a third minimap")
+    parser.add_argument('--swarm', type=int, metavar='N',
+                        help="fly a swarm of N drones on the same map, alone in headless mode, on the main minimap "
+                             "otherwise")
+    parser.add_argument('--speed', type=int, default=1, metavar='N',
+                        help="fast-forward the viewer N times, the + and - keys change it while it runs")
+    parser.add_argument('--tick-rate', type=float, default=TICK_RATE, metavar='HZ',
+                        help=f"simulation ticks per second of simulated time ({TICK_RATE} by default)")
+    parser.add_argument('--frame-rate', type=int, default=FRAME_RATE, metavar='FPS',
+                        help=f"frames the viewer draws per second ({FRAME_RATE} by default)")
+    parser.add_argument('--view-columns', type=int, default=FOV_RAYS, metavar='N',
+                        help=f"rays of the pseudo-3D view, {FOV_RAYS} by default, {SCREEN_WIDTH} for one per pixel")
+    parser.add_argument('--flat-walls', action='store_true', help="draw the walls without the distance shading")
+    parser.add_argument('--wall-texture', metavar='PATH', help="image to texture the walls of the view with")
+    parser.add_argument('--full-redraw', action='store_true',
+                        help="draw every layer and flip the whole screen every frame instead of the dirty rectangles")
+    parser.add_argument('--warm-sprites', action='store_true',
+                        help="render the rotated drone sprites in a background thread at startup")
+    parser.add_argument('--startup-time', action='store_true',
+                        help="print the seconds from the start of main.py to the first frame and exit")
+    parser.add_argument('--record', metavar='PATH', help="record every tick of the flight into a flight log")
+    parser.add_argument('--replay', metavar='PATH', help="replay a flight log, the arrow keys scrub 10 s")
+    parser.add_argument('--profile', action='store_true', help="show the frame profiler HUD, F3 toggles it")
+    parser.add_argument('--profile-csv', metavar='PATH', help="write the phase times of every frame to a CSV file")
+    parser.add_argument('--telemetry', metavar='TARGET',
+                        help="stream the flight events as JSON lines to a file or to udp://host:port")
+    parser.add_argument('--telemetry-level', choices=LEVELS, default='debug',
+                        help="drop the telemetry events below this level")
+    parser.add_argument('--telemetry-sample', action='append', default=[], metavar='CATEGORY=N',
+                        help=f"keep one event in every N of a category ({', '.join(CATEGORIES)}), repeatable")
+    return parser.parse_args()
+
+
+def parse_sampling(values):
+    """
+    Returns the telemetry sampling rates given as CATEGORY=N strings as a dict.
+
+    Raises:
+    - ValueError: When a value is not of the form CATEGORY=N.
+    """
+    sampling = {}
+    for value in values:
+        category, separator, every = value.partition('=')
+        if not separator or not every.isdigit():
+            raise ValueError(f'invalid telemetry sampling {value!r}, expected CATEGORY=N')
+        sampling[category] = int(every)
+    return sampling
+
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    args = parse_args()
+    if not args.headless:
+        # Read the images while the map and the simulation are set up
+        preload([(DRONE_PICTURE, DRONE_IMAGE_SIZE), (WARNING_PICTURE, WARNING_IMAGE_SIZE)])
+    replay = None
+    if args.replay:
+        replay = FlightReplay(FlightLog(args.replay))
+        args.seed = replay.log.seed
+        args.tick_rate = replay.log.tick_rate
+    game_map = load_map(args.map) if args.map else None
+    sensor_model, motion_model = SENSOR_MODELS[args.sensor_model], MOTION_MODELS[args.motion_model]
+    simulation = Simulation(seed=args.seed, game_map=game_map, controller=args.controller, sensor_model=sensor_model,
+                            motion_model=motion_model, tick_rate=args.tick_rate)
+    if args.record:
+        simulation.record(args.record)
+    if args.mapping:
+        simulation.start_mapping(args.mapping)
+    if args.telemetry:
+        simulation.start_telemetry(args.telemetry, LEVELS[args.telemetry_level], parse_sampling(args.telemetry_sample))
+    swarm = None
+    if args.swarm:
+        swarm = Swarm(args.swarm, game_map=simulation.map, seed=args.seed, sensor_model=sensor_model,
+                      motion_model=motion_model, tick_rate=args.tick_rate)
+    try:
+        if args.headless and swarm is not None:
+            start = time.perf_counter()
+            swarm.step(args.ticks)
+            elapsed = time.perf_counter() - start
+            print(f'{swarm.ticks} ticks of {swarm.count} drones in {elapsed:.1f} s, '
+                  f'{swarm.ticks / args.tick_rate / elapsed:.1f}x real time')
+            print(', '.join(f'{name} {value:.3g}' if isinstance(value, float) else f'{name} {value}'
+                            for name, value in swarm.metrics().items()))
+        elif args.headless:
+            simulation.start_ai()
+            simulation.step(args.ticks)
+            drone = simulation.drone
+            print(f'{simulation.ticks} ticks ({simulation.ticks / simulation.tick_rate:.0f} s simulated), '
+                  f'position ({drone.x:.1f}, {drone.y:.1f}), layer {drone.current_layer}, '
+                  f'battery {simulation.battery.charge:.1f}%')
+            if simulation.mapper is not None:
+                seen = (simulation.mapper.log_odds != 0).sum(axis=(1, 2))
+                print('mapped cells per layer: ' + ', '.join(f'{layer + 1}: {count}'
+                                                            for layer, count in enumerate(seen.tolist())))
+        else:
+            import pygame
+            from column_renderer import ColumnRenderer
+            from game import Game
+            from profiler import FrameProfiler
+
+            profiler = FrameProfiler(show_hud=args.profile, csv_path=args.profile_csv)
+            texture = pygame.image.load(args.wall_texture) if args.wall_texture else None
+            view = ColumnRenderer(args.view_columns, shading=not args.flat_walls, texture=texture)
+            game = Game(simulation, warm_sprites=args.warm_sprites, replay=replay, profiler=profiler, swarm=swarm,
+                        speed=args.speed, frame_rate=args.frame_rate, view=view,
+                        full_redraw=args.full_redraw)
+            game.run(max_frames=1 if args.startup_time else None)
+            if args.startup_time:
+                print(f'first frame after {time.perf_counter() - START_TIME:.3f} s')
+    finally:
+        simulation.stop_recording()
+        simulation.stop_telemetry()
@@ -1,5 +1,269 @@
+"""
+The map the drone flies in: a building of any number of layers (floors), with the walls, floors and ceilings of every
+layer and the holes between them.
+
+Maps are stored as NumPy .npz files with one boolean array per kind of cell and a JSON metadata entry:
+- walls (layers, height, width): the walls of every layer.
+- floors (layers, height, width): the floor of every layer, the floor of a layer is the ceiling of the layer below.
+- ceiling (height, width): the ceiling of the top layer.
+- holes (layers - 1, height, width): the holes between every layer and the next one, where the drone can change
+  layer; holes[k] connects layer k + 1 and layer k + 2.
+- metadata: the format version, the name of the map, the scale (pixels per cell) and the home cell [layer, y, x].
+
+Create a random building and fly in it:
+    python map.py generate 500 building.npz --layers 8
+    python main.py --map building.npz
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from distance_field import DistanceField
+from world_params import *
+
+MAP_FORMAT = 1
+LAYERS = 2  # Layers of a generated building unless asked otherwise
+
+
 class Map:
-    def __init__(self):
-        self.width = 20
-        self.height = 20
-        self.scale = 64
+    """
+    A map backed by NumPy arrays, the default apartments from world_params when no arrays are given.
+
+    The walls of all layers are one occupancy array indexed by layer, and the grids of a layer are looked up in
+    dictionaries keyed by the 1-based layer, so the cost of a tick does not depend on how many layers the building
+    has.
+
+    Parameters:
+    - walls (numpy.ndarray): Boolean stack of shape (layers, height, width).
+    - floors (numpy.ndarray): Boolean stack of shape (layers, height, width).
+    - ceiling (numpy.ndarray): Boolean grid of shape (height, width), the ceiling of the top layer.
+    - holes (numpy.ndarray): Boolean stack of shape (layers - 1, height, width).
+    - scale (int): Size of a cell in pixels.
+    - home (tuple): The cell the drone starts in as (layer, y, x), with a 1-based layer.
+    - name (str): Name of the map.
+
+    Raises:
+    - ValueError: When the arrays do not describe a valid map, see validate.
+    """
+
+    def __init__(self, walls=None, floors=None, ceiling=None, holes=None, scale=64, home=(1, 1, 1),
+                 name='apartments'):
+        if walls is None:
+            walls = np.array([APARTMENT1_WALLS, APARTMENT2_WALLS]) == 1
+            floors = np.array([APARTMENT1_FLOOR, APARTMENT2_FLOOR]) == 1
+            ceiling = np.array(CEILING2_MAP) == 1
+            holes = np.array([APARTMENT2_FLOOR]) == 2
+        walls, floors, ceiling, holes = (np.asarray(grid, dtype=bool) for grid in (walls, floors, ceiling, holes))
+        home = tuple(int(value) for value in home)
+        validate(walls, floors, ceiling, holes, scale, home)
+
+        self.name = name
+        self.layers, self.height, self.width = walls.shape
+        self.scale = scale
+        self.home = home
+        # Solid cells of all layers, walls[layer - 1] is the grid of a layer
+        self.occupancy = walls
+        # Views of the grids of every layer, keyed by the 1-based layer
+        self.walls = {layer: walls[layer - 1] for layer in range(1, self.layers + 1)}
+        self.floors = {layer: floors[layer - 1] for layer in range(1, self.layers + 1)}
+        self.ceilings = {layer: floors[layer] if layer < self.layers else ceiling
+                         for layer in range(1, self.layers + 1)}
+        # Holes between the floors, holes[layer - 1] connects a layer with the next one
+        self.holes = holes
+        # Cells of every layer with a hole to the layer before or after it
+        no_holes = np.zeros((1, self.height, self.width), dtype=bool)
+        self.openings = {layer: np.concatenate([no_holes, holes, no_holes])[layer - 1:layer + 1].any(axis=0)
+                         for layer in self.walls}
+        # The grids of a layer stacked in the order of Sensor.is_up_down (walls, up, down),
+        # so the rays of all sensors can be cast in one query
+        self.sensor_grids = {layer: np.stack([self.walls[layer], self.ceilings[layer], self.floors[layer]])
+                             for layer in self.walls}
+        # Free space index of the stacked grids, built once since the maps never change during a run
+        self.distance_fields = {layer: DistanceField(grids) for layer, grids in self.sensor_grids.items()}
+
+    def nbytes(self):
+        """
+        Returns the memory held by the arrays of the map and its distance fields, in bytes.
+        """
+        total = sum(grids.nbytes for grids in self.sensor_grids.values()) + self.holes.nbytes
+        total += sum(openings.nbytes for openings in self.openings.values())
+        for field in self.distance_fields.values():
+            total += sum(value.nbytes for value in vars(field).values() if isinstance(value, np.ndarray))
+        return total
+
+    def next_layers(self, layer, y, x):
+        """
+        Returns the layers the drone can move to through a hole at a cell of a layer.
+
+        Parameters:
+        - layer (int): The 1-based layer of the cell.
+        - y (int): Row of the cell.
+        - x (int): Column of the cell.
+
+        Returns:
+        - list: The layers after and before the layer that a hole at the cell leads to, empty without a hole.
+        """
+        layers = []
+        if layer < self.layers and self.holes[layer - 1, y, x]:
+            layers.append(layer + 1)
+        if layer > 1 and self.holes[layer - 2, y, x]:
+            layers.append(layer - 1)
+        return layers
+
+
+def validate(walls, floors, ceiling, holes, scale, home):
+    """
+    Checks that arrays describe a map the simulator can fly in.
+
+    Raises:
+    - ValueError: When the shapes do not match, the map has no layer, the outer walls are open, a hole
+      is covered by a floor, the scale is not positive or the home cell is outside the map or inside a wall.
+    """
+    if walls.ndim != 3:
+        raise ValueError(f'walls must have the shape (layers, height, width), got {walls.shape}')
+    layers, height, width = walls.shape
+    if layers < 1:
+        raise ValueError('maps must have at least one layer')
+    if height < 3 or width < 3:
+        raise ValueError(f'maps must be at least 3x3 cells, got {height}x{width}')
+    if floors.shape != walls.shape:
+        raise ValueError(f'floors must have the shape {walls.shape}, got {floors.shape}')
+    if ceiling.shape != (height, width):
+        raise ValueError(f'ceiling must have the shape {(height, width)}, got {ceiling.shape}')
+    if holes.shape != (layers - 1, height, width):
+        raise ValueError(f'holes must have the shape {(layers - 1, height, width)}, got {holes.shape}')
+    border = np.ones((height, width), dtype=bool)
+    border[1:-1, 1:-1] = False
+    if not walls[:, border].all():
+        raise ValueError('the outer walls of every layer must be solid')
+    if (holes & floors[1:]).any():
+        raise ValueError('holes must not be covered by a floor')
+    if scale <= 0:
+        raise ValueError(f'scale must be positive, got {scale}')
+    layer, y, x = home
+    if not (1 <= layer <= layers and 0 <= y < height and 0 <= x < width) or walls[layer - 1, y, x]:
+        raise ValueError(f'home {home} must be a free cell of the map')
+
+
+def load_map(path):
+    """
+    Loads a map from an .npz file, see the module docstring for the format.
+
+    Parameters:
+    - path (str): The map file.
+
+    Returns:
+    - Map: The loaded map.
+
+    Raises:
+    - ValueError: When the file is not a valid map.
+    """
+    with np.load(path) as data:
+        missing = {'walls', 'floors', 'ceiling', 'holes', 'metadata'} - set(data.files)
+        if missing:
+            raise ValueError(f'{path} is missing {", ".join(sorted(missing))}')
+        metadata = json.loads(str(data['metadata']))
+        if metadata.get('format') != MAP_FORMAT:
+            raise ValueError(f'{path} has the unsupported map format {metadata.get("format")}')
+        return Map(data['walls'], data['floors'], data['ceiling'], data['holes'], scale=metadata['scale'],
+                   home=metadata['home'], name=metadata.get('name', os.path.basename(path)))
+
+
+def save_map(game_map, path):
+    """
+    Saves a map to a compressed .npz file.
+
+    Parameters:
+    - game_map (Map): The map to save.
+    - path (str): The map file to write.
+
+    Returns:
+    None
+    """
+    layers = range(1, game_map.layers + 1)
+    metadata = {'format': MAP_FORMAT, 'name': game_map.name, 'scale': game_map.scale, 'home': list(game_map.home)}
+    np.savez_compressed(path,
+                        walls=np.stack([game_map.walls[layer] for layer in layers]),
+                        floors=np.stack([game_map.floors[layer] for layer in layers]),
+                        ceiling=game_map.ceilings[game_map.layers],
+                        holes=game_map.holes,
+                        metadata=np.array(json.dumps(metadata)))
+
+
+def generate_building(size, seed=0, room=12, layers=LAYERS):
+    """
+    Generates a square building: each floor is a grid of rooms with a door in every inner wall, and shafts of 2x2
+    holes connect every floor with the next one.
+
+    Parameters:
+    - size (int): Width and height of the building in cells.
+    - seed (int): Seed of the door and shaft positions.
+    - room (int): Distance between two inner walls, in cells.
+    - layers (int): Number of floors.
+
+    Returns:
+    - Map: The generated map.
+    """
+    rng = np.random.default_rng(seed)
+    walls = np.zeros((layers, size, size), dtype=bool)
+    for layer in range(layers):
+        grid = walls[layer]
+        grid[[0, -1], :] = grid[:, [0, -1]] = True
+        # Shift the rooms of every floor so the floors do not look alike
+        lines = list(range(room // 2 * (layer % 2) + room, size - 1, room))
+        for line in lines:
+            grid[line, :] = grid[:, line] = True
+        # A door in every piece of wall between two crossing walls, so every room can be reached
+        bounds = [0] + lines + [size - 1]
+        for line in lines:
+            for start, end in zip(bounds, bounds[1:]):
+                if end - start > 1:
+                    grid[line, rng.integers(start + 1, end)] = False
+                    grid[rng.integers(start + 1, end), line] = False
+
+    holes = np.zeros((layers - 1, size, size), dtype=bool)
+    shafts = max(1, size * size // 2000)
+    for layer in range(layers - 1):
+        # Draw positions until the shafts of the layer are placed, a shaft needs free cells on both floors
+        placed = 0
+        for _ in range(100 * shafts):
+            y, x = rng.integers(1, size - 2, 2)
+            if not walls[layer:layer + 2, y:y + 2, x:x + 2].any():
+                holes[layer, y:y + 2, x:x + 2] = True
+                placed += 1
+                if placed == shafts:
+                    break
+    floors = np.ones((layers, size, size), dtype=bool)
+    floors[1:] &= ~holes
+    ceiling = np.ones((size, size), dtype=bool)
+    return Map(walls, floors, ceiling, holes, home=(1, 1, 1), name=f'building {size}x{size}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and inspect map files")
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help="generate a random building")
+    generate.add_argument('size', type=int, help="width and height of the building in cells")
+    generate.add_argument('output', help="map file to write, .npz")
+    generate.add_argument('--seed', type=int, default=0, help="seed of the building layout")
+    generate.add_argument('--layers', type=int, default=LAYERS, help="number of floors")
+    export = commands.add_parser('export', help="write the default apartments to a map file")
+    export.add_argument('output', help="map file to write, .npz")
+    info = commands.add_parser('info', help="validate a map file and print its size")
+    info.add_argument('path', help="map file to read")
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        save_map(generate_building(args.size, args.seed, layers=args.layers), args.output)
+    elif args.command == 'export':
+        save_map(Map(), args.output)
+    else:
+        game_map = load_map(args.path)
+        print(f'{game_map.name}: {game_map.layers} layers of {game_map.width}x{game_map.height} cells, '
+              f'scale {game_map.scale}, home {game_map.home}, {game_map.nbytes() / 1e6:.1f} MB in memory')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Builds an estimate of the map from the drone's sensor readings alone, as an occupancy grid per layer.
+
+Every cell of the grid holds the log-odds that it is occupied. A sensor ray lowers the log-odds of the cells it
+crosses, which it saw as free, and raises the log-odds of the cell it hit. Adding log-odds is the Bayesian update of
+independent readings, and clamping them keeps the grid able to change its mind. The grid is finer than the 64
+pixel cells of the map so the walls are placed to within a few pixels.
+
+Map the flight in the viewer, or headless:
+    python main.py --mapping
+    python main.py --mapping 8 --headless --seed 3
+"""
+import math
+
+import numpy as np
+
+from drone import SENSOR_RANGE
+
+MAPPER_RESOLUTION = 16  # Size of a grid cell of the estimated map in pixels, a quarter of a map cell
+LOG_ODDS_HIT = 0.85  # Added to the cell a ray hit
+LOG_ODDS_MISS = -0.4  # Added to the cells a ray crossed
+LOG_ODDS_LIMIT = 5.0  # Bound of the log-odds, so a cell seen many times can still be corrected
+
+
+class OccupancyMapper:
+    """
+    An occupancy grid per layer, updated with batches of sensor rays.
+
+    The rays of an update are traversed cell by cell from the drone to their hit with one NumPy operation, across every
+    grid line they cross like the rays of the ray caster, so every grid cell a ray crosses is updated, however little of
+    it the ray crosses, and every grid cell is updated once per update however many rays crossed it. The work of an
+    update is bounded by the number of rays times the sensor range, not by the size of the map.
+
+    Parameters:
+    - game_map (Map): The map that is estimated, only its size, scale and layer count are used.
+    - resolution (int): Size of a grid cell in pixels.
+    - max_range (float): Range of the sensors in pixels, rays that hit nothing only clear the cells up to it.
+
+    Attributes:
+    - log_odds (numpy.ndarray): float32 array of shape (layers, rows, columns), 0 for the cells never seen.
+    - version (int): Number of updates so far, for views that redraw only when the estimate changed.
+
+    Raises:
+    - ValueError: When the resolution is not positive.
+    """
+
+    def __init__(self, game_map, resolution=MAPPER_RESOLUTION, max_range=SENSOR_RANGE):
+        if resolution <= 0:
+            raise ValueError(f'resolution must be positive, got {resolution}')
+        self.resolution = resolution
+        self.max_range = max_range
+        self.rows = math.ceil(game_map.height * game_map.scale / resolution)
+        self.columns = math.ceil(game_map.width * game_map.scale / resolution)
+        self.log_odds = np.zeros((game_map.layers, self.rows, self.columns), dtype=np.float32)
+        self.version = 0
+        self.integrated_scans = 0
+
+    def update(self, layer, x, y, angles, distances, margins=0, ranges=None):
+        """
+        Fuses a batch of rays cast from one position into the grid of a layer.
+
+        Parameters:
+        - layer (int): The 1-based layer the rays were cast on.
+        - x (float): The x coordinate of the rays' origin in pixels.
+        - y (float): The y coordinate of the rays' origin in pixels.
+        - angles (array_like): The angles of the rays in radians.
+        - distances (array_like): The distance each ray travelled to its hit in pixels, inf when it hit nothing and
+          NaN for a lost reading, which is left out.
+        - margins (array_like): How far short of its hit each ray stops clearing cells and how far past it the
+          obstacle is looked for, in pixels, e.g. three standard deviations of the noise of the reading.
+        - ranges (array_like): The range of the sensor of each ray in pixels, a ray that hit nothing only clears the
+          cells up to it, max_range by default.
+
+        Returns:
+        None
+        """
+        distances = np.asarray(distances, dtype=float)
+        read = ~np.isnan(distances)
+        if not read.any():
+            return
+        angles, distances = np.asarray(angles, dtype=float)[read], distances[read]
+        margins = np.broadcast_to(np.asarray(margins, dtype=float), read.shape)[read]
+        ranges = np.minimum(np.broadcast_to(self.max_range if ranges is None else ranges, read.shape)[read],
+                            self.max_range)
+        cos, sin = np.cos(angles), np.sin(angles)
+        hit = distances < ranges
+        # The cells every ray crossed up to its margin short of the hit, and the cell half a pixel and the margin
+        # past every hit, inside the obstacle
+        free = self.crossed_cells(x, y, cos, sin, np.clip(distances - margins, 0, ranges))
+        behind = distances[hit] + 0.5 + margins[hit]
+        occupied = self.flat_cells(x + cos[hit] * behind, y + sin[hit] * behind)
+
+        # A cell indexed several times is written once with the same value, so every cell is updated once per
+        # batch. A cell both crossed and hit only counts as hit.
+        grid = self.log_odds[layer - 1].reshape(-1)
+        before = grid[occupied]
+        grid[free] = np.maximum(grid[free] + LOG_ODDS_MISS, -LOG_ODDS_LIMIT)
+        grid[occupied] = np.minimum(before + LOG_ODDS_HIT, LOG_ODDS_LIMIT)
+        self.version += 1
+
+    def crossed_cells(self, x, y, cos, sin, lengths):
+        """
+        Returns the flat indices of the grid cells rays from one position cross, every cell once per ray.
+
+        Every ray is cut at the grid lines it crosses, the distances to the vertical and to the horizontal lines
+        merged in order, and each piece between two crossings lies in one cell, found from its middle. A ray through
+        a corner of the grid only touches the cells diagonal to it, which are left out.
+
+        Parameters:
+        - x (float): The x coordinate of the rays' origin in pixels.
+        - y (float): The y coordinate of the rays' origin in pixels.
+        - cos (numpy.ndarray): The cosine of the angle of every ray.
+        - sin (numpy.ndarray): The sine of the angle of every ray.
+        - lengths (numpy.ndarray): The distance every ray is traversed to in pixels.
+
+        Returns:
+        - numpy.ndarray: The flat indices of the cells, see flat_cells.
+        """
+        crossings = [np.zeros((len(lengths), 1)), lengths[:, np.newaxis]]
+        for origin, direction in ((x, cos), (y, sin)):
+            # The grid lines ahead of the origin, from the one the ray crosses first, as many as the longest ray can
+            # cross
+            steps = np.arange(int(np.abs(direction * lengths).max() // self.resolution) + 2)
+            first = math.floor(origin / self.resolution) + (direction > 0)
+            lines = first[:, np.newaxis] + np.where(direction > 0, 1, -1)[:, np.newaxis] * steps
+            with np.errstate(divide='ignore', invalid='ignore'):
+                distances = (lines * self.resolution - origin) / direction[:, np.newaxis]
+            distances[~np.isfinite(distances)] = np.inf  # A ray along the lines never crosses them
+            crossings.append(distances)
+        crossings = np.sort(np.minimum(np.concatenate(crossings, axis=1), lengths[:, np.newaxis]), axis=1)
+        middles = (crossings[:, :-1] + crossings[:, 1:]) / 2
+        pieces = crossings[:, 1:] - crossings[:, :-1] > 1e-9  # Crossings at the same place leave no piece
+        return self.flat_cells(x + (cos[:, np.newaxis] * middles)[pieces], y + (sin[:, np.newaxis] * middles)[pieces])
+
+    def flat_cells(self, xs, ys):
+        """
+        Returns the flat indices in the grid of a layer of the cells points in pixels fall into, clipped to the grid.
+        """
+        rows = np.minimum((np.maximum(ys, 0) / self.resolution).astype(np.intp), self.rows - 1)
+        columns = np.minimum((np.maximum(xs, 0) / self.resolution).astype(np.intp), self.columns - 1)
+        return rows * self.columns + columns
+
+    def integrate(self, drone):
+        """
+        Fuses the new side sensor readings of the drone's last scan, from the position it was scanned at. A scan is
+        only fused once, ticks without a new scan leave the grid as it is.
+
+        Parameters:
+        - drone (Drone): The drone whose readings are fused.
+
+        Returns:
+        None
+        """
+        if drone.scans == self.integrated_scans:
+            return
+        self.integrated_scans = drone.scans
+        layer, x, y, gyro_angle = drone.scan_pose
+        sensors = [sensor for sensor in drone.sensors[drone.current_sensor] if sensor.is_up_down == 0]
+        # A reading kept from an earlier scan under the update rate of its sensor was taken from another position.
+        # Noisy readings keep three standard deviations clear of the hit on both sides and a ray that hit nothing
+        # only shows the cells up to the range of its sensor, like in the frontier controller
+        self.update(layer, x, y, np.radians([gyro_angle + sensor.config for sensor in sensors]),
+                    [sensor.distance if sensor.model.update_rate is None or sensor.updated_at == drone.scan_time
+                     else np.nan for sensor in sensors], [3 * sensor.model.noise for sensor in sensors],
+                    [sensor.model.max_range for sensor in sensors])
+
+    def probabilities(self, layer):
+        """
+        Returns the probability that each grid cell of a layer is occupied, 0.5 for the cells never seen.
+        """
+        return 1 / (1 + np.exp(-self.log_odds[layer - 1]))
@@ -0,0 +1,251 @@
+import numpy as np
+import pygame
+
+from world_params import *
+
+BORDER = 5  # Space between the map cells and the white frame around them
+
+
+class Minimap:
+    """
+    A top-down minimap drawn from cached surfaces instead of one rect per cell every frame.
+
+    The minimap fits the map into a square of size pixels, so a cell is size / max(width, height) pixels and maps of
+    any size can be shown. The parts of the minimap that never change during a run, the frame and the cells of each
+    layer, are rendered once per layer into a static surface. Subclasses can paint cells that change rarely, such as
+    the visited cells, onto an overlay of the layer with one pixel per cell, which is scaled to the minimap only when
+    it changes. Every frame is then a few blits plus the drone's marker.
+
+    Parameters:
+    - offset_x (int): Horizontal position of the first cell on the screen.
+    - offset_y (int): Vertical position of the first cell on the screen.
+    - size (int): Size in pixels of the longest side of the map on the screen.
+    - game_map (Map): The map to draw.
+    """
+
+    def __init__(self, offset_x, offset_y, size, game_map):
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.scale = size / max(game_map.width, game_map.height)
+        self.map = game_map
+        self.map_size = (round(game_map.width * self.scale), round(game_map.height * self.scale))
+        self.static_layers = {}
+        self.overlays = {}
+        self.scaled_overlays = {}
+
+    def reset(self):
+        """
+        Clears the overlays, for when the cells painted on them are no longer valid, e.g. after scrubbing a replay.
+        """
+        self.overlays = {}
+        self.scaled_overlays = {}
+
+    def bounds(self):
+        """
+        Returns the rectangle of the screen the minimap and its frame cover, as a pygame.Rect.
+        """
+        return pygame.Rect(self.offset_x - BORDER, self.offset_y - BORDER, self.map_size[0] + 2 * BORDER,
+                           self.map_size[1] + 2 * BORDER)
+
+    def static_layer(self, layer):
+        """
+        Returns the cached static surface of a layer, rendering it on first use.
+        """
+        if layer not in self.static_layers:
+            cells = pygame.surfarray.make_surface(self.cell_colors(layer).transpose(1, 0, 2))
+            surface = pygame.Surface((self.map_size[0] + 2 * BORDER, self.map_size[1] + 2 * BORDER))
+            surface.fill(BLACK)
+            # Below one pixel per cell, averaging keeps the thin walls of large maps visible
+            resize = pygame.transform.smoothscale if self.scale < 1 else pygame.transform.scale
+            surface.blit(resize(cells, self.map_size), (BORDER, BORDER))
+            pygame.draw.rect(surface, WHITE, surface.get_rect(), 2)
+            self.static_layers[layer] = surface
+        return self.static_layers[layer]
+
+    def overlay(self, layer):
+        """
+        Returns the overlay of a layer, one pixel per cell and transparent until cells are painted on it. The
+        overlay is scaled to the minimap again on the next draw.
+        """
+        if layer not in self.overlays:
+            surface = pygame.Surface((self.map.width, self.map.height))
+            surface.set_colorkey(BLACK)
+            surface.fill(BLACK)
+            self.overlays[layer] = surface
+        self.scaled_overlays.pop(layer, None)
+        return self.overlays[layer]
+
+    def cell_colors(self, layer):
+        """
+        Returns the static colors of the cells of a layer as an array of shape (height, width, 3).
+        """
+        raise NotImplementedError
+
+    def update_overlay(self, drone):
+        """
+        Paints the cells that changed since the last frame onto the overlay of the drone's layer.
+        """
+
+    def draw_marker(self, screen, drone, do_return):
+        """
+        Draws the parts of the minimap that change every frame.
+        """
+
+    def draw(self, screen, drone, do_return=False):
+        """
+        Draws the minimap of the drone's current layer on the screen.
+
+        Parameters:
+        - screen (pygame.Surface): The Pygame surface to draw on.
+        - drone (Drone): The drone whose layer, cells and position are shown.
+        - do_return (bool): Whether the drone is returning home.
+
+        Returns:
+        None
+        """
+        layer = drone.current_layer
+        screen.blit(self.static_layer(layer), (self.offset_x - BORDER, self.offset_y - BORDER))
+        self.update_overlay(drone)
+        if layer in self.overlays:
+            if layer not in self.scaled_overlays:
+                self.scaled_overlays[layer] = pygame.transform.scale(self.overlays[layer], self.map_size)
+            screen.blit(self.scaled_overlays[layer], (self.offset_x, self.offset_y))
+        self.draw_marker(screen, drone, do_return)
+
+    def draw_points(self, screen, xs, ys, color):
+        """
+        Draws a dot at every position in pixels of the map, e.g. the drones of a swarm.
+
+        Parameters:
+        - screen (pygame.Surface): The Pygame surface to draw on.
+        - xs (numpy.ndarray): The x coordinates of the positions.
+        - ys (numpy.ndarray): The y coordinates of the positions.
+        - color (tuple): The color of the dots.
+
+        Returns:
+        None
+        """
+        scale = self.scale / self.map.scale
+        for x, y in zip((self.offset_x + xs * scale).astype(int).tolist(),
+                        (self.offset_y + ys * scale).astype(int).tolist()):
+            screen.fill(color, (x - 1, y - 1, 3, 3))
+
+    def cell_center(self, y, x):
+        return (int(self.offset_x + x * self.scale + self.scale / 2),
+                int(self.offset_y + y * self.scale + self.scale / 2))
+
+
+class VisitedMinimap(Minimap):
+    """
+    The main minimap: the walls of the layer, the visited cells in red and the recorded waypoints in green.
+
+    The visited cells and waypoints only change when the drone reaches a new cell or records a waypoint, so the
+    overlay of a layer is painted again from the coverage grid and the waypoint buffer, with one array operation,
+    only when their counts change.
+    """
+
+    def __init__(self, offset_x, offset_y, size, game_map):
+        super().__init__(offset_x, offset_y, size, game_map)
+        self.painted = {}
+
+    def reset(self):
+        super().reset()
+        self.painted = {}
+
+    def cell_colors(self, layer):
+        colors = np.zeros((self.map.height, self.map.width, 3), dtype=np.uint8)
+        colors[self.map.walls[layer]] = LAYER_COLORS[(layer - 1) % len(LAYER_COLORS)][0]
+        return colors
+
+    def update_overlay(self, drone):
+        layer = drone.current_layer
+        waypoints = drone.waypoints[layer]
+        counts = (drone.coverage.counts[layer], len(waypoints))
+        if counts == self.painted.get(layer, (0, 0)):
+            return
+
+        # The overlay pixels are indexed (x, y)
+        colors = np.zeros((self.map.width, self.map.height, 3), dtype=np.uint8)
+        colors[drone.coverage.grids[layer].T.astype(bool)] = RED
+        cells = waypoints.cells(self.map.scale)
+        colors[cells[:, 1], cells[:, 0]] = GREEN
+        pygame.surfarray.blit_array(self.overlay(layer), colors)
+        self.painted[layer] = counts
+
+    def draw_marker(self, screen, drone, do_return):
+        y, x = drone.current_point
+        if do_return:
+            pygame.draw.rect(screen, BLUE, (self.offset_x + x * self.scale, self.offset_y + y * self.scale,
+                                            max(self.scale, 2), max(self.scale, 2)))
+        # Draw a small point for the drone's current position
+        pygame.draw.circle(screen, BLACK, self.cell_center(y, x), max(int(self.scale) // 4, 2))
+
+
+class HoleMinimap(Minimap):
+    """
+    The secondary minimap: the floor of the layer with the holes to the next and previous floor in black.
+    """
+
+    def cell_colors(self, layer):
+        colors = np.empty((self.map.height, self.map.width, 3), dtype=np.uint8)
+        colors[:] = LAYER_COLORS[(layer - 1) % len(LAYER_COLORS)][0]
+        colors[self.map.openings[layer]] = BLACK
+        return colors
+
+    def draw_marker(self, screen, drone, do_return):
+        # Draw a small point for the drone's current position
+        y, x = drone.current_point
+        pygame.draw.circle(screen, D_YELLOW, self.cell_center(y, x), max(int(self.scale) // 6, 1))
+
+
+class MapperMinimap(Minimap):
+    """
+    The minimap of the estimated map: every grid cell of the occupancy mapper in a shade of gray, white for free,
+    black for occupied and mid gray for the cells not seen yet.
+
+    The grid of the mapper is finer than the cells of the map, so its overlay has one pixel per grid cell. The
+    overlay is painted again from the probabilities of the layer only when the mapper changed, and at most every
+    redraw_interval updates of the mapper, since a scan moves the estimate very little. The overlay follows the
+    updates rather than the draws, so it is the same however often the minimap is drawn in a frame.
+
+    Parameters:
+    - mapper (OccupancyMapper): The mapper whose estimate is shown.
+    - redraw_interval (int): Number of mapper updates between two paintings of the overlay.
+    """
+
+    def __init__(self, offset_x, offset_y, size, game_map, mapper, redraw_interval=5):
+        super().__init__(offset_x, offset_y, size, game_map)
+        self.mapper = mapper
+        self.redraw_interval = redraw_interval
+        self.painted = {}
+
+    def reset(self):
+        super().reset()
+        self.painted = {}
+
+    def cell_colors(self, layer):
+        colors = np.empty((self.map.height, self.map.width, 3), dtype=np.uint8)
+        colors[:] = GRAY
+        return colors
+
+    def overlay(self, layer):
+        if layer not in self.overlays:
+            # Opaque, black is an occupied cell here
+            self.overlays[layer] = pygame.Surface((self.mapper.columns, self.mapper.rows))
+        self.scaled_overlays.pop(layer, None)
+        return self.overlays[layer]
+
+    def update_overlay(self, drone):
+        layer = drone.current_layer
+        if layer in self.painted and self.mapper.version - self.painted[layer] < self.redraw_interval:
+            return
+
+        # The overlay pixels are indexed (x, y)
+        shades = (255 * (1 - self.mapper.probabilities(layer).T)).astype(np.uint8)
+        pygame.surfarray.blit_array(self.overlay(layer), np.repeat(shades[:, :, np.newaxis], 3, axis=2))
+        self.painted[layer] = self.mapper.version
+
+    def draw_marker(self, screen, drone, do_return):
+        position = (int(self.offset_x + drone.x / self.map.scale * self.scale),
+                    int(self.offset_y + drone.y / self.map.scale * self.scale))
+        pygame.draw.circle(screen, RED, position, max(int(self.scale) // 4, 2))
@@ -0,0 +1,192 @@
+"""
+Models of the imperfect sensors and the inertia of a real drone.
+
+A SensorModel turns the exact distance of a sensor ray into a reading: Gaussian noise is added, readings beyond the
+range of the sensor become no hit, some readings drop out (NaN, no reading at all), and a sensor with an update rate
+below the tick rate keeps its last reading between updates. A MotionModel moves the drone with a velocity that
+follows the commanded heading and speed with some lag, drag and jitter. The defaults of both are exact and give the
+same flights as before the models existed.
+
+The random numbers of a drone come from its own NoiseStream, seeded from the seed of its simulation, and are drawn
+from the generator in blocks, so a noisy flight is reproducible, costs one generator call per few thousand samples,
+and episodes in parallel processes never share a stream.
+
+Pick the models of a flight by name:
+    python main.py --sensor-model lidar --motion-model inertial
+"""
+import math
+
+import numpy as np
+
+NOISE_BLOCK = 4096  # Number of samples a NoiseStream draws from its generator at once
+
+
+class NoiseStream:
+    """
+    Standard normal and uniform samples drawn from a seeded NumPy generator in blocks.
+
+    Parameters:
+    - seed (int or numpy.random.SeedSequence): Seed of the generator, None for a random seed.
+    - block (int): Number of samples drawn from the generator at once.
+    """
+
+    def __init__(self, seed=None, block=NOISE_BLOCK):
+        self.generator = np.random.default_rng(seed)
+        self.block = block
+        self.normals = np.empty(0)
+        self.uniforms = np.empty(0)
+        self.next_normal = 0
+        self.next_uniform = 0
+
+    def normal(self, n):
+        """
+        Returns the next n standard normal samples as an array.
+        """
+        if self.next_normal + n > len(self.normals):
+            self.normals = self.generator.standard_normal(max(self.block, n))
+            self.next_normal = 0
+        self.next_normal += n
+        return self.normals[self.next_normal - n:self.next_normal]
+
+    def uniform(self, n):
+        """
+        Returns the next n samples uniform in [0, 1) as an array.
+        """
+        if self.next_uniform + n > len(self.uniforms):
+            self.uniforms = self.generator.random(max(self.block, n))
+            self.next_uniform = 0
+        self.next_uniform += n
+        return self.uniforms[self.next_uniform - n:self.next_uniform]
+
+
+class SensorModel:
+    """
+    The imperfections of a distance sensor.
+
+    Parameters:
+    - noise (float): Standard deviation of the Gaussian noise added to a reading, in pixels.
+    - dropout (float): Probability that a reading is lost, a lost reading is NaN.
+    - max_range (float): Readings beyond this distance in pixels are no hit (inf), the sensor rays stop at
+      drone.SENSOR_RANGE anyway.
+    - update_rate (float): Readings per second, None for a new reading at every scan.
+    """
+
+    def __init__(self, noise=0.0, dropout=0.0, max_range=math.inf, update_rate=None):
+        if noise < 0 or not 0 <= dropout <= 1 or max_range <= 0 or update_rate is not None and update_rate <= 0:
+            raise ValueError(f'invalid sensor model: noise {noise}, dropout {dropout}, max range {max_range}, '
+                             f'update rate {update_rate}')
+        self.noise = noise
+        self.dropout = dropout
+        self.max_range = max_range
+        self.update_rate = update_rate
+
+    @property
+    def exact(self):
+        return self.noise == 0 and self.dropout == 0 and self.max_range == math.inf and self.update_rate is None
+
+    def is_due(self, updated_at, time):
+        """
+        Returns whether a sensor last updated at updated_at seconds takes a new reading at time seconds, always
+        when the time is not known.
+        """
+        if self.update_rate is None or updated_at is None or time is None:
+            return True
+        return time - updated_at >= 1 / self.update_rate - 1e-9
+
+
+class MotionModel:
+    """
+    The acceleration and inertia of the drone.
+
+    speed_up and speed_down change the commanded speed by acceleration up to max_speed. Every tick the velocity of
+    the drone moves towards the commanded heading and speed by the fraction response, loses the fraction drag of
+    itself, and gets Gaussian jitter. response 1, no drag and no jitter move the drone exactly as commanded.
+
+    Parameters:
+    - acceleration (float): Change of the commanded speed per speed_up or speed_down, in pixels per tick.
+    - max_speed (float): Top commanded speed in pixels per tick.
+    - response (float): Fraction of the difference to the commanded velocity made up every tick, in (0, 1].
+    - drag (float): Fraction of the velocity lost every tick, in [0, 1).
+    - jitter (float): Standard deviation of the random change of each velocity component every tick, in pixels
+      per tick.
+    """
+
+    def __init__(self, acceleration=0.5, max_speed=2, response=1.0, drag=0.0, jitter=0.0):
+        if acceleration <= 0 or max_speed <= 0 or not 0 < response <= 1 or not 0 <= drag < 1 or jitter < 0:
+            raise ValueError(f'invalid motion model: acceleration {acceleration}, max speed {max_speed}, '
+                             f'response {response}, drag {drag}, jitter {jitter}')
+        self.acceleration = acceleration
+        self.max_speed = max_speed
+        self.response = response
+        self.drag = drag
+        self.jitter = jitter
+
+    @property
+    def exact(self):
+        return self.response == 1 and self.drag == 0 and self.jitter == 0
+
+    def velocity(self, vx, vy, angle, speed, noise):
+        """
+        Returns the velocity of the next tick.
+
+        Parameters:
+        - vx, vy (float): The velocity of the last tick in pixels per tick.
+        - angle (float): The commanded heading in radians.
+        - speed (float): The commanded speed in pixels per tick.
+        - noise (NoiseStream): The stream the jitter is drawn from.
+
+        Returns:
+        - tuple: The velocity (vx, vy).
+        """
+        target_x = math.cos(angle) * speed
+        target_y = math.sin(angle) * speed
+        if self.exact:
+            return target_x, target_y
+        vx = (vx + self.response * (target_x - vx)) * (1 - self.drag)
+        vy = (vy + self.response * (target_y - vy)) * (1 - self.drag)
+        if self.jitter:
+            jitter_x, jitter_y = noise.normal(2).tolist()
+            vx += self.jitter * jitter_x
+            vy += self.jitter * jitter_y
+        return vx, vy
+
+
+def sample_readings(distances, sides, noise, dropout, max_range, stream):
+    """
+    Turns a batch of exact ray distances into sensor readings.
+
+    Parameters:
+    - distances (numpy.ndarray): The exact distances in pixels, inf for no hit.
+    - sides (numpy.ndarray): The grid line every ray hit, -1 for no hit.
+    - noise, dropout, max_range (array_like): The parameters of the sensor of every ray, see SensorModel, broadcast
+      against distances.
+    - stream (NoiseStream): The stream the samples are drawn from.
+
+    Returns:
+    - tuple: (readings, sides) arrays, the readings are at least 1 pixel, inf beyond the range and NaN when lost,
+      sides is -1 for both.
+    """
+    shape = distances.shape
+    readings = np.maximum(distances + np.asarray(noise) * stream.normal(distances.size).reshape(shape), 1)
+    sides = sides.copy()
+    beyond = readings > max_range
+    readings[beyond] = np.inf
+    lost = stream.uniform(distances.size).reshape(shape) < dropout
+    readings[lost] = np.nan
+    sides[beyond | lost] = -1
+    return readings, sides
+
+
+EXACT_SENSOR = SensorModel()  # The default model of every Sensor
+IDEAL_MOTION = MotionModel()  # The default model of every Drone
+
+# The sensor and motion models main.py and batch_runner.py offer by name
+SENSOR_MODELS = {
+    'exact': EXACT_SENSOR,
+    'lidar': SensorModel(noise=2, dropout=0.01, max_range=800),
+    'sonar': SensorModel(noise=8, dropout=0.05, max_range=300, update_rate=10),
+}
+MOTION_MODELS = {
+    'ideal': IDEAL_MOTION,
+    'inertial': MotionModel(response=0.3, drag=0.02, jitter=0.05),
+}
@@ -0,0 +1,117 @@
+import numpy as np
+
+# Neighbours of a cell on the same layer, as (dy, dx)
+NEIGHBOURS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def home_field(free, holes, home):
+    """
+    Computes the number of cell steps from every cell of every layer to the home cell, with a breadth first search.
+
+    The search expands the whole wavefront at once with NumPy: the flat indices of the wavefront are moved to their
+    four neighbours on the same layer, and through the holes to the same cell of the next or previous layer, and
+    the free cells that were not reached yet become the next wavefront. The work grows with the number of cells, not
+    with the number of cells times the length of the path.
+
+    Parameters:
+    - free (numpy.ndarray): Boolean stack of shape (layers, height, width), True for the free cells of every layer.
+    - holes (numpy.ndarray): Boolean stack of shape (layers - 1, height, width), holes[k] connects the layers k + 1
+      and k + 2.
+    - home (tuple): The home cell as (layer, y, x), with a 1-based layer.
+
+    Returns:
+    - numpy.ndarray: float array of shape (layers, height, width), inf for the cells that cannot reach home.
+    """
+    height, width = free.shape[1:]
+    cells = height * width
+    free_flat = free.ravel()
+    # Whether a cell has a hole to the next layer, and to the previous layer, in the flat indices of free
+    no_holes = np.zeros((1, height, width), dtype=bool)
+    up_flat = np.concatenate([holes, no_holes]).ravel()
+    down_flat = np.concatenate([no_holes, holes]).ravel()
+    field = np.full(free.size, np.inf)
+    layer, y, x = home
+    frontier = np.array([(layer - 1) * cells + y * width + x])
+    field[frontier] = 0
+    steps = 0
+    while frontier.size:
+        steps += 1
+        row, column = np.divmod(frontier % cells, width)
+        grown = np.concatenate([
+            frontier[row > 0] - width,
+            frontier[row < height - 1] + width,
+            frontier[column > 0] - 1,
+            frontier[column < width - 1] + 1,
+            # The same cell of the next and the previous layer
+            frontier[up_flat[frontier]] + cells,
+            frontier[down_flat[frontier]] - cells,
+        ])
+        grown = np.unique(grown)
+        frontier = grown[free_flat[grown] & np.isinf(field[grown])]
+        field[frontier] = steps
+    return field.reshape(free.shape)
+
+
+class ReturnPlanner:
+    """
+    Plans the way home on the grids of the map, shared by every return home of a flight.
+
+    The distance to home of every cell is computed once per home cell and cached, the map never changes during a
+    run. Following the path is then a lookup of the neighbour one step closer to home, so returning takes as long
+    as the shortest path and not as long as the flight.
+
+    Parameters:
+    - game_map (Map): The map to plan on.
+    """
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.free = ~game_map.occupancy
+        self.fields = {}
+
+    def field(self, home):
+        """
+        Returns the cached distance to home field of a home cell, see home_field.
+        """
+        if home not in self.fields:
+            self.fields[home] = home_field(self.free, self.map.holes, home)
+        return self.fields[home]
+
+    def distance(self, home, cell):
+        """
+        Returns the number of cell steps from a cell (layer, y, x) to home, inf when home cannot be reached.
+        """
+        layer, y, x = cell
+        return float(self.field(home)[layer - 1, y, x])
+
+    def next_cell(self, home, cell):
+        """
+        Returns the cell to go to next on the shortest path home.
+
+        The candidates are the four neighbours on the same layer and, on a hole, the same cell of the layers the hole
+        leads to.
+        A cell that is not free itself, which the drone can end up in after changing floors, has no distance to home
+        and goes to the free candidate closest to home, which Simulation.move lets the drone fly into.
+
+        Parameters:
+        - home (tuple): The home cell as (layer, y, x).
+        - cell (tuple): The current cell as (layer, y, x).
+
+        Returns:
+        - tuple: The next cell as (layer, y, x), the cell itself at home, or None when home cannot be reached.
+        """
+        field = self.field(home)
+        layer, y, x = cell
+        best = field[layer - 1, y, x]
+        if best == 0:
+            return cell
+        next_cell = None
+        candidates = [(layer, y + dy, x + dx) for dy, dx in NEIGHBOURS]
+        candidates += [(next_layer, y, x) for next_layer in self.map.next_layers(layer, y, x)]
+        height, width = self.map.height, self.map.width
+        for candidate in candidates:
+            c_layer, c_y, c_x = candidate
+            if 0 <= c_y < height and 0 <= c_x < width and field[c_layer - 1, c_y, c_x] < best:
+                best = field[c_layer - 1, c_y, c_x]
+                next_cell = candidate
+        return next_cell
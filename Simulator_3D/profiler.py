@@ -0,0 +1,164 @@
+import csv
+import time
+from collections import deque
+
+import numpy as np
+import pygame
+
+from text_renderer import get_font
+from world_params import WHITE, BLACK
+
+HUD_REFRESH = 15  # Frames between two updates of the HUD text, rendering text every frame would cost more than it shows
+HUD_POSITION = (10, 160)
+
+
+class FrameProfiler:
+    """
+    Times the phases of every frame of the main loop.
+
+    The loop calls begin at the start of a frame, mark after each phase with the name of the phase, and end once the
+    frame is over. The time between two marks is the time of the phase. The profiler keeps the last window frames
+    of every phase for the HUD and can append every frame to a CSV file. While disabled begin, mark and end return
+    immediately, so the instrumentation can stay in the loop. Timing is on while the HUD is shown or a CSV file is
+    written.
+
+    Parameters:
+    - show_hud (bool): Whether draw shows the HUD.
+    - window (int): Number of frames the percentiles of the HUD are computed over.
+    - csv_path (str): File every frame's phase times are written to, in milliseconds, None for no file.
+
+    Attributes:
+    - enabled (bool): Whether the frames are timed.
+    - phases (dict): The times of the last window frames of each phase, in milliseconds, in the order the phases
+      were first marked.
+    - frame_times (collections.deque): The time between the starts of the last window frames, in milliseconds.
+    """
+
+    def __init__(self, show_hud=False, window=300, csv_path=None):
+        self.show_hud = show_hud
+        self.enabled = show_hud or csv_path is not None
+        self.window = window
+        self.phases = {}
+        self.frame_times = deque(maxlen=window)
+        self.frame = 0
+        self.frame_start = None
+        self.last_mark = None
+        self.current = {}
+        self.csv_file = open(csv_path, 'w', newline='') if csv_path else None
+        self.csv_writer = None
+        self.hud = None
+        self.hud_frame = None  # The frame the HUD was last rendered in
+
+    def toggle_hud(self):
+        """
+        Shows or hides the HUD.
+        """
+        self.show_hud = not self.show_hud
+        self.enabled = self.show_hud or self.csv_file is not None
+        self.frame_start = None
+
+    def begin(self):
+        """
+        Starts the timing of a frame.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.frame_times.append((now - self.frame_start) * 1000)
+        self.frame_start = self.last_mark = now
+        self.current = {}
+
+    def mark(self, phase):
+        """
+        Ends a phase of the frame, it lasted from the previous mark or the start of the frame.
+
+        Parameters:
+        - phase (str): Name of the phase.
+
+        Returns:
+        None
+        """
+        if not self.enabled or self.last_mark is None:
+            return
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0) + (now - self.last_mark) * 1000
+        self.last_mark = now
+
+    def end(self):
+        """
+        Ends the timing of a frame, storing its phase times and writing them to the CSV file.
+        """
+        if not self.enabled or self.last_mark is None:
+            return
+        for phase, duration in self.current.items():
+            if phase not in self.phases:
+                self.phases[phase] = deque(maxlen=self.window)
+            self.phases[phase].append(duration)
+        if self.csv_file is not None:
+            if self.csv_writer is None:
+                self.csv_writer = csv.writer(self.csv_file)
+                self.csv_writer.writerow(['frame'] + list(self.current) + ['total'])
+            self.csv_writer.writerow([self.frame] + [f'{duration:.4f}' for duration in self.current.values()]
+                                     + [f'{sum(self.current.values()):.4f}'])
+        self.frame += 1
+        self.last_mark = None
+
+    def summary(self):
+        """
+        Returns the rolling percentiles of every phase and the frame rate.
+
+        Returns:
+        - dict: The p50, p95 and p99 of each phase in milliseconds as a tuple, and the frames per second under 'fps'.
+        """
+        summary = {phase: tuple(np.percentile(times, [50, 95, 99]).tolist())
+                   for phase, times in self.phases.items() if times}
+        summary['fps'] = 1000 / float(np.mean(self.frame_times)) if self.frame_times else 0.0
+        return summary
+
+    def render_hud(self):
+        """
+        Returns the surface of the HUD, rendered again every HUD_REFRESH frames and cached in between.
+        """
+        if self.hud is None or (self.frame % HUD_REFRESH == 0 and self.hud_frame != self.frame):
+            self.hud_frame = self.frame
+            font = get_font('monospace', 14)  # Not kept, the fonts are dropped when pygame quits
+            summary = self.summary()
+            lines = [f'FPS {summary.pop("fps"):5.1f}      p50    p95    p99 ms']
+            lines += [f'{phase:<10}{p50:7.2f}{p95:7.2f}{p99:7.2f}' for phase, (p50, p95, p99) in summary.items()]
+            line_height = font.get_linesize()
+            width = max(font.size(line)[0] for line in lines)
+            self.hud = pygame.Surface((width + 10, line_height * len(lines) + 10))
+            self.hud.set_alpha(200)
+            self.hud.fill(BLACK)
+            for row, line in enumerate(lines):
+                self.hud.blit(font.render(line, True, WHITE), (5, 5 + row * line_height))
+        return self.hud
+
+    def bounds(self):
+        """
+        Returns the rectangle of the screen the HUD covers, empty while it is hidden.
+        """
+        if not self.show_hud:
+            return pygame.Rect(0, 0, 0, 0)
+        return self.render_hud().get_rect(topleft=HUD_POSITION)
+
+    def draw(self, screen):
+        """
+        Draws the HUD with the FPS and the p50/p95/p99 of every phase. The text is rendered again every HUD_REFRESH
+        frames and blitted from a cached surface in between.
+
+        Parameters:
+        - screen (pygame.Surface): The Pygame surface to draw on.
+
+        Returns:
+        None
+        """
+        if not self.show_hud:
+            return
+        screen.blit(self.render_hud(), HUD_POSITION)
+
+    def close(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
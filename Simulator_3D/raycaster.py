@@ -0,0 +1,261 @@
+import math
+
+import numpy as np
+
+# Rays whose direction is this close to an axis are answered by the axis lookup of the distance field
+AXIS_EPSILON = 1e-9
+# Most jumps a ray makes over open space before the cell traversal takes over, and the shortest jump in cells
+# worth making, shorter ones are cheaper to traverse cell by cell
+SPHERE_STEPS = 8
+SPHERE_MIN_JUMP = 2
+
+
+def cast_ray(grid, x, y, angle, scale, max_depth, min_depth=1):
+    """
+    Casts a single ray through a layer grid using cell traversal (DDA).
+
+    Instead of marching along the ray one pixel at a time, the ray jumps from one grid line to the next one it
+    crosses. Every cell on the ray's path is visited exactly once and the distance to the wall is exact, so the
+    cost depends on the number of cells crossed and not on the distance in pixels.
+
+    Parameters:
+    - grid (list of list of int): The layer grid, a cell equal to 1 is a wall.
+    - x (float): The x coordinate of the ray origin in pixels.
+    - y (float): The y coordinate of the ray origin in pixels.
+    - angle (float): The ray angle in radians.
+    - scale (int): The size of a grid cell in pixels.
+    - max_depth (float): The maximum distance in pixels the ray travels.
+    - min_depth (float): Hits closer than this are reported at this distance, the same way the stepping loops
+      started sampling at depth 1.
+
+    Returns:
+    - tuple: (distance, side, map_x, map_y) of the first wall hit. side is 0 when the ray crossed a vertical grid
+      line and 1 when it crossed a horizontal one. None when no wall is hit within max_depth.
+    """
+    dir_x = math.cos(angle)
+    dir_y = math.sin(angle)
+    pos_x = x / scale
+    pos_y = y / scale
+    map_x = math.floor(pos_x)
+    map_y = math.floor(pos_y)
+    height = len(grid)
+    width = len(grid[0])
+
+    if map_x < 0 or map_x >= width or map_y < 0 or map_y >= height:
+        return None
+    if grid[map_y][map_x] == 1:
+        return min_depth, 0, map_x, map_y
+
+    # Distance along the ray between two vertical (x) or two horizontal (y) grid lines
+    # and the distance to the first one of each.
+    if dir_x == 0:
+        step_x, delta_x, side_x = 0, math.inf, math.inf
+    elif dir_x < 0:
+        step_x, delta_x = -1, -1 / dir_x
+        side_x = (pos_x - map_x) * delta_x
+    else:
+        step_x, delta_x = 1, 1 / dir_x
+        side_x = (map_x + 1 - pos_x) * delta_x
+    if dir_y == 0:
+        step_y, delta_y, side_y = 0, math.inf, math.inf
+    elif dir_y < 0:
+        step_y, delta_y = -1, -1 / dir_y
+        side_y = (pos_y - map_y) * delta_y
+    else:
+        step_y, delta_y = 1, 1 / dir_y
+        side_y = (map_y + 1 - pos_y) * delta_y
+
+    max_distance = max_depth / scale
+    while True:
+        if side_x < side_y:
+            distance = side_x
+            side_x += delta_x
+            map_x += step_x
+            side = 0
+        else:
+            distance = side_y
+            side_y += delta_y
+            map_y += step_y
+            side = 1
+        if distance > max_distance:
+            return None
+        if map_x < 0 or map_x >= width or map_y < 0 or map_y >= height:
+            return None
+        if grid[map_y][map_x] == 1:
+            return max(distance * scale, min_depth), side, map_x, map_y
+
+
+def cast_rays(grids, xs, ys, angles, scale, max_depth, min_depth=1, layers=None, field=None):
+    """
+    Casts a whole batch of rays through one or more layer grids with a single vectorized call.
+
+    This is the NumPy version of cast_ray. All rays advance together one grid line per iteration, so the number of
+    Python level iterations is the number of cells crossed by the longest ray and not the number of rays. Rays that
+    hit a wall or leave the grid drop out of the batch.
+
+    Parameters:
+    - grids (numpy.ndarray): A boolean grid of shape (height, width) where True is a wall, or a stack of such grids
+      of shape (count, height, width) to mix grids in one query.
+    - xs (array_like): The x coordinates of the ray origins in pixels.
+    - ys (array_like): The y coordinates of the ray origins in pixels.
+    - angles (array_like): The ray angles in radians.
+    - scale (int): The size of a grid cell in pixels.
+    - max_depth (array_like): The maximum distance in pixels each ray travels.
+    - min_depth (float): Hits closer than this are reported at this distance.
+    - layers (array_like): The index of the grid in the stack each ray is cast against, only used with a stack.
+    - field (DistanceField): The precomputed distance field of grids. When given, rays first jump over open space by
+      the clearance of the cell they are in (sphere tracing) and rays along an axis are answered with one lookup.
+
+    All of xs, ys, angles, max_depth and layers are broadcast against each other.
+
+    Returns:
+    - tuple: (distances, sides) arrays of the broadcast shape. distances is inf for rays that hit nothing and
+      sides is 0 for a vertical grid line, 1 for a horizontal one and -1 for no hit.
+    """
+    if grids.ndim == 2:
+        grids = grids[np.newaxis]
+        layers = 0
+    xs, ys, angles, max_depth, layers = np.broadcast_arrays(
+        np.asarray(xs, dtype=float), np.asarray(ys, dtype=float), np.asarray(angles, dtype=float),
+        np.asarray(max_depth, dtype=float), np.asarray(layers, dtype=np.intp))
+    shape = xs.shape
+    layers = layers.ravel()
+    max_distance = max_depth.ravel() / scale
+    _, height, width = grids.shape
+
+    dir_x = np.cos(angles.ravel())
+    dir_y = np.sin(angles.ravel())
+    pos_x = xs.ravel() / scale
+    pos_y = ys.ravel() / scale
+    travelled = np.zeros(pos_x.shape)
+    if field is not None:
+        travelled = sphere_trace(field, layers, pos_x, pos_y, dir_x, dir_y, max_distance)
+        pos_x = pos_x + dir_x * travelled
+        pos_y = pos_y + dir_y * travelled
+        max_distance = max_distance - travelled
+    map_x = np.floor(pos_x).astype(np.intp)
+    map_y = np.floor(pos_y).astype(np.intp)
+
+    # Distance along each ray between two vertical (x) or two horizontal (y) grid lines
+    # and the distance to the first one of each.
+    step_x = np.where(dir_x < 0, -1, 1)
+    step_y = np.where(dir_y < 0, -1, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_x = np.abs(1 / dir_x)
+        delta_y = np.abs(1 / dir_y)
+        side_x = np.where(dir_x == 0, np.inf, np.where(dir_x < 0, pos_x - map_x, map_x + 1 - pos_x) * delta_x)
+        side_y = np.where(dir_y == 0, np.inf, np.where(dir_y < 0, pos_y - map_y, map_y + 1 - pos_y) * delta_y)
+
+    distances = np.full(map_x.shape, np.inf)
+    sides = np.full(map_x.shape, -1, dtype=np.int8)
+
+    inside = (map_x >= 0) & (map_x < width) & (map_y >= 0) & (map_y < height)
+    active = np.flatnonzero(inside)
+    start_hit = grids[layers[active], map_y[active], map_x[active]]
+    distances[active[start_hit]] = travelled[active[start_hit]] * scale
+    sides[active[start_hit]] = 0
+    active = active[~start_hit]
+
+    along_axis = None
+    if field is not None:
+        along_axis = (np.abs(dir_x[active]) < AXIS_EPSILON) | (np.abs(dir_y[active]) < AXIS_EPSILON)
+    if along_axis is not None and along_axis.any():
+        looked_up = active[along_axis]
+        distance, side = axis_lookup(field, layers[looked_up], pos_x[looked_up], pos_y[looked_up],
+                                     dir_x[looked_up], dir_y[looked_up])
+        hit = distance <= max_distance[looked_up]
+        distances[looked_up[hit]] = (travelled[looked_up[hit]] + distance[hit]) * scale
+        sides[looked_up[hit]] = side[hit]
+        active = active[~along_axis]
+
+    while active.size:
+        next_x = side_x[active]
+        next_y = side_y[active]
+        use_x = next_x < next_y
+        distance = np.where(use_x, next_x, next_y)
+        side_x[active] = np.where(use_x, next_x + delta_x[active], next_x)
+        side_y[active] = np.where(use_x, next_y, next_y + delta_y[active])
+        map_x[active] += np.where(use_x, step_x[active], 0)
+        map_y[active] += np.where(use_x, 0, step_y[active])
+
+        cell_x = map_x[active]
+        cell_y = map_y[active]
+        alive = ((distance <= max_distance[active]) & (cell_x >= 0) & (cell_x < width)
+                 & (cell_y >= 0) & (cell_y < height))
+        active, distance, use_x = active[alive], distance[alive], use_x[alive]
+
+        hit = grids[layers[active], map_y[active], map_x[active]]
+        distances[active[hit]] = (travelled[active[hit]] + distance[hit]) * scale
+        sides[active[hit]] = np.where(use_x[hit], 0, 1)
+        active = active[~hit]
+
+    distances = np.maximum(distances, min_depth)
+    return distances.reshape(shape), sides.reshape(shape)
+
+
+def sphere_trace(field, layers, pos_x, pos_y, dir_x, dir_y, max_distance):
+    """
+    Moves rays forward over open space using the clearance of the distance field.
+
+    A ray can jump ahead by the clearance of the cell it is in, the smallest distance from any point of that cell to
+    a solid cell, without passing a wall. Rays keep jumping while the clearance is at least SPHERE_MIN_JUMP cells,
+    after that the cell traversal is cheaper.
+
+    Parameters:
+    - field (DistanceField): The distance field of the grids.
+    - layers (numpy.ndarray): The grid index of each ray.
+    - pos_x, pos_y (numpy.ndarray): The ray origins in cells.
+    - dir_x, dir_y (numpy.ndarray): The unit ray directions.
+    - max_distance (numpy.ndarray): The maximum distance of each ray in cells.
+
+    Returns:
+    - numpy.ndarray: The distance in cells each ray moved.
+    """
+    travelled = np.zeros(pos_x.shape)
+    if field.max_clearance < SPHERE_MIN_JUMP:
+        return travelled
+    clearance = field.clearance if field.clearance.ndim == 3 else field.clearance[np.newaxis]
+    _, height, width = clearance.shape
+    active = np.arange(pos_x.size)
+    for _ in range(SPHERE_STEPS):
+        map_x = np.floor(pos_x[active] + dir_x[active] * travelled[active]).astype(np.intp)
+        map_y = np.floor(pos_y[active] + dir_y[active] * travelled[active]).astype(np.intp)
+        inside = (map_x >= 0) & (map_x < width) & (map_y >= 0) & (map_y < height)
+        active, map_x, map_y = active[inside], map_x[inside], map_y[inside]
+        jump = np.minimum(clearance[layers[active], map_y, map_x], max_distance[active] - travelled[active])
+        jumping = jump >= SPHERE_MIN_JUMP
+        active = active[jumping]
+        if not active.size:
+            break
+        travelled[active] += jump[jumping]
+    return travelled
+
+
+def axis_lookup(field, layers, pos_x, pos_y, dir_x, dir_y):
+    """
+    Answers rays that run along the x or the y axis with one lookup in the free run tables of the distance field.
+
+    Parameters:
+    - field (DistanceField): The distance field of the grids.
+    - layers (numpy.ndarray): The grid index of each ray.
+    - pos_x, pos_y (numpy.ndarray): The ray origins in cells, inside the grid and not in a solid cell.
+    - dir_x, dir_y (numpy.ndarray): The unit ray directions, each along an axis.
+
+    Returns:
+    - tuple: (distances, sides), the distance in cells to the wall, inf when the ray leaves the grid, and the side of
+      the hit like cast_rays.
+    """
+    map_x = np.floor(pos_x).astype(np.intp)
+    map_y = np.floor(pos_y).astype(np.intp)
+    along_x = np.abs(dir_y) < np.abs(dir_x)
+    distances = np.full(pos_x.shape, np.inf)
+    for table, blocked, direction, offset in (
+            (field.east, field.east_blocked, along_x & (dir_x > 0), map_x + 1 - pos_x),
+            (field.west, field.west_blocked, along_x & (dir_x < 0), pos_x - map_x),
+            (field.south, field.south_blocked, ~along_x & (dir_y > 0), map_y + 1 - pos_y),
+            (field.north, field.north_blocked, ~along_x & (dir_y < 0), pos_y - map_y)):
+        if table.ndim == 2:
+            table, blocked = table[np.newaxis], blocked[np.newaxis]
+        cells = (layers[direction], map_y[direction], map_x[direction])
+        distances[direction] = np.where(blocked[cells], table[cells] + offset[direction], np.inf)
+    return distances, np.where(along_x, 0, 1).astype(np.int8)
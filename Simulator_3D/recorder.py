@@ -0,0 +1,297 @@
+"""
+Records flights tick by tick into a compact binary log and reads them back for replay.
+
+A log is a fixed size header followed by one fixed size record per tick, so the state of any tick is at a known
+offset of the file. The recorder streams the records to disk in chunks and the reader maps the file into memory,
+which lets a replay jump to any tick of a long flight without reading the whole log or keeping it in RAM.
+
+Record a headless flight and replay it in the viewer:
+    python main.py --headless --seed 3 --record flight.log
+    python main.py --replay flight.log
+"""
+import math
+import mmap
+import struct
+
+import numpy as np
+
+from drone import WAYPOINT_SPACING
+
+MAGIC = b'DRONELOG'
+VERSION = 2  # 2 stores the tick rate as a double, fractional rates were not representable in 1
+# Magic, version, whether a seed is set, seed, tick rate, sensor slots per record and record size in bytes
+HEADER = struct.Struct('<8sHHqdHI')
+# Sensor readings kept per tick, the size of the largest sensor configuration; unused slots are inf
+SENSOR_SLOTS = 9
+# Records buffered in memory before they are written to the file
+CHUNK_SIZE = 1024
+# Records a replay tests at once for the next waypoint, about the ticks between two waypoints
+WAYPOINT_CHUNK = 256
+
+# Bits of the flags field of a record
+FLAG_AI = 1
+FLAG_RETURN = 2
+FLAG_MOVE_FLOOR = 4
+
+RECORD = np.dtype([
+    ('tick', '<u4'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('z', '<f4'),
+    ('gyro_angle', '<f4'),
+    ('speed', '<f4'),
+    ('battery', '<f8'),
+    ('layer', 'u1'),
+    ('sensor', 'u1'),
+    ('flags', 'u1'),
+    ('sensors', '<f4', (SENSOR_SLOTS,)),
+])
+
+
+class FlightRecorder:
+    """
+    Streams the state of a simulation into a binary log, one record per tick.
+
+    Parameters:
+    - path (str): The log file to create.
+    - seed (int): The seed of the simulation, None when it was not seeded.
+    - tick_rate (float): Ticks per second of simulated time.
+    """
+
+    def __init__(self, path, seed, tick_rate):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed is not None, seed or 0, tick_rate, SENSOR_SLOTS,
+                                    RECORD.itemsize))
+        self.buffer = np.zeros(CHUNK_SIZE, dtype=RECORD)
+        self.buffered = 0
+        self.records = 0
+
+    def write(self, simulation):
+        """
+        Appends the current state of the simulation: the drone's pose and speed, its layer, the battery charge, the
+        modes and the sensor readings of the last scan.
+
+        Parameters:
+        - simulation (Simulation): The simulation to record.
+
+        Returns:
+        None
+        """
+        drone = simulation.drone
+        record = self.buffer[self.buffered]
+        record['tick'] = simulation.ticks
+        record['x'] = drone.x
+        record['y'] = drone.y
+        record['z'] = drone.z
+        record['gyro_angle'] = drone.gyro_angle
+        record['speed'] = drone.speed
+        record['battery'] = simulation.battery.charge
+        record['layer'] = drone.current_layer
+        record['sensor'] = drone.current_sensor
+        record['flags'] = (FLAG_AI * simulation.do_ai | FLAG_RETURN * simulation.do_return
+                           | FLAG_MOVE_FLOOR * drone.move_floor)
+        readings = [sensor.distance for sensor in drone.sensors[drone.current_sensor]]
+        record['sensors'] = readings + [np.inf] * (SENSOR_SLOTS - len(readings))
+        self.buffered += 1
+        self.records += 1
+        if self.buffered == CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the file.
+        """
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.file.flush()
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class FlightLog:
+    """
+    A recorded flight mapped into memory, the records of any tick are read without loading the whole log.
+
+    A partial record at the end of the file, left by a flight that was interrupted while writing, is ignored.
+
+    Parameters:
+    - path (str): The log file to open.
+
+    Attributes:
+    - seed (int): The seed of the recorded simulation, None when it was not seeded.
+    - tick_rate (float): Ticks per second of simulated time.
+    - records (numpy.ndarray): Structured array of the records, a view of the mapped file.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, has_seed, seed, self.tick_rate, slots, record_size = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a flight log')
+        if version != VERSION or slots != SENSOR_SLOTS or record_size != RECORD.itemsize:
+            raise ValueError(f'{path} was recorded with an unsupported log format (version {version})')
+        self.seed = seed if has_seed else None
+        count = (len(self.mmap) - HEADER.size) // RECORD.itemsize
+        self.records = np.frombuffer(self.mmap, dtype=RECORD, count=count, offset=HEADER.size)
+
+    def __len__(self):
+        return len(self.records)
+
+    def state(self, tick):
+        """
+        Returns the recorded state of a tick as a dictionary.
+
+        Parameters:
+        - tick (int): Index of the tick, negative values count from the end.
+
+        Returns:
+        - dict: The fields of the record, with the sensor readings as a list.
+        """
+        record = self.records[tick]
+        state = {name: record[name].item() for name in RECORD.names if name != 'sensors'}
+        state['sensors'] = record['sensors'].tolist()
+        return state
+
+    def apply(self, tick, simulation):
+        """
+        Sets the simulation to the recorded state of a tick, in constant time.
+
+        Parameters:
+        - tick (int): Index of the tick.
+        - simulation (Simulation): The simulation to update.
+
+        Returns:
+        None
+        """
+        state = self.state(tick)
+        drone = simulation.drone
+        drone.x, drone.y, drone.z = state['x'], state['y'], state['z']
+        drone.gyro_angle = state['gyro_angle']
+        drone.angle = math.radians(state['gyro_angle'])
+        drone.speed = state['speed']
+        drone.current_layer = state['layer']
+        drone.current_sensor = state['sensor']
+        drone.move_floor = bool(state['flags'] & FLAG_MOVE_FLOOR)
+        drone.current_point = (int(drone.y / simulation.map.scale), int(drone.x / simulation.map.scale))
+        for sensor, distance in zip(drone.sensors[drone.current_sensor], state['sensors']):
+            sensor.distance = distance
+        simulation.battery.charge = state['battery']
+        simulation.do_ai = bool(state['flags'] & FLAG_AI)
+        simulation.do_return = bool(state['flags'] & FLAG_RETURN)
+        simulation.ticks = state['tick'] + 1
+
+    def close(self):
+        self.records = None
+        self.mmap.close()
+
+
+class FlightReplay:
+    """
+    Plays a flight log back into a simulation one tick per frame, with scrubbing to any tick.
+
+    Parameters:
+    - log (FlightLog): The recorded flight.
+
+    Attributes:
+    - tick (int): The next tick to play.
+    - waypoint_ticks (numpy.ndarray): The ticks at which the replay records a waypoint, -1 for the first position,
+      found so far by scan_waypoints.
+    - waypoint_layers (numpy.ndarray): The layer of each of these waypoints.
+    - waypoint_positions (numpy.ndarray): The waypoints as (y, x) rows.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.tick = 0
+        self.waypoint_ticks = np.empty(0, dtype=np.int64)
+        self.waypoint_layers = np.empty(0, dtype=np.intp)
+        self.waypoint_positions = np.empty((0, 2))
+        self.scanned = 0  # The ticks before this one were scanned for waypoints
+        # The last waypoint of every layer, NaN for the layers without one
+        self.last_y = np.full(256, np.nan)
+        self.last_x = np.full(256, np.nan)
+
+    def step(self, simulation):
+        """
+        Applies the next recorded tick, the last one is held once the log ends.
+        """
+        if not len(self.log):
+            return
+        self.log.apply(min(self.tick, len(self.log) - 1), simulation)
+        drone = simulation.drone
+        drone.update_points(drone.current_layer)
+        drone.coverage.visit(drone.current_layer, *drone.current_point)
+        self.tick = min(self.tick + 1, len(self.log))
+
+    def scan_waypoints(self, end):
+        """
+        Finds the waypoints the replay records over the ticks before end, where the scan stopped last time, so a
+        log is scanned once whatever the seeks. The ticks are compared in chunks with NumPy to the last waypoint of
+        their layer, see Drone.update_points, and the first one far enough from it becomes the next waypoint.
+
+        Parameters:
+        - end (int): The tick to scan up to, excluded.
+
+        Returns:
+        None
+        """
+        records = self.log.records
+        ticks, layers, positions = [], [], []
+        if not self.scanned and not len(self.waypoint_ticks):
+            first = records[0]
+            ticks.append(-1)
+            layers.append(int(first['layer']))
+            positions.append((float(first['y']), float(first['x'])))
+            self.last_y[layers[-1]], self.last_x[layers[-1]] = positions[-1]
+        while self.scanned < end:
+            chunk = records[self.scanned:min(self.scanned + WAYPOINT_CHUNK, end)]
+            chunk_layers = chunk['layer'].astype(np.intp)
+            distance = np.sqrt((chunk['x'] - self.last_x[chunk_layers]) ** 2
+                               + (chunk['y'] - self.last_y[chunk_layers]) ** 2)
+            # NaN for a layer without a waypoint yet, which records one as well
+            far = np.flatnonzero(~(distance <= WAYPOINT_SPACING))
+            if not far.size:
+                self.scanned += len(chunk)
+                continue
+            index = int(far[0])
+            ticks.append(self.scanned + index)
+            layers.append(int(chunk_layers[index]))
+            positions.append((float(chunk['y'][index]), float(chunk['x'][index])))
+            self.last_y[layers[-1]], self.last_x[layers[-1]] = positions[-1]
+            self.scanned += index + 1
+        if ticks:
+            self.waypoint_ticks = np.concatenate([self.waypoint_ticks, ticks])
+            self.waypoint_layers = np.concatenate([self.waypoint_layers, layers])
+            self.waypoint_positions = np.concatenate([self.waypoint_positions, positions])
+
+    def seek(self, tick, simulation):
+        """
+        Jumps to a tick. The state is read in constant time; the visited cells drawn on the minimap are rebuilt from
+        the records before it, and the waypoints are sliced from those of scan_waypoints.
+
+        Parameters:
+        - tick (int): The tick to jump to, clamped to the log.
+        - simulation (Simulation): The simulation to update.
+
+        Returns:
+        None
+        """
+        if not len(self.log):
+            return
+        self.tick = max(0, min(tick, len(self.log) - 1))
+        drone = simulation.drone
+        scale = simulation.map.scale
+        history = self.log.records[:self.tick]
+        drone.coverage.set_cells(history['layer'], (history['y'] // scale).astype(int),
+                                 (history['x'] // scale).astype(int))
+
+        self.scan_waypoints(self.tick)
+        count = int(np.searchsorted(self.waypoint_ticks, self.tick))
+        layers, positions = self.waypoint_layers[:count], self.waypoint_positions[:count]
+        for layer, waypoints in drone.waypoints.items():
+            waypoints.set(positions[layers == layer])
+        self.step(simulation)
@@ -1,6 +1,8 @@
 import pygame
 import math
 from world_params import *
+from noise_model import EXACT_SENSOR
+from text_renderer import get_renderer
 
 
 class Sensor:
@@ -22,11 +24,34 @@ class Sensor:
     None
     """
 
-    def __init__(self, confing, is_up_down=0):
-        self.font = pygame.font.SysFont(None, 24)  # Initialize font
+    def __init__(self, confing, is_up_down=0, model=None):
+        self.model = model if model is not None else EXACT_SENSOR  # How the readings differ from the exact distance
+        self.updated_at = None  # Simulated time in seconds of the last reading, for the update rate of the model
         self.is_up_down = is_up_down
         self.config = confing
-        self.distance = 0
+        # Distance to the obstacle along the sensor ray, from the last Drone.scan, NaN when the reading was lost
+        self.distance = math.inf
+        self.view_distance = math.inf  # Distance to the obstacle along the line drawn on the screen
+        self.side = -1  # Grid line the sensor ray hit, 0 for a vertical one, 1 for a horizontal one, -1 for none
+
+    def ray_angles(self, drone):
+        """
+        Returns the angles of the two rays cast for this sensor.
+
+        The first ray is the sensor reading used by the risk checks and the minimap, the second one is the line drawn
+        on the screen, which is turned by 90 degrees for the side sensors. The up and down sensors use one direction
+        for both.
+
+        Parameters:
+        - drone (Drone): The drone the sensor is attached to.
+
+        Returns:
+        - tuple: (angle, view_angle) in radians.
+        """
+        if self.is_up_down == 0:
+            return math.radians(drone.gyro_angle + self.config), math.radians(drone.gyro_angle + self.config + 90)
+        angle = math.radians(drone.angle + self.config)
+        return angle, angle
 
 
     def draw(self, drone, screen):
@@ -34,89 +59,58 @@ class Sensor:
         Draws the sensor lines on the screen based on the current sensor configuration and the drone's position.
 
         This function visualizes the sensors by drawing lines from the drone's position in the directions specified by the
-        sensor angles. It checks for obstacles and stops the line when an obstacle is detected.
+        sensor angles. The lines stop at the obstacle found by the last Drone.scan.
 
         Parameters:
         - screen (pygame.Surface): The Pygame surface to draw the sensors on.
 
         Returns:
-        None
+        - list: The rectangles drawn on, as pygame.Rect.
         """
+        text = get_renderer(size=24)  # Looked up every draw, the renderers are dropped when pygame quits
+        rects = []
         if self.is_up_down == 0:
             angle = math.radians(drone.gyro_angle + self.config + 90)
-            for depth in range(1, 800):
-                target_x = drone.x + math.cos(angle) * depth
-                target_y = drone.y + math.sin(angle) * depth
-                map_x = int(target_x / 64)
-                map_y = int(target_y / 64)
-                if drone.current_layer == 1:
-                    current_map = APARTMENT1_WALLS
-                elif drone.current_layer == 2:
-                    current_map = APARTMENT2_WALLS
-                if current_map[map_y][map_x] == 1:
-                    pygame.draw.line(screen, (255, 0, 0), (SCREEN_WIDTH // 2,
-                                                           SCREEN_HEIGHT // 2 + int(drone.z * 20)),
-                                     (SCREEN_WIDTH // 2 + math.cos(angle) * depth,
-                                      SCREEN_HEIGHT // 2 + math.sin(angle) * depth),
-                                     1)
-                    if depth <= 100:
-                        # Draw the circle at the intersection point
-                        pygame.draw.circle(screen, (255, 255, 255), (int(SCREEN_WIDTH // 2 + math.cos(angle) * depth),
-                                                           int(SCREEN_HEIGHT // 2 + math.sin(angle) * depth)), 5)
-                        text = self.font.render(str(depth), True, (255, 255, 255))
-                        screen.blit(text, (SCREEN_WIDTH // 2 + math.cos(angle) * depth + 10,
-                                           SCREEN_HEIGHT // 2 + math.sin(angle) * depth))
-                    break
-            return
+            depth = self.view_distance
+            if depth != math.inf:
+                rects.append(pygame.draw.line(screen, (255, 0, 0), (SCREEN_WIDTH // 2,
+                                                       SCREEN_HEIGHT // 2 + int(drone.z * 20)),
+                                 (SCREEN_WIDTH // 2 + math.cos(angle) * depth,
+                                  SCREEN_HEIGHT // 2 + math.sin(angle) * depth),
+                                 1))
+                if depth <= 100:
+                    # Draw the circle at the intersection point
+                    rects.append(pygame.draw.circle(screen, (255, 255, 255),
+                                                    (int(SCREEN_WIDTH // 2 + math.cos(angle) * depth),
+                                                     int(SCREEN_HEIGHT // 2 + math.sin(angle) * depth)), 5))
+                    rects.append(text.draw_number(screen, math.ceil(depth),
+                                                  (SCREEN_WIDTH // 2 + math.cos(angle) * depth + 10,
+                                                   SCREEN_HEIGHT // 2 + math.sin(angle) * depth)))
+            return rects
         if self.is_up_down == 1:
             # Draw up and down sensors
             angle_up = math.radians(drone.angle + self.config)
-            for depth in range(1, 800):
-                target_x = drone.x + math.cos(angle_up) * depth
-                target_y = drone.y + math.sin(angle_up) * depth
-                map_x = int(target_x / 64)
-                map_y = int(target_y / 64)
-                if drone.current_layer == 1 and APARTMENT2_FLOOR[map_y][map_x] == 1:
-                    self.distance = depth
-                    pygame.draw.line(screen, (0, 255, 0), (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2),
-                                     (SCREEN_WIDTH // 2 + math.cos(angle_up) * depth,
-                                      SCREEN_HEIGHT // 2 + math.sin(angle_up) * depth), 1)
-                    break
-                if drone.current_layer == 2 and CEILING2_MAP[map_y][map_x] == 1:
-                    self.distance = depth
-                    pygame.draw.line(screen, (0, 255, 0), (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2),
-                                     (SCREEN_WIDTH // 2 + math.cos(angle_up) * depth,
-                                      SCREEN_HEIGHT // 2 + math.sin(angle_up) * depth), 1)
-                    if depth <= drone.dangerous_distance:
-
-                        text = self.font.render(str(depth), True, (255, 255, 255))
-                        screen.blit(text, (SCREEN_WIDTH // 2 + math.cos(angle_up) * depth,
-                                           SCREEN_HEIGHT // 2 + math.sin(angle_up) * depth))
-                    break
-            return
+            depth = self.view_distance
+            if depth != math.inf:
+                rects.append(pygame.draw.line(screen, (0, 255, 0), (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2),
+                                              (SCREEN_WIDTH // 2 + math.cos(angle_up) * depth,
+                                               SCREEN_HEIGHT // 2 + math.sin(angle_up) * depth), 1))
+                if drone.current_layer > 1 and depth <= drone.dangerous_distance:
+                    rects.append(text.draw_number(screen, math.ceil(depth),
+                                                  (SCREEN_WIDTH // 2 + math.cos(angle_up) * depth,
+                                                   SCREEN_HEIGHT // 2 + math.sin(angle_up) * depth)))
+            return rects
         if not self.is_up_down == 2:
             angle_down = math.radians(drone.angle + self.config)
-            for depth in range(1, 800):
-                target_x = drone.x + math.cos(angle_down) * depth
-                target_y = drone.y + math.sin(angle_down) * depth
-                map_x = int(target_x / 64)
-                map_y = int(target_y / 64)
-                if drone.current_layer == 1 and APARTMENT1_FLOOR[map_y][map_x] == 1:
-                    self.distance = depth
-                    pygame.draw.line(screen, (0, 255, 0), (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2),
-                                     (SCREEN_WIDTH // 2 + math.cos(angle_down) * depth,
-                                      SCREEN_HEIGHT // 2 + math.sin(angle_down) * depth), 1)
-                    break
-                if drone.current_layer == 2 and APARTMENT2_FLOOR[map_y][map_x] == 1:
-                    self.distance = depth
-                    pygame.draw.line(screen, (0, 255, 0), (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2),
-                                     (SCREEN_WIDTH // 2 + math.cos(angle_down) * depth,
-                                      SCREEN_HEIGHT // 2 + math.sin(angle_down) * depth), 1)
-                    if depth <= drone.dangerous_distance:
-
-                        # Draw the distance text
-                        text = self.font.render(str(depth), True, (255, 255, 255))
-                        screen.blit(text, (SCREEN_WIDTH // 2 + math.cos(angle_down) * depth,
-                                           SCREEN_HEIGHT // 2 + math.sin(angle_down) * depth))
-                    break
-            return
+            depth = self.view_distance
+            if depth != math.inf:
+                rects.append(pygame.draw.line(screen, (0, 255, 0), (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2),
+                                              (SCREEN_WIDTH // 2 + math.cos(angle_down) * depth,
+                                               SCREEN_HEIGHT // 2 + math.sin(angle_down) * depth), 1))
+                if drone.current_layer > 1 and depth <= drone.dangerous_distance:
+                    # Draw the distance text
+                    rects.append(text.draw_number(screen, math.ceil(depth),
+                                                  (SCREEN_WIDTH // 2 + math.cos(angle_down) * depth,
+                                                   SCREEN_HEIGHT // 2 + math.sin(angle_down) * depth)))
+            return rects
+        return rects
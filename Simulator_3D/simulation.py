@@ -0,0 +1,423 @@
+import math
+import random
+
+from battery import Battery
+from collision import sweep_blocked
+from controller import CONTROLLERS
+from drone import Drone
+from map import Map
+from mapper import MAPPER_RESOLUTION, OccupancyMapper
+from planner import ReturnPlanner
+from recorder import FlightRecorder
+from telemetry import BATTERY, BATTERY_THRESHOLDS, DEBUG, FLOOR_CHANGE, INFO, RISK_ALERT, SENSOR_HIT, WARNING, Telemetry
+from world_params import *
+
+TICK_RATE = 30  # Simulation ticks per second of simulated time, the frame rate the game has always run at
+
+
+class Simulation:
+    """
+    The headless core of the drone simulation.
+
+    The simulation owns the drone, the map and the battery and advances them one fixed timestep at a time with step.
+    It covers the battery drain, the autonomous movement and the return home movement, and never opens a window,
+    loads an image or creates a font, so it runs at full CPU speed without a display. The pygame Game is a viewer
+    on top of it.
+
+    Parameters:
+    - seed (int): Seed of the random number generator used for the floor changes, None for a random seed.
+    - battery (Battery): The battery to fly with, a full default battery when None.
+    - game_map (Map): The map to fly in, the default apartments when None.
+    - controller (str): Name of the controller of the autonomous movement, a key of controller.CONTROLLERS.
+    - sensor_model (SensorModel): The model of every sensor of the drone, exact when None, see noise_model.py.
+    - motion_model (MotionModel): The model of the drone's movement, ideal when None.
+    - tick_rate (float): Ticks per second of simulated time. The movement and the battery drain are set per tick,
+      so the tick rate sets how fast the flight plays in real time, the simulated time of the sensor update rates
+      and the time base of the flight log, not the outcome of a number of ticks.
+
+    Attributes:
+    - drone (Drone): The simulated drone.
+    - map (Map): The map the drone flies in.
+    - battery (Battery): The drone's battery.
+    - do_ai (bool): Whether the autonomous movement is on.
+    - do_return (bool): Whether the drone is returning home.
+    - ticks (int): Number of ticks simulated so far.
+    - warning (bool): Whether the last risk check found an obstacle closer than the dangerous distance.
+    - half_battery_tick (int): The tick the battery reached half charge, None until it does.
+    - floor_changes (int): Number of times the drone moved to another floor.
+    - collisions (int): Number of moves, autonomous or returning home, that were blocked by a wall.
+    - return_ticks (int): Number of ticks spent returning home.
+    - recorder (FlightRecorder): The recorder every tick is written to, None when the flight is not recorded.
+    - home (tuple): The starting cell of the drone as (layer, y, x), where the return home ends.
+    - planner (ReturnPlanner): Plans the shortest way home on the grids of the map.
+    - controller (Controller): Steers the drone while the autonomous movement is on.
+    - mapper (OccupancyMapper): Estimates the map from the sensor readings, None when the flight is not mapped.
+    - telemetry (Telemetry): The channel the flight events are emitted to, None when they are not streamed.
+
+    Raises:
+    - ValueError: When the controller name is unknown.
+    """
+
+    def __init__(self, seed=None, battery=None, game_map=None, controller='reactive', sensor_model=None,
+                 motion_model=None, tick_rate=TICK_RATE):
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.random = random.Random(seed)
+        self.map = game_map if game_map is not None else Map()
+        self.drone = Drone(self.map, seed=seed, sensor_model=sensor_model, motion_model=motion_model)
+        self.battery = battery if battery is not None else Battery()
+        self.do_ai = False
+        self.do_return = False
+        self.ticks = 0
+        self.warning = False
+        self.half_battery_tick = None
+        self.floor_changes = 0
+        self.collisions = 0
+        self.return_ticks = 0
+        self.recorder = None
+        self.home = (self.drone.current_layer, int(self.drone.y / self.map.scale), int(self.drone.x / self.map.scale))
+        self.planner = ReturnPlanner(self.map)
+        if controller not in CONTROLLERS:
+            raise ValueError(f'unknown controller {controller!r}, expected one of {", ".join(CONTROLLERS)}')
+        self.controller = CONTROLLERS[controller](self)
+        self.mapper = None
+        self.telemetry = None
+        self.battery_alerts = 0  # Number of BATTERY_THRESHOLDS the battery fell below since it was last charged
+
+    def start_ai(self):
+        """
+        Turns on the autonomous movement and stops returning home.
+        """
+        self.do_ai = True
+        self.do_return = False
+
+    def start_return(self):
+        """
+        Starts returning home and turns off the autonomous movement.
+        """
+        self.do_return = True
+        self.do_ai = False
+
+    def charge(self):
+        """
+        Charges the battery back to full.
+        """
+        self.battery.is_half = False
+        self.battery.charge = self.battery.max_charge
+        self.battery_alerts = 0
+
+    def switch_sensors(self):
+        """
+        Switches the drone to the next sensor configuration.
+        """
+        self.drone.current_sensor = (self.drone.current_sensor + 1) % len(self.drone.sensors)
+
+    def record(self, path):
+        """
+        Starts recording every following tick into a flight log, see recorder.py.
+
+        Parameters:
+        - path (str): The log file to create.
+
+        Returns:
+        None
+        """
+        self.stop_recording()
+        self.recorder = FlightRecorder(path, self.seed, self.tick_rate)
+
+    def stop_recording(self):
+        """
+        Writes the buffered records of the flight log and closes it.
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def start_mapping(self, resolution=MAPPER_RESOLUTION):
+        """
+        Starts estimating the map from the sensor readings of every following scan, see mapper.py.
+
+        Parameters:
+        - resolution (int): Size of a grid cell of the estimated map in pixels.
+
+        Returns:
+        None
+        """
+        self.mapper = OccupancyMapper(self.map, resolution)
+
+    def start_telemetry(self, target, level=DEBUG, sampling=None):
+        """
+        Starts streaming the events of the flight, see telemetry.py.
+
+        Parameters:
+        - target (str): The file to write the events to, or udp://host:port.
+        - level (int): Events below this level are dropped.
+        - sampling (dict): For some category names, keep only one event in every N of the category.
+
+        Returns:
+        None
+        """
+        self.stop_telemetry()
+        self.telemetry = Telemetry(target, level, sampling, self.tick_rate)
+
+    def stop_telemetry(self):
+        """
+        Writes the events left in the telemetry buffer and closes the channel.
+        """
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def step(self, n=1):
+        """
+        Advances the simulation by n fixed timesteps of 1 / tick_rate seconds.
+
+        Every tick drains the battery, starts returning home once the battery is half empty, and moves the drone
+        autonomously or back home. The sensors are read once per tick, by the controller or after the movement
+        when the controller did not, so the warning and the readings never depend on how often a viewer draws. The
+        last scan is fused into the estimated map when mapping, and the state after the tick is written to the
+        flight log when recording.
+
+        Parameters:
+        - n (int): The number of ticks to simulate.
+
+        Returns:
+        None
+        """
+        for _ in range(n):
+            self.drone.angle = math.radians(self.drone.gyro_angle)
+            if self.battery.drain():
+                if self.half_battery_tick is None:
+                    self.half_battery_tick = self.ticks
+                self.start_return()
+            if self.telemetry is not None:
+                self.report_battery()
+
+            scans = self.drone.scans
+            self.autonomous_movement()
+            self.return_home_movement()
+            if self.drone.scans == scans:
+                self.calculate_risky()
+            if self.mapper is not None:
+                self.mapper.integrate(self.drone)
+            if self.recorder is not None:
+                self.recorder.write(self)
+            self.ticks += 1
+
+    def coverage(self):
+        """
+        Returns the fraction of the free cells of every layer the drone has visited.
+
+        Returns:
+        - dict: The coverage of each layer, between 0 and 1.
+        """
+        return self.drone.coverage.coverage()
+
+    def metrics(self):
+        """
+        Returns the metrics of the flight so far, used to compare episodes.
+
+        Returns:
+        - dict: The ticks simulated, visited cells and coverage per layer, the tick of half battery, the floor changes,
+          the collisions, the ticks spent returning home and the remaining battery charge.
+        """
+        coverage = self.coverage()
+        metrics = {'ticks': self.ticks}
+        metrics.update({f'visited_{layer}': count for layer, count in self.drone.coverage.counts.items()})
+        metrics.update({f'coverage_{layer}': value for layer, value in coverage.items()})
+        metrics.update({
+            'half_battery_tick': self.half_battery_tick,
+            'floor_changes': self.floor_changes,
+            'collisions': self.collisions,
+            'return_ticks': self.return_ticks,
+            'battery': self.battery.charge,
+        })
+        return metrics
+
+    def calculate_risky(self):
+        """
+        Determines risky directions based on the drone's sensor data.
+
+        The drone scans all of its sensors with one batched ray query and every side sensor whose obstacle is closer
+        than the dangerous distance is reported and raises the warning flag.
+
+        Returns:
+        - dict: The risky sensors mapped to the distance of their obstacle.
+        """
+        self.drone.scan(self.ticks / self.tick_rate)
+        was_warning = self.warning
+        self.warning = False
+        sensor_risky = {}
+        telemetry = self.telemetry
+        for sensor_angle in self.drone.sensors[self.drone.current_sensor]:
+            if sensor_angle.is_up_down in (1, 2):
+                self.calculate_risky_up_down(sensor_angle)
+            else:
+                depth = sensor_angle.distance
+                if depth < 50:
+                    if telemetry is not None:
+                        telemetry.emit(SENSOR_HIT, DEBUG, self.ticks, self.drone.current_layer, sensor_angle.config,
+                                       math.ceil(depth))
+                    if depth < self.drone.dangerous_distance:
+                        sensor_risky[sensor_angle] = depth
+                        self.warning = True
+
+        if self.warning and not was_warning and telemetry is not None:
+            closest = min(sensor_risky, key=sensor_risky.get, default=None)
+            telemetry.emit(RISK_ALERT, WARNING, self.ticks, self.drone.current_layer,
+                           None if closest is None else closest.config,
+                           None if closest is None else sensor_risky[closest])
+        return sensor_risky
+
+    def calculate_risky_up_down(self, sensor):
+        """
+        Determines if the ceiling (up sensor) or the floor (down sensor) is too close, from the last scan.
+        """
+        depth = sensor.distance
+        if self.telemetry is not None and self.drone.current_layer == 1:
+            if sensor.is_up_down == 1 and depth < 100:
+                self.telemetry.emit(SENSOR_HIT, DEBUG, self.ticks, 1, 'up', math.ceil(depth))
+            if sensor.is_up_down == 2 and depth < 50:
+                self.telemetry.emit(SENSOR_HIT, DEBUG, self.ticks, 1, 'down', math.ceil(depth))
+        if depth < 1:
+            self.warning = True
+
+    def report_battery(self):
+        """
+        Emits a telemetry event for every threshold of BATTERY_THRESHOLDS the battery fell below since the last tick.
+        """
+        battery = self.battery
+        percent = battery.charge * 100 / battery.max_charge
+        while self.battery_alerts < len(BATTERY_THRESHOLDS) and percent <= BATTERY_THRESHOLDS[self.battery_alerts]:
+            threshold = BATTERY_THRESHOLDS[self.battery_alerts]
+            self.telemetry.emit(BATTERY, WARNING if threshold <= 20 else INFO, self.ticks, self.drone.current_layer,
+                                threshold, battery.charge)
+            self.battery_alerts += 1
+
+    def autonomous_movement(self):
+        """
+        Controls the autonomous movement of the drone with the controller of the simulation.
+        """
+        if not self.do_ai:
+            return
+        self.controller.step()
+
+    def change_floor(self, layer):
+        """
+        Moves the drone one step through the hole it is in towards another layer. The drone descends towards the
+        next layer and climbs towards the previous one, and arrives once it went 10 units past its altitude.
+
+        Parameters:
+        - layer (int): The layer to move to, the next or the previous one.
+
+        Returns:
+        - bool: Whether the drone arrived on the layer this tick.
+        """
+        drone = self.drone
+        if layer > drone.current_layer:
+            if drone.z >= -10:
+                drone.z -= 0.5
+                return False
+            drone.z = 1.5
+        else:
+            if drone.z <= 10:
+                drone.z += 0.5
+                return False
+            drone.z = -1.5
+        self.floor_changes += 1
+        if self.telemetry is not None:
+            self.telemetry.emit(FLOOR_CHANGE, INFO, self.ticks, layer, drone.current_layer, layer)
+        drone.current_layer = layer
+        return True
+
+    def return_home_movement(self):
+        """
+        Flies the drone back to its starting cell along the shortest path on the grids of the layers.
+
+        Every tick the drone heads for the center of the next cell on the path home, or climbs or descends through
+        a hole when the path changes floor, so the return takes as long as the shortest path and not as long as
+        the flight. The return ends at the center of the home cell.
+        """
+        if not self.do_return:
+            return
+        self.return_ticks += 1
+        drone = self.drone
+        cell = (drone.current_layer, int(drone.y / self.map.scale), int(drone.x / self.map.scale))
+        next_cell = self.planner.next_cell(self.home, cell)
+        if next_cell is None:  # Home cannot be reached from here
+            self.stop_return()
+            return
+
+        if next_cell[0] != drone.current_layer:
+            # Change floor through the hole the drone is in, the same way the autonomous movement does
+            drone.speed = 0
+            self.change_floor(next_cell[0])
+            return
+
+        if self.fly_to(next_cell[1], next_cell[2]) and next_cell == cell:  # At the center of the home cell
+            self.stop_return()
+
+    def fly_to(self, y, x):
+        """
+        Turns the drone towards the center of a cell and moves it one tick closer, speeding up.
+
+        Parameters:
+        - y (int): Row of the cell.
+        - x (int): Column of the cell.
+
+        Returns:
+        - bool: Whether the drone reached the center of the cell.
+        """
+        drone = self.drone
+        target_x = (x + 0.5) * self.map.scale
+        target_y = (y + 0.5) * self.map.scale
+        distance = math.hypot(target_x - drone.x, target_y - drone.y)
+        if distance > 0:
+            drone.gyro_angle = drone.format_rotation(math.degrees(math.atan2(target_y - drone.y,
+                                                                             target_x - drone.x)))
+            drone.angle = math.radians(drone.gyro_angle)
+        drone.speed_up()
+        arrived = distance <= drone.speed
+        if arrived:
+            drone.x, drone.y = target_x, target_y
+        else:
+            self.move(*drone.displacement())
+        drone.current_point = (int(drone.y / self.map.scale), int(drone.x / self.map.scale))
+        return arrived
+
+    def move(self, dx, dy):
+        """
+        Moves the drone by a displacement unless the drone, a circle of its radius, would hit a wall on the way, see
+        collision.py. A blocked move counts as a collision, and the drone slides along the wall instead when the
+        move along one axis alone is free, so it never gets stuck on a corner. Holes are not walls, the drone flies
+        over them.
+
+        Parameters:
+        - dx, dy (float): The displacement in pixels.
+
+        Returns:
+        - bool: Whether the drone moved.
+        """
+        if not dx and not dy:
+            return False
+        drone = self.drone
+        walls = self.map.walls[drone.current_layer]
+        clearance = self.map.distance_fields[drone.current_layer].clearance[0]
+        for move_x, move_y in ((dx, dy), (dx, 0), (0, dy)):
+            if (move_x or move_y) and not sweep_blocked(walls, drone.x, drone.y, drone.x + move_x, drone.y + move_y,
+                                                        drone.radius, self.map.scale, clearance):
+                if move_x != dx or move_y != dy:
+                    self.collisions += 1
+                drone.x += move_x
+                drone.y += move_y
+                return True
+        self.collisions += 1
+        return False
+
+    def stop_return(self):
+        """
+        Ends the return home and stops the drone.
+        """
+        self.do_return = False
+        self.drone.speed = 0
+        self.drone.moving = False
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+
+import pygame
+
+
+class SpriteCache:
+    """
+    Least recently used cache of rotated and zoomed copies of an image.
+
+    The drone only turns in steps of 0.5, 1 or 2 degrees, so instead of rotating the image every frame the angle is
+    quantized to the step and each rotation is rendered once and then looked up. Every sprite is cropped to its
+    visible pixels, which keeps the transparent corners the rotation adds out of memory.
+
+    Parameters:
+    - image (pygame.Surface): The image to rotate.
+    - step (float): Angle step in degrees the angles are rounded to.
+    - max_entries (int): Number of sprites kept, the least recently used one is dropped first. None keeps every
+      angle, a full table of 360 / step sprites per zoom.
+
+    Attributes:
+    - hits (int): Lookups answered from the cache.
+    - misses (int): Lookups that had to render the sprite.
+    """
+
+    def __init__(self, image, step=0.5, max_entries=256):
+        self.image = image
+        self.step = step
+        self.max_entries = max_entries
+        self.angle_count = round(360 / step)
+        self.sprites = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.warm_thread = None
+
+    def key(self, angle, zoom):
+        return round(angle / self.step) % self.angle_count, zoom
+
+    def render(self, key):
+        """
+        Rotates and zooms the image for a cache key and crops the result to its visible pixels.
+
+        Returns:
+        - tuple: The sprite (pygame.Surface) and the offset of its top left corner from the center of the rotated
+          image.
+        """
+        index, zoom = key
+        rotated = pygame.transform.rotozoom(self.image, -index * self.step, zoom)
+        visible = rotated.get_bounding_rect()
+        center_x, center_y = rotated.get_rect().center
+        return rotated.subsurface(visible).copy(), (visible.x - center_x, visible.y - center_y)
+
+    def store(self, key, sprite):
+        with self.lock:
+            self.sprites[key] = sprite
+            self.sprites.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self.sprites) > self.max_entries:
+                    self.sprites.popitem(last=False)
+
+    def get(self, angle, zoom=1.0):
+        """
+        Returns the sprite of the image rotated clockwise by angle degrees and zoomed by zoom.
+
+        Parameters:
+        - angle (float): The rotation in degrees, rounded to the step.
+        - zoom (float): The zoom factor.
+
+        Returns:
+        - tuple: The sprite (pygame.Surface) and the offset of its top left corner from the center of the rotated
+          image.
+        """
+        key = self.key(angle, zoom)
+        with self.lock:
+            sprite = self.sprites.get(key)
+            if sprite is not None:
+                self.sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+            self.misses += 1
+        sprite = self.render(key)
+        self.store(key, sprite)
+        return sprite
+
+    def warm(self, zoom=1.0, angles=None, background=True):
+        """
+        Renders the sprites of some angles ahead of time, by default every angle that fits in the cache starting
+        from 0.
+
+        Parameters:
+        - zoom (float): The zoom factor to render.
+        - angles (iterable): The angles in degrees to render.
+        - background (bool): Render in a daemon thread so the first frames are not delayed.
+
+        Returns:
+        None
+        """
+        if angles is None:
+            count = self.angle_count if self.max_entries is None else min(self.angle_count, self.max_entries)
+            angles = [index * self.step for index in range(count)]
+
+        def render_all():
+            for angle in angles:
+                key = self.key(angle, zoom)
+                with self.lock:
+                    cached = key in self.sprites
+                if not cached:
+                    self.store(key, self.render(key))
+
+        if background:
+            self.warm_thread = threading.Thread(target=render_all, daemon=True)
+            self.warm_thread.start()
+        else:
+            render_all()
+
+    def memory(self):
+        """
+        Returns the bytes of pixel data held by the cached sprites.
+        """
+        with self.lock:
+            return sum(sprite.get_width() * sprite.get_height() * sprite.get_bytesize()
+                       for sprite, _ in self.sprites.values())
+
+    def stats(self):
+        """
+        Returns the size, memory and hit rate of the cache.
+
+        Returns:
+        - dict: The number of sprites, their memory in bytes, the hits, the misses and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'sprites': len(self.sprites),
+            'memory': self.memory(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
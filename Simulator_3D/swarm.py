@@ -0,0 +1,325 @@
+"""
+Flies a swarm of many drones in one simulation, with the state of all drones in NumPy arrays.
+
+A Drone keeps its state in Python attributes and reads its sensors one drone at a time, which limits a simulation to a
+handful of drones. The swarm keeps the position, altitude, heading, speed, layer and battery of every drone in one array
+each, so every phase of a tick, the sensor rays, the steering, the floor changes, the movement and the swept circle
+collision checks of collision.py, is a few array operations for the whole swarm. Drones closer than SWARM_SPACING are
+found with a spatial hash and steer apart.
+
+Fly a swarm of 1000 drones headless:
+    python main.py --swarm 1000 --headless --ticks 3000
+"""
+import numpy as np
+
+from battery import Battery
+from collision import DRONE_RADIUS, slide_moves
+from coverage import CoverageMap
+from distance_field import DistanceField
+from drone import SENSOR_RANGE
+from map import Map
+from noise_model import EXACT_SENSOR, IDEAL_MOTION, NoiseStream, sample_readings
+from raycaster import cast_rays
+from simulation import TICK_RATE
+
+SWARM_SENSORS = (-90, -45, 0, 45, 90)  # Angles of the side sensors of every drone, the first sensor configuration
+SWARM_SPACING = 32  # Drones closer than this in pixels on the same layer steer away from each other
+DANGEROUS_DISTANCE = 20  # A drone slows down and turns away from obstacles closer than this, as Drone does
+FLOOR_CHANGE_CHANCE = 0.003  # Chance per tick that a drone over a hole moves to another floor
+
+
+def close_pairs(xs, ys, layers, radius):
+    """
+    Finds every pair of points on the same layer closer than a radius with a spatial hash.
+
+    The points are hashed to square buckets of the size of the radius, and the buckets are sorted once, so the
+    points of a bucket are a slice found with a binary search. Every point is compared only with the points of its
+    own bucket and of the 8 around it, which makes the work grow with the number of points and not with its square.
+
+    Parameters:
+    - xs (numpy.ndarray): The x coordinates of the points in pixels.
+    - ys (numpy.ndarray): The y coordinates of the points in pixels.
+    - layers (numpy.ndarray): The layer of every point.
+    - radius (float): The distance under which two points are a pair.
+
+    Returns:
+    - tuple: (first, second) arrays of point indices, every pair appears once in each order.
+    """
+    columns = int(xs.max() // radius) + 3
+    rows = int(ys.max() // radius) + 3
+    # The buckets are offset by one so the buckets around a border bucket never wrap to another row or layer
+    keys = (layers * rows + (ys // radius).astype(np.intp) + 1) * columns + (xs // radius).astype(np.intp) + 1
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    first, second = [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            neighbours = keys + dy * columns + dx
+            starts = np.searchsorted(sorted_keys, neighbours, 'left')
+            counts = np.searchsorted(sorted_keys, neighbours, 'right') - starts
+            total = counts.sum()
+            if not total:
+                continue
+            ends = np.cumsum(counts)
+            # Position of every candidate inside the slice of its bucket
+            within = np.arange(total) - np.repeat(ends - counts, counts)
+            first.append(np.repeat(np.arange(len(keys)), counts))
+            second.append(order[np.repeat(starts, counts) + within])
+
+    if not first:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    first, second = np.concatenate(first), np.concatenate(second)
+    close = (first != second) & ((xs[first] - xs[second]) ** 2 + (ys[first] - ys[second]) ** 2 < radius ** 2)
+    return first[close], second[close]
+
+
+class Swarm:
+    """
+    Many drones flying the same map, stepped together.
+
+    Every drone follows the rule of the reactive controller: it slows down and turns away from the closest side
+    obstacle, flies ahead while slowly turning otherwise, and moves to another floor at random over a hole. Drones
+    that come too close to each other turn away from their neighbours, and a drone whose battery is empty lands
+    where it is.
+
+    Parameters:
+    - count (int): Number of drones.
+    - game_map (Map): The map to fly in, the default apartments when None.
+    - seed (int): Seed of the random number generator of the swarm, None for a random seed.
+    - battery (Battery): The battery every drone starts with, only its capacity and discharge rate are used, a
+      default battery when None.
+    - sensor_model (SensorModel): The model of the sensors of every drone, exact when None, see noise_model.py.
+    - motion_model (MotionModel): The model of the movement of every drone, ideal when None.
+    - tick_rate (float): Ticks per second of simulated time, for the update rate of the sensor model.
+
+    Attributes:
+    - x, y (numpy.ndarray): The positions of the drones in pixels.
+    - z (numpy.ndarray): The altitude of the drones, changed while they move between floors.
+    - angle (numpy.ndarray): The headings in degrees.
+    - speed (numpy.ndarray): The speeds in pixels per tick.
+    - layer (numpy.ndarray): The 1-based layer of every drone.
+    - target_layer (numpy.ndarray): The layer every drone moves to, its layer when it is not changing floor.
+    - battery (numpy.ndarray): The charge left in every battery.
+    - distances (numpy.ndarray): The sensor readings of the last tick, of shape (count, len(SWARM_SENSORS)), NaN
+      for the lost ones.
+    - vx, vy (numpy.ndarray): The velocities of the last tick, see MotionModel.
+    - coverage (CoverageMap): The cells visited by any drone of the swarm.
+    - ticks (int): Number of ticks simulated so far.
+    - collisions (int): Number of moves blocked by a wall, over all drones.
+    - encounters (int): Number of ticks a pair of drones spent closer than SWARM_SPACING.
+    - floor_changes (int): Number of times a drone arrived on another floor.
+
+    Raises:
+    - ValueError: When count is not positive.
+    """
+
+    def __init__(self, count, game_map=None, seed=None, battery=None, sensor_model=None, motion_model=None,
+                 tick_rate=TICK_RATE):
+        if count <= 0:
+            raise ValueError(f'count must be positive, got {count}')
+        self.map = game_map if game_map is not None else Map()
+        self.count = count
+        self.tick_rate = tick_rate
+        self.random = np.random.default_rng(seed)
+        battery = battery if battery is not None else Battery()
+        self.discharge_rate = battery.discharge_rate
+
+        # The drones start at random points of random free cells of every layer
+        free = np.argwhere(~self.map.occupancy)
+        cells = free[self.random.integers(0, len(free), count)]
+        scale = self.map.scale
+        self.layer = cells[:, 0] + 1
+        self.y = (cells[:, 1] + self.random.uniform(0.25, 0.75, count)) * scale
+        self.x = (cells[:, 2] + self.random.uniform(0.25, 0.75, count)) * scale
+        self.z = np.full(count, 1.5)
+        self.angle = self.random.uniform(0, 360, count)
+        self.speed = np.zeros(count)
+        self.target_layer = self.layer.copy()
+        self.battery = np.full(count, float(battery.max_charge))
+        self.turn = self.random.choice([-1, 1], count)  # Direction of the slow turn of every drone
+        self.distances = np.full((count, len(SWARM_SENSORS)), np.inf)
+        self.vx = np.zeros(count)
+        self.vy = np.zeros(count)
+        self.sensor_model = sensor_model if sensor_model is not None else EXACT_SENSOR
+        self.motion = motion_model if motion_model is not None else IDEAL_MOTION
+        # The noise of all drones is drawn in one batch per tick from one stream of each kind
+        sensor_seed, motion_seed = np.random.SeedSequence(seed).spawn(2)
+        self.sensor_noise = NoiseStream(sensor_seed)
+        self.motion_noise = NoiseStream(motion_seed)
+        self.updated_at = None
+
+        self.sensor_angles = np.radians(SWARM_SENSORS)
+        # The walls of all layers in one query, indexed by layer - 1
+        self.field = DistanceField(self.map.occupancy)
+        # The holes padded with an empty grid before the first and after the last, holes[layer] leads from a layer
+        # to the next one and holes[layer - 1] to the previous one
+        no_holes = np.zeros((1, self.map.height, self.map.width), dtype=bool)
+        self.holes = np.concatenate([no_holes, self.map.holes, no_holes])
+        # The walls padded the same way with solid grids, walls[layer + 1] is the next layer and walls[layer - 1] the
+        # previous one
+        solid = np.ones_like(no_holes)
+        self.walls = np.concatenate([solid, self.map.occupancy, solid])
+        self.coverage = CoverageMap(self.map)
+        self.ticks = 0
+        self.collisions = 0
+        self.encounters = 0
+        self.floor_changes = 0
+
+    def step(self, n=1):
+        """
+        Advances every drone of the swarm by n ticks.
+
+        Parameters:
+        - n (int): The number of ticks to simulate.
+
+        Returns:
+        None
+        """
+        for _ in range(n):
+            self.battery = np.maximum(self.battery - self.discharge_rate, 0)
+            flying = self.battery > 0
+            self.speed[~flying] = 0
+            self.scan()
+            changing = self.change_floors(flying)
+            steering = flying & ~changing
+            self.steer(steering)
+            self.separate(steering)
+            self.move(steering)
+            self.ticks += 1
+
+    def scan(self):
+        """
+        Reads the side sensors of every drone with one batched ray query into distances, through the sensor model.
+        """
+        model = self.sensor_model
+        time = self.ticks / self.tick_rate
+        if not model.is_due(self.updated_at, time):
+            return
+        self.updated_at = time
+        angles = np.radians(self.angle)[:, np.newaxis] + self.sensor_angles
+        distances, sides = cast_rays(self.map.occupancy, self.x[:, np.newaxis], self.y[:, np.newaxis], angles,
+                                     self.map.scale, SENSOR_RANGE, layers=self.layer[:, np.newaxis] - 1,
+                                     field=self.field)
+        if not model.exact:
+            distances, _ = sample_readings(distances, sides, model.noise, model.dropout, model.max_range,
+                                           self.sensor_noise)
+        self.distances = distances
+
+    def steer(self, active):
+        """
+        Slows down the drones with an obstacle closer than DANGEROUS_DISTANCE and turns them away from the closest
+        one, and speeds up and slowly turns the others.
+        """
+        # A lost reading shows no obstacle, as for the risk checks of a single drone
+        distances = np.nan_to_num(self.distances, nan=np.inf)
+        risky = active & (distances.min(axis=1) < DANGEROUS_DISTANCE)
+        clear = active & ~risky
+        closest = np.take(SWARM_SENSORS, distances.argmin(axis=1))
+        # Closer to the left wall turns right, closer to the right wall turns left
+        self.angle[risky] += np.where(closest[risky] < 0, 1, -1)
+        self.speed[risky] = np.maximum(self.speed[risky] - self.motion.acceleration, 0)
+        self.angle[clear] += 0.5 * self.turn[clear]
+        self.speed[clear] = np.minimum(self.speed[clear] + self.motion.acceleration, self.motion.max_speed)
+        self.angle %= 360
+
+    def separate(self, active):
+        """
+        Turns the drones that are closer than SWARM_SPACING to other drones of their layer away from them, unless
+        they are busy avoiding a wall.
+        """
+        first, second = close_pairs(self.x, self.y, self.layer, SWARM_SPACING)
+        self.encounters += len(first) // 2
+        if not len(first):
+            return
+        away_x = np.zeros(self.count)
+        away_y = np.zeros(self.count)
+        np.add.at(away_x, first, self.x[first] - self.x[second])
+        np.add.at(away_y, first, self.y[first] - self.y[second])
+        near_wall = np.fmin.reduce(self.distances, axis=1) < DANGEROUS_DISTANCE
+        crowded = active & ((away_x != 0) | (away_y != 0)) & ~near_wall
+        self.angle[crowded] = np.degrees(np.arctan2(away_y[crowded], away_x[crowded])) % 360
+
+    def change_floors(self, active):
+        """
+        Starts moving some of the drones over a hole to the next or previous floor, and moves every drone that is
+        changing floor one step, the way Simulation.change_floor does.
+
+        Returns:
+        - numpy.ndarray: Boolean mask of the drones changing floor this tick.
+        """
+        scale = self.map.scale
+        rows, columns = (self.y // scale).astype(np.intp), (self.x // scale).astype(np.intp)
+        # A hole to the next or the previous layer, unless the cell is a wall on the other side
+        up = self.holes[self.layer, rows, columns] & ~self.walls[self.layer + 1, rows, columns]
+        down = self.holes[self.layer - 1, rows, columns] & ~self.walls[self.layer - 1, rows, columns]
+        starting = (active & (self.target_layer == self.layer) & (up | down)
+                    & (self.random.random(self.count) < FLOOR_CHANGE_CHANCE))
+        # A hole between three floors leads up or down
+        go_up = up & (~down | (self.random.random(self.count) < 0.5))
+        self.target_layer[starting] = np.where(go_up[starting], self.layer[starting] + 1, self.layer[starting] - 1)
+
+        changing = active & (self.target_layer != self.layer)
+        self.speed[changing] = 0
+        descending = changing & (self.target_layer > self.layer)
+        climbing = changing & (self.target_layer < self.layer)
+        self.z[descending] -= 0.5
+        self.z[climbing] += 0.5
+        arrived_down = descending & (self.z < -10)
+        arrived_up = climbing & (self.z > 10)
+        self.z[arrived_down] = 1.5
+        self.z[arrived_up] = -1.5
+        arrived = arrived_down | arrived_up
+        self.layer[arrived] = self.target_layer[arrived]
+        self.floor_changes += int(np.count_nonzero(arrived))
+        return changing
+
+    def move(self, active):
+        """
+        Moves the drones with the velocity of the motion model, sliding along the walls like Simulation.move, and
+        marks the cells they reach as visited.
+        """
+        scale = self.map.scale
+        motion = self.motion
+        radians = np.radians(self.angle)
+        target_x = np.cos(radians) * self.speed
+        target_y = np.sin(radians) * self.speed
+        if motion.exact:
+            self.vx, self.vy = target_x, target_y
+        else:
+            self.vx = (self.vx + motion.response * (target_x - self.vx)) * (1 - motion.drag)
+            self.vy = (self.vy + motion.response * (target_y - self.vy)) * (1 - motion.drag)
+            if motion.jitter:
+                jitter = motion.jitter * self.motion_noise.normal(2 * self.count)
+                self.vx += jitter[:self.count]
+                self.vy += jitter[self.count:]
+        moving = np.flatnonzero(active & ((self.vx != 0) | (self.vy != 0)))
+        move_x, move_y, collided = slide_moves(self.map.occupancy, self.layer[moving] - 1, self.x[moving],
+                                               self.y[moving], self.vx[moving], self.vy[moving], DRONE_RADIUS,
+                                               scale, self.field.clearance)
+        self.collisions += int(np.count_nonzero(collided))
+        moved = moving[(move_x != 0) | (move_y != 0)]
+        self.x[moving] += move_x
+        self.y[moving] += move_y
+        rows, columns = (self.y[moved] // scale).astype(np.intp), (self.x[moved] // scale).astype(np.intp)
+        self.coverage.visit_cells(self.layer[moved], rows, columns)
+
+    def metrics(self):
+        """
+        Returns the metrics of the swarm so far, in the format of Simulation.metrics where it applies.
+
+        Returns:
+        - dict: The ticks simulated, drones, visited cells and coverage per layer, floor changes, collisions,
+          encounters between drones, mean battery charge and drones still flying.
+        """
+        metrics = {'ticks': self.ticks, 'drones': self.count}
+        metrics.update({f'visited_{layer}': count for layer, count in self.coverage.counts.items()})
+        metrics.update({f'coverage_{layer}': value for layer, value in self.coverage.coverage().items()})
+        metrics.update({
+            'floor_changes': self.floor_changes,
+            'collisions': self.collisions,
+            'encounters': self.encounters,
+            'battery': float(self.battery.mean()),
+            'flying': int(np.count_nonzero(self.battery > 0)),
+        })
+        return metrics
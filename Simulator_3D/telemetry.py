@@ -0,0 +1,186 @@
+"""
+Streams typed events of a flight to a file or a local UDP socket without slowing the simulation down.
+
+The simulation emits an event when a sensor sees an obstacle close by, when the risk warning turns on, when the drone
+arrives on another floor and when the battery falls below a threshold. An event is a tuple put into a fixed size ring
+buffer: the simulation is the only writer and moves the head, the flush thread is the only reader and moves the tail,
+so neither takes a lock and the simulation never waits for a write. A full buffer drops the new event and counts it.
+The flush thread writes the buffered events in batches as JSON lines every interval. Events below the level of the
+channel are dropped before they are buffered, and a category can be sampled to keep only one event in every N.
+
+Stream the events of a headless flight into a file, or to a UDP socket, keeping one sensor hit in 10:
+    python main.py --headless --telemetry events.jsonl
+    python main.py --telemetry udp://127.0.0.1:9999 --telemetry-level info --telemetry-sample sensor_hit=10
+"""
+import json
+import socket
+import threading
+
+# Levels of the events, as in the logging module
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING}
+LEVEL_NAMES = {level: name for name, level in LEVELS.items()}
+
+# Categories of the events
+SENSOR_HIT = 0  # A sensor reading closer than the reported distance, as the risk checks used to print
+RISK_ALERT = 1  # The risk warning turned on
+FLOOR_CHANGE = 2  # The drone arrived on another floor
+BATTERY = 3  # The battery fell below one of BATTERY_THRESHOLDS
+CATEGORIES = ('sensor_hit', 'risk_alert', 'floor_change', 'battery')
+# Names of the code and value of the events of every category in the output
+FIELDS = (('sensor', 'distance'), ('sensor', 'distance'), ('from_layer', 'to_layer'), ('threshold', 'charge'))
+
+BATTERY_THRESHOLDS = (50, 20, 10, 0)  # Battery charges in percent of the capacity that emit an event
+RING_SIZE = 65536  # Events the ring buffer holds
+FLUSH_INTERVAL = 0.2  # Seconds between two flushes of the ring buffer
+DATAGRAM_SIZE = 8192  # Largest batch sent in one UDP datagram, in bytes
+
+
+class Telemetry:
+    """
+    A channel of flight events, buffered in a ring and written by a background thread.
+
+    Parameters:
+    - target (str): The file to write the events to, or udp://host:port to send them to a local socket.
+    - level (int): Events below this level are dropped, one of DEBUG, INFO and WARNING.
+    - sampling (dict): For some category names, keep only one event in every N of the category.
+    - tick_rate (float): Ticks per second of the simulation, for the time of the events.
+    - capacity (int): Events the ring buffer holds.
+    - interval (float): Seconds between two flushes.
+
+    Attributes:
+    - emitted (int): Events put into the ring buffer.
+    - dropped (int): Events dropped because the ring buffer was full.
+    - written (int): Events written to the target.
+    - lost (int): Events of batches the socket failed to send.
+
+    Raises:
+    - ValueError: When a category of sampling is unknown or a sampling rate is not positive.
+    """
+
+    def __init__(self, target, level=DEBUG, sampling=None, tick_rate=30, capacity=RING_SIZE, interval=FLUSH_INTERVAL):
+        self.every = [1] * len(CATEGORIES)
+        for name, every in (sampling or {}).items():
+            if name not in CATEGORIES or every < 1:
+                raise ValueError(f'invalid sampling {name}={every}, expected a positive rate for one of '
+                                 f'{", ".join(CATEGORIES)}')
+            self.every[CATEGORIES.index(name)] = every
+        self.seen = [0] * len(CATEGORIES)
+        self.level = level
+        self.tick_rate = tick_rate
+        self.interval = interval
+        self.capacity = capacity
+        self.ring = [None] * capacity
+        self.head = 0  # Number of events written into the ring, only moved by emit
+        self.tail = 0  # Number of events read from the ring, only moved by flush
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.lost = 0  # Only moved by the flush thread, as dropped is only moved by emit
+
+        self.target = target
+        if target.startswith('udp://'):
+            host, port = target[len('udp://'):].rsplit(':', 1)
+            self.address = (host, int(port))
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.file = None
+        else:
+            self.socket = None
+            self.file = open(target, 'w')
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def emit(self, category, level, tick, layer, code, value):
+        """
+        Puts an event into the ring buffer, unless its level is too low, it is sampled out or the buffer is full.
+
+        Parameters:
+        - category (int): SENSOR_HIT, RISK_ALERT, FLOOR_CHANGE or BATTERY.
+        - level (int): DEBUG, INFO or WARNING.
+        - tick (int): The tick of the event.
+        - layer (int): The layer of the drone.
+        - code: The sensor (its angle, or up or down), the layer left or the battery threshold, see FIELDS.
+        - value (float): The distance, the layer reached or the battery charge, see FIELDS.
+
+        Returns:
+        None
+        """
+        if level < self.level:
+            return
+        every = self.every[category]
+        if every > 1:
+            self.seen[category] += 1
+            if self.seen[category] % every:
+                return
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return
+        self.ring[head % self.capacity] = (tick, category, level, layer, code, value)
+        self.head = head + 1
+        self.emitted += 1
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the events buffered since the last flush to the target in one batch. Only the flush thread calls it
+        while the channel is open.
+        """
+        head, tail = self.head, self.tail
+        if head == tail:
+            return
+        start, end = tail % self.capacity, head % self.capacity
+        events = self.ring[start:end] if start < end else self.ring[start:] + self.ring[:end]
+        self.tail = head
+        lines = []
+        for tick, category, level, layer, code, value in events:
+            code_name, value_name = FIELDS[category]
+            lines.append(json.dumps({'tick': tick, 'time': round(tick / self.tick_rate, 3),
+                                     'category': CATEGORIES[category], 'level': LEVEL_NAMES[level], 'layer': layer,
+                                     code_name: code, value_name: value}) + '\n')
+        if self.file is not None:
+            self.file.writelines(lines)
+            self.file.flush()
+        else:
+            batch = []
+            size = 0
+            for line in lines:
+                if batch and size + len(line) > DATAGRAM_SIZE:
+                    self.send(batch)
+                    batch, size = [], 0
+                batch.append(line)
+                size += len(line)
+            self.send(batch)
+        self.written += len(events)
+
+    def send(self, lines):
+        try:
+            self.socket.sendto(''.join(lines).encode(), self.address)
+        except OSError:  # Nobody listening, the batch is lost
+            self.lost += len(lines)
+
+    def close(self):
+        """
+        Stops the flush thread, writes the events left in the ring buffer and closes the target.
+        """
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+        else:
+            self.socket.close()
+
+    def stats(self):
+        """
+        Returns the events emitted, dropped, written and lost so far.
+        """
+        return {'emitted': self.emitted, 'dropped': self.dropped, 'written': self.written, 'lost': self.lost}
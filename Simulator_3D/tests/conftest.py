@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The simulator is a flat set of modules run from its directory, the tests import them the same way
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
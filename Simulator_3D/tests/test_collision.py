@@ -0,0 +1,91 @@
+import numpy as np
+
+from collision import DRONE_RADIUS, slide_moves, sweep_blocked, sweeps_blocked
+from distance_field import DistanceField
+from map import Map
+from simulation import Simulation
+
+SCALE = 64
+
+
+def walled_grid():
+    walls = np.zeros((5, 5), dtype=bool)
+    walls[0, :] = walls[-1, :] = walls[:, 0] = walls[:, -1] = True
+    walls[2, 2] = True
+    return walls
+
+
+def test_a_move_into_a_wall_cell_is_blocked():
+    walls = walled_grid()
+    assert sweep_blocked(walls, 1.5 * SCALE, 2.5 * SCALE, 3.5 * SCALE, 2.5 * SCALE, DRONE_RADIUS, SCALE)
+    assert not sweep_blocked(walls, 1.5 * SCALE, 1.5 * SCALE, 3.5 * SCALE, 1.5 * SCALE, DRONE_RADIUS, SCALE)
+
+
+def test_a_circle_starting_in_a_wall_cell_can_leave_it():
+    walls = walled_grid()
+    x, y = 2.5 * SCALE, 2.5 * SCALE
+    clearance = np.zeros(walls.shape)
+    for end_x, end_y in ((x - SCALE, y), (x + 2, y), (x, y + SCALE)):
+        assert not sweep_blocked(walls, x, y, end_x, end_y, DRONE_RADIUS, SCALE)
+        assert not sweep_blocked(walls, x, y, end_x, end_y, DRONE_RADIUS, SCALE, clearance)
+    # Still blocked by the other walls it comes into
+    assert sweep_blocked(walls, x, y, x, y - 2 * SCALE, DRONE_RADIUS, SCALE)
+
+
+def start_in_wall(simulation, layer, row, column):
+    game_map, drone = simulation.map, simulation.drone
+    assert game_map.walls[layer][row, column]
+    drone.current_layer = layer
+    drone.x, drone.y = (column + 0.5) * game_map.scale, (row + 0.5) * game_map.scale
+    drone.current_point = (row, column)
+
+
+def test_the_return_home_leaves_a_wall_cell_it_starts_in():
+    simulation = Simulation(seed=0)
+    start_in_wall(simulation, 2, 6, 11)
+    simulation.start_return()
+    for _ in range(600):
+        simulation.step()
+        if not simulation.do_return:
+            break
+    assert not simulation.do_return
+    assert simulation.collisions == 0
+
+
+def test_the_next_cell_from_a_wall_cell_is_free_and_reachable():
+    simulation = Simulation(seed=0)
+    start_in_wall(simulation, 2, 6, 11)
+    planner, drone = simulation.planner, simulation.drone
+    layer, row, column = planner.next_cell(simulation.home, (2, 6, 11))
+    assert layer == 2 and planner.free[layer - 1, row, column]
+    x, y = drone.x, drone.y
+    assert simulation.move((column - 11) * simulation.map.scale, (row - 6) * simulation.map.scale)
+    assert (drone.x, drone.y) != (x, y)
+
+
+def test_the_batched_sweep_matches_the_sweep_of_one_circle():
+    game_map = Map()
+    walls, scale = game_map.occupancy, game_map.scale
+    clearance = DistanceField(walls).clearance
+    rng = np.random.default_rng(0)
+    count = 2000
+    layers = rng.integers(0, len(walls), count)
+    x0 = rng.uniform(scale, (game_map.width - 1) * scale, count)
+    y0 = rng.uniform(scale, (game_map.height - 1) * scale, count)
+    x0[:100] = np.round(x0[:100] / scale) * scale  # On a grid line
+    for length in (2, 32, 200):
+        angles = rng.uniform(0, 2 * np.pi, count)
+        x1 = np.clip(x0 + length * np.cos(angles), 1, game_map.width * scale - 1)
+        y1 = np.clip(y0 + length * np.sin(angles), 1, game_map.height * scale - 1)
+        one = [sweep_blocked(walls[layer], *move, DRONE_RADIUS, scale) for layer, *move in zip(layers, x0, y0, x1, y1)]
+        assert (sweeps_blocked(walls, layers, x0, y0, x1, y1, DRONE_RADIUS, scale) == one).all()
+        assert (sweeps_blocked(walls, layers, x0, y0, x1, y1, DRONE_RADIUS, scale, clearance) == one).all()
+
+
+def test_slide_moves_slides_along_a_wall():
+    walls = walled_grid()[np.newaxis]
+    x, y = np.array([1.5 * SCALE, 1.5 * SCALE]), np.array([1.5 * SCALE, 3.5 * SCALE])
+    move_x, move_y, collided = slide_moves(walls, np.zeros(2, dtype=np.intp), x, y, np.array([SCALE, 0.0]),
+                                           np.array([-SCALE / 2, 0.0]), DRONE_RADIUS, SCALE)
+    assert move_x.tolist() == [SCALE, 0] and move_y.tolist() == [0, 0]
+    assert collided.tolist() == [True, False]
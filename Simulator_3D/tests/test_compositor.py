@@ -0,0 +1,32 @@
+import numpy as np
+import pygame
+import pytest
+
+from game import Game
+from simulation import Simulation
+
+
+@pytest.mark.parametrize('controller', ['reactive', 'frontier'])
+def test_composed_frames_match_the_frames_drawn_whole(controller):
+    simulation = Simulation(seed=5, controller=controller)
+    simulation.start_mapping()
+    simulation.start_ai()
+    game = Game(simulation)
+    game.profiler.toggle_hud()
+    composed = game.screen
+    whole = pygame.Surface(composed.get_size(), 0, composed)
+    try:
+        for frame in range(150):
+            game.profiler.begin()
+            if frame:
+                simulation.step()
+            game.button_ai.color = (128, 128, 128)
+            game.compositor.compose()
+            game.screen = whole
+            game.draw_frame()
+            game.screen = composed
+            game.profiler.end()
+            different = pygame.surfarray.array2d(composed) != pygame.surfarray.array2d(whole)
+            assert not different.any(), f'frame {frame}: {different.sum()} pixels differ'
+    finally:
+        pygame.quit()
@@ -0,0 +1,13 @@
+from simulation import Simulation
+
+
+def test_the_reactive_controller_never_changes_floor_into_a_wall():
+    simulation = Simulation(seed=0)
+    game_map, drone = simulation.map, simulation.drone
+    # Layer 1 has a hole at (6, 11) to layer 2, where the cell is a wall
+    assert game_map.next_layers(1, 6, 11) == [2] and game_map.walls[2][6, 11]
+    drone.x, drone.y = 11.5 * game_map.scale, 6.5 * game_map.scale
+    simulation.random.random = lambda: 0.0  # Every tick would try to change floor
+    simulation.start_ai()
+    simulation.controller.step()
+    assert not drone.move_floor and drone.target_layer == 1
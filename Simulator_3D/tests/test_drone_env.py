@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from drone_env import DroneEnv, DroneVecEnv
+from noise_model import MOTION_MODELS
+
+
+@pytest.mark.parametrize('motion', ['ideal', 'inertial'])
+def test_a_drone_env_and_a_vec_env_of_one_fly_the_same(motion):
+    env = DroneEnv(motion_model=MOTION_MODELS[motion])
+    vec_env = DroneVecEnv(1, seed=0, motion_model=MOTION_MODELS[motion])
+    env.reset(seed=0)
+    rng = np.random.default_rng(0)
+    layers = set()
+    for _ in range(1500):
+        action = rng.uniform(-1, 1, 3)
+        action[2] = np.sign(action[2])  # Changes floors whenever it can
+        _, reward, terminated, _, info = env.step(action)
+        _, rewards, _, _, infos = vec_env.step(action[np.newaxis])
+        drone = env.simulation.drone
+        assert (drone.x, drone.y, drone.current_layer) == pytest.approx((vec_env.x[0], vec_env.y[0], vec_env.layer[0]))
+        assert reward == pytest.approx(rewards[0]) and info['collisions'] == infos['collisions'][0]
+        layers.add(drone.current_layer)
+    assert len(layers) > 1
+
+
+def test_the_drones_of_a_vec_env_never_enter_a_wall():
+    vec_env = DroneVecEnv(32, seed=1, motion_model=MOTION_MODELS['inertial'])
+    rng = np.random.default_rng(1)
+    scale = vec_env.map.scale
+    for _ in range(500):
+        vec_env.step(rng.uniform(-1, 1, (32, 3)))
+        rows, columns = (vec_env.y // scale).astype(np.intp), (vec_env.x // scale).astype(np.intp)
+        assert not vec_env.map.occupancy[vec_env.layer - 1, rows, columns].any()
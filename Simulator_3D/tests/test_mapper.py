@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+
+from map import Map
+from mapper import LOG_ODDS_HIT, LOG_ODDS_MISS, MAPPER_RESOLUTION, OccupancyMapper
+from noise_model import SENSOR_MODELS
+from simulation import Simulation
+
+
+def sampled_cells(x, y, angle, distance, step=0.001):
+    """
+    Returns the grid cells of points every step pixels along a ray, the cells it crosses over more than a step.
+    """
+    lengths = np.arange(0, distance, step)
+    rows = ((y + math.sin(angle) * lengths) // MAPPER_RESOLUTION).astype(int)
+    columns = ((x + math.cos(angle) * lengths) // MAPPER_RESOLUTION).astype(int)
+    return set(zip(rows.tolist(), columns.tolist()))
+
+
+def test_every_cell_a_ray_crosses_is_updated_once():
+    game_map = Map()
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        x, y = rng.uniform(70, 300, 2)
+        angle, distance = rng.uniform(0, 2 * math.pi), rng.uniform(5, 60)
+        mapper = OccupancyMapper(game_map)
+        mapper.update(1, x, y, [angle], [distance])
+
+        hit = (int((y + math.sin(angle) * (distance + 0.5)) // MAPPER_RESOLUTION),
+               int((x + math.cos(angle) * (distance + 0.5)) // MAPPER_RESOLUTION))
+        crossed = sampled_cells(x, y, angle, distance) - {hit}
+        log_odds = mapper.log_odds[0]
+        assert set(map(tuple, np.argwhere(log_odds == np.float32(LOG_ODDS_MISS)).tolist())) == crossed
+        assert log_odds[hit] == np.float32(LOG_ODDS_HIT)
+        assert np.count_nonzero(log_odds) == len(crossed) + 1
+
+
+def test_a_ray_cutting_the_corner_of_a_cell_clears_it():
+    mapper = OccupancyMapper(Map())
+    # Crosses cell (5, 6) over less than a pixel, between two samples half a cell apart
+    x, y = 5.5 * MAPPER_RESOLUTION, 5.5 * MAPPER_RESOLUTION
+    angle = math.atan2(0.5 * MAPPER_RESOLUTION - 0.3, 0.5 * MAPPER_RESOLUTION + 0.3)
+    mapper.update(1, x, y, [angle], [3 * MAPPER_RESOLUTION])
+    assert mapper.log_odds[0, 5, 6] == np.float32(LOG_ODDS_MISS)
+
+
+def test_noisy_hits_keep_a_margin_on_both_sides():
+    mapper = OccupancyMapper(Map())
+    x, y = 5.5 * MAPPER_RESOLUTION, 5.5 * MAPPER_RESOLUTION
+    mapper.update(1, x, y, [0.0], [4 * MAPPER_RESOLUTION], margins=[24])
+    row = mapper.log_odds[0, 5]
+    # Cleared up to 24 pixels short of the hit, the wall looked for 24.5 pixels past it
+    assert (row[5:8] == np.float32(LOG_ODDS_MISS)).all() and (row[8:11] == 0).all()
+    assert row[11] == np.float32(LOG_ODDS_HIT)
+
+
+def test_a_ray_that_hit_nothing_only_clears_the_range_of_its_sensor():
+    mapper = OccupancyMapper(Map())
+    x, y = 5.5 * MAPPER_RESOLUTION, 5.5 * MAPPER_RESOLUTION
+    mapper.update(1, x, y, [0.0], [math.inf], ranges=[3 * MAPPER_RESOLUTION])
+    row = mapper.log_odds[0, 5]
+    assert (row[5:9] == np.float32(LOG_ODDS_MISS)).all() and (row[9:] == 0).all()
+
+
+def test_noisy_sensors_never_clear_a_wall():
+    for model in ('lidar', 'sonar'):
+        simulation = Simulation(seed=3, sensor_model=SENSOR_MODELS[model])
+        simulation.start_mapping()
+        simulation.start_ai()
+        simulation.step(600)
+        game_map = simulation.map
+        repeat = game_map.scale // MAPPER_RESOLUTION
+        walls = game_map.walls[1].repeat(repeat, axis=0).repeat(repeat, axis=1)
+        assert not np.any((simulation.mapper.log_odds[0] < 0) & walls)
@@ -0,0 +1,78 @@
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+
+from drone import WAYPOINT_SPACING
+from recorder import FlightLog, FlightReplay
+from simulation import Simulation
+
+SIMULATOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('tick_rate', [45, 12.5])
+def test_record_and_replay_at_a_non_default_tick_rate(tmp_path, tick_rate):
+    path = str(tmp_path / 'flight.log')
+    simulation = Simulation(seed=3, tick_rate=tick_rate)
+    simulation.record(path)
+    simulation.start_ai()
+    simulation.step(300)
+    simulation.stop_recording()
+
+    log = FlightLog(path)
+    assert log.tick_rate == tick_rate
+    assert log.seed == 3
+    assert len(log) == 300
+
+    replayed = Simulation(seed=log.seed, tick_rate=log.tick_rate)
+    replay = FlightReplay(log)
+    for tick in range(len(log)):
+        replay.step(replayed)
+        state = log.state(tick)
+        assert (replayed.drone.x, replayed.drone.y) == (state['x'], state['y'])
+    replay.seek(100, replayed)
+    assert replayed.ticks == 101
+    log.close()
+
+
+def test_main_records_with_the_tick_rate_option(tmp_path):
+    path = str(tmp_path / 'flight.log')
+    subprocess.run([sys.executable, 'main.py', '--headless', '--ticks', '50', '--seed', '1', '--tick-rate', '20',
+                    '--record', path], cwd=SIMULATOR_DIR, check=True, capture_output=True)
+    log = FlightLog(path)
+    assert log.tick_rate == 20
+    assert len(log) == 50
+    log.close()
+
+
+def test_seek_rebuilds_the_waypoints_of_a_replay_in_any_order(tmp_path):
+    path = str(tmp_path / 'flight.log')
+    simulation = Simulation(seed=3, controller='frontier')
+    simulation.record(path)
+    simulation.start_ai()
+    simulation.step(3000)
+    simulation.stop_recording()
+    log = FlightLog(path)
+    records = log.records
+    replayed = Simulation(seed=log.seed)
+    replay = FlightReplay(log)
+    for tick in (2000, 150, 0, 1200, 1201, 2999):
+        # The waypoints of playing the log up to the tick, starting from its first record
+        expected = {layer: [] for layer in replayed.drone.waypoints}
+        last = {int(records[0]['layer']): (float(records[0]['y']), float(records[0]['x']))}
+        expected[int(records[0]['layer'])].append(last[int(records[0]['layer'])])
+        for layer, y, x in zip(records['layer'][:tick + 1].tolist(), records['y'][:tick + 1].tolist(),
+                               records['x'][:tick + 1].tolist()):
+            if layer not in last or math.hypot(x - last[layer][1], y - last[layer][0]) > WAYPOINT_SPACING:
+                last[layer] = (y, x)
+                expected[layer].append((y, x))
+        replay.seek(tick, replayed)
+        state = log.state(tick)
+        assert (replayed.drone.x, replayed.drone.y) == (state['x'], state['y'])
+        assert {layer: waypoints.view().tolist() for layer, waypoints in replayed.drone.waypoints.items()} == {
+            layer: [list(position) for position in positions] for layer, positions in expected.items()}
+    assert all(len(waypoints) > 3 for waypoints in replayed.drone.waypoints.values())
+    del records
+    log.close()
@@ -0,0 +1,30 @@
+import pygame
+
+from game import Game
+from profiler import FrameProfiler
+from simulation import Simulation
+from text_renderer import fonts, get_font, get_renderer, renderers
+
+
+def test_pygame_quit_drops_the_shared_fonts():
+    pygame.init()
+    get_renderer(size=24)
+    assert fonts and renderers
+    pygame.quit()
+    assert not fonts and not renderers
+
+    # The caches are cleared again by every later quit
+    pygame.init()
+    get_font(size=24).render('0', True, (255, 255, 255))
+    pygame.quit()
+    assert not fonts and not renderers
+
+
+def test_games_run_one_after_the_other():
+    for _ in range(2):
+        simulation = Simulation(seed=1)
+        simulation.start_ai()
+        game = Game(simulation, profiler=FrameProfiler(show_hud=True))
+        pygame.event.post(pygame.event.Event(pygame.QUIT))  # Ends the loop after a frame, which quits pygame
+        game.run()
+        assert game.profiler.hud is not None
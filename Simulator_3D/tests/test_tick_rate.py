@@ -0,0 +1,36 @@
+import pygame
+import pytest
+
+from game import Game
+from noise_model import SensorModel
+from recorder import FlightLog, FlightReplay
+from simulation import Simulation
+from swarm import Swarm
+
+
+@pytest.mark.parametrize('tick_rate', [15, 60])
+def test_swarm_sensors_update_at_their_rate_whatever_the_tick_rate(tick_rate):
+    swarm = Swarm(4, seed=0, sensor_model=SensorModel(update_rate=5), tick_rate=tick_rate)
+    readings = set()
+    for _ in range(2 * tick_rate):  # Two simulated seconds
+        swarm.step()
+        readings.add(swarm.updated_at)
+    assert len(readings) == 10
+
+
+def test_replay_scrubs_ten_seconds_of_ticks_at_the_tick_rate_of_the_log(tmp_path):
+    path = str(tmp_path / 'flight.log')
+    recorded = Simulation(seed=2, tick_rate=12.5)
+    recorded.record(path)
+    recorded.start_ai()
+    recorded.step(400)
+    recorded.stop_recording()
+
+    log = FlightLog(path)
+    game = Game(Simulation(seed=log.seed, tick_rate=log.tick_rate), replay=FlightReplay(log))
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RIGHT))
+    pygame.event.post(pygame.event.Event(pygame.QUIT))  # Ends the loop after this frame
+    game.run()
+    # 125 ticks forward, the seek plays one tick and the frame may play one more
+    assert 126 <= game.replay.tick <= 127
+    log.close()
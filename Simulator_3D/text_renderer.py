@@ -0,0 +1,162 @@
+"""
+Shared text rendering for the labels of the viewer.
+
+pygame.font.SysFont searches the system fonts every time it is called, and rendering a label builds a new surface
+every time. Fonts are created once per name and size here and shared, and every font and color has one TextRenderer
+that keeps the labels it rendered in a least recently used cache and the digits in an atlas, so a number is drawn
+by blitting its digits without rendering or allocating anything. The fonts are only valid until pygame quits, so
+the caches are cleared then and the fonts and renderers are looked up again instead of being kept.
+
+Draw a label and a number:
+    text = get_renderer(size=24)
+    screen.blit(text.render('Charge'), (10, 10))
+    text.draw_number(screen, 42, (10, 40))
+"""
+from collections import OrderedDict
+
+import pygame
+
+from world_params import WHITE
+
+LABEL_CACHE_SIZE = 256  # Labels every renderer keeps, the least recently used one is dropped first
+ATLAS_CHARACTERS = '0123456789-'  # Characters of the digit atlas
+
+fonts = {}  # The fonts created so far, keyed by (name, size)
+renderers = {}  # The renderers created so far, keyed by (name, size, color)
+clear_registered = False  # Whether clear runs on the next pygame.quit, which forgets its callbacks once run
+
+
+def clear():
+    """
+    Drops every font and renderer, run by pygame.quit since the fonts cannot be used after it.
+    """
+    global clear_registered
+    fonts.clear()
+    renderers.clear()
+    clear_registered = False
+
+
+def get_font(name=None, size=24):
+    """
+    Returns the shared system font of a name and size, created on the first call.
+
+    Parameters:
+    - name (str): The name of the system font, None for the default pygame font.
+    - size (int): The size of the font in pixels.
+
+    Returns:
+    - pygame.font.Font: The font.
+    """
+    global clear_registered
+    font = fonts.get((name, size))
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        if not clear_registered:
+            pygame.register_quit(clear)
+            clear_registered = True
+        font = fonts[name, size] = pygame.font.SysFont(name, size)
+    return font
+
+
+def get_renderer(name=None, size=24, color=WHITE):
+    """
+    Returns the shared TextRenderer of a font and color, created on the first call.
+
+    Parameters:
+    - name (str): The name of the system font, None for the default pygame font.
+    - size (int): The size of the font in pixels.
+    - color (tuple): The RGB color of the text.
+
+    Returns:
+    - TextRenderer: The renderer.
+    """
+    key = (name, size, tuple(color))
+    renderer = renderers.get(key)
+    if renderer is None:
+        renderer = renderers[key] = TextRenderer(get_font(name, size), color)
+    return renderer
+
+
+class TextRenderer:
+    """
+    Renders the text of one font and color, with a least recently used cache of labels and a digit atlas.
+
+    Parameters:
+    - font (pygame.font.Font): The font to render with.
+    - color (tuple): The RGB color of the text.
+    - max_entries (int): Number of labels kept.
+
+    Attributes:
+    - glyphs (dict): The rendered surface of every character of ATLAS_CHARACTERS, rendered on the first number.
+    - hits (int): Labels answered from the cache.
+    - misses (int): Labels that had to be rendered.
+    """
+
+    def __init__(self, font, color=WHITE, max_entries=LABEL_CACHE_SIZE):
+        self.font = font
+        self.color = color
+        self.max_entries = max_entries
+        self.labels = OrderedDict()
+        self.glyphs = None
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text):
+        """
+        Returns the antialiased surface of a text, rendered once while it stays in the cache.
+
+        Parameters:
+        - text (str): The text to render.
+
+        Returns:
+        - pygame.Surface: The rendered text, shared, so it must not be drawn on.
+        """
+        label = self.labels.get(text)
+        if label is not None:
+            self.labels.move_to_end(text)
+            self.hits += 1
+            return label
+        self.misses += 1
+        label = self.labels[text] = self.font.render(text, True, self.color)
+        if len(self.labels) > self.max_entries:
+            self.labels.popitem(last=False)
+        return label
+
+    def draw_number(self, screen, value, position):
+        """
+        Draws an integer by blitting the glyphs of its digits from the atlas.
+
+        Parameters:
+        - screen (pygame.Surface): The surface to draw on.
+        - value (int): The number to draw.
+        - position (tuple): The top left corner of the number.
+
+        Returns:
+        - pygame.Rect: The area the number was drawn on.
+        """
+        if self.glyphs is None:
+            self.glyphs = {character: self.font.render(character, True, self.color)
+                           for character in ATLAS_CHARACTERS}
+        x, y = position
+        area = pygame.Rect(x, y, 0, 0)
+        for character in str(value):
+            glyph = self.glyphs[character]
+            area.union_ip(screen.blit(glyph, (x, y)))
+            x += glyph.get_width()
+        return area
+
+    def stats(self):
+        """
+        Returns the size and hit rate of the label cache.
+
+        Returns:
+        - dict: The number of labels, the hits, the misses and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'labels': len(self.labels),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
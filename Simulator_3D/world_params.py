@@ -1,5 +1,27 @@
+import math
+
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 800
+FRAME_RATE = 60  # Frames the viewer draws per second, the simulation ticks at its own tick rate whatever the frame rate
+
+# Field of view of the pseudo 3D view
+FOV_RAYS = 120
+FOV_START = -math.pi / 6
+FOV_STEP = math.pi / 180
+VIEW_DEPTH = 199
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+GRAY = (128, 128, 128)
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+GREEN = (0, 255, 0)
+BROWN = (101, 67, 33)
+D_BROWN = (76, 50, 25)
+D_GRAY = (96, 96, 96)
+D_YELLOW = (204, 204, 0)
+# Wall colors of the layers as (light, dark), the layers of taller buildings take them in turn
+LAYER_COLORS = [(BROWN, D_BROWN), (GRAY, D_GRAY)]
 
 DRONE_PICTURE = 'Images/drone_pic.png'
 WARNING_PICTURE = 'Images/warning.png'
@@ -50,6 +72,7 @@ APARTMENT2_WALLS = [
     [1, 1, 1, 1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1],
     [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1],
     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
 ]
 
 